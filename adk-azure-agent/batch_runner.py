@@ -0,0 +1,161 @@
+#!/usr/bin/env python3
+"""
+批次報告產生器 - 不經過 adk web，以 ADK Runner 同時為多個 ticker 產生報告
+
+用途：夜間為 50–200 檔觀察清單產生報告，每檔使用獨立的 Session，失敗自動重試，
+結束後輸出吞吐量與延遲摘要。
+
+使用方式：
+    python batch_runner.py watchlist.txt --concurrency 4 --retries 2 \
+        --output-dir batch_output --summary batch_summary.json
+
+ticker 檔每行一個代碼，# 開頭為註解。
+--agent 可指定其他 Agent (格式 module:attr，例如 my_agent.agent:root_agent)。
+"""
+import argparse
+import asyncio
+import json
+import statistics
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv(Path(__file__).parent / "my_agent" / ".env")
+
+from my_agent.headless import run_agent_query, load_agent
+from my_agent.llm_ledger import get_llm_ledger
+from my_agent.llm_scheduler import get_llm_scheduler, priority_scope
+
+
+def load_tickers(path: str) -> list:
+    tickers = []
+    for line in Path(path).read_text(encoding="utf-8").splitlines():
+        line = line.split("#", 1)[0].strip()
+        if line and line not in tickers:
+            tickers.append(line)
+    return tickers
+
+
+async def run_ticker(agent, ticker: str, args, semaphore: asyncio.Semaphore) -> dict:
+    """執行單一 ticker (含重試)，回傳執行記錄"""
+    query = args.query_template.format(ticker=ticker)
+    record = {"ticker": ticker, "success": False, "attempts": 0, "latency_ms": None, "error": None}
+
+    for attempt in range(1, args.retries + 2):
+        record["attempts"] = attempt
+        try:
+            # 每次嘗試各自取得併發名額，退避等待期間不佔用名額
+            async with semaphore:
+                with priority_scope("batch"):
+                    result = await asyncio.wait_for(
+                        run_agent_query(agent, query, ticker=ticker, user_id="batch"),
+                        timeout=args.timeout,
+                    )
+            if not result.text.strip():
+                raise RuntimeError("Agent returned empty response")
+
+            record.update({
+                "success": True,
+                "latency_ms": round(result.duration_ms, 1),
+                "session_id": result.session_id,
+                "run_id": result.run_id,
+                "events": result.events,
+                "tool_calls": len(result.tool_calls),
+                "error": None,
+            })
+            if args.output_dir:
+                out = Path(args.output_dir) / f"{ticker}.md"
+                out.write_text(result.text, encoding="utf-8")
+                record["output"] = str(out)
+            print(f"✅ {ticker} done in {result.duration_ms / 1000:.1f}s (attempt {attempt})")
+            return record
+
+        except Exception as e:
+            error = "timeout" if isinstance(e, asyncio.TimeoutError) else str(e)
+            record["error"] = error
+            print(f"❌ {ticker} attempt {attempt} failed: {error}")
+            if attempt <= args.retries:
+                await asyncio.sleep(args.retry_backoff * 2 ** (attempt - 1))
+
+    return record
+
+
+def summarize(records: list, wall_seconds: float) -> dict:
+    ok = [r for r in records if r["success"]]
+    latencies = sorted(r["latency_ms"] for r in ok)
+    return {
+        "finished_at": datetime.now().isoformat(),
+        "tickers": len(records),
+        "succeeded": len(ok),
+        "failed": len(records) - len(ok),
+        "retried": sum(1 for r in records if r["attempts"] > 1),
+        "wall_seconds": round(wall_seconds, 1),
+        "throughput_per_hour": round(len(ok) / wall_seconds * 3600, 1) if wall_seconds else 0.0,
+        "latency_p50_s": round(statistics.median(latencies) / 1000, 1) if latencies else None,
+        "latency_p95_s": round(latencies[int(0.95 * (len(latencies) - 1))] / 1000, 1) if latencies else None,
+        "latency_max_s": round(latencies[-1] / 1000, 1) if latencies else None,
+        "llm_cost_usd": round(get_llm_ledger().total_cost_usd, 4),
+        "llm_scheduler": get_llm_scheduler().stats(),
+        "runs": records,
+    }
+
+
+def print_summary(summary: dict):
+    print("\n" + "=" * 60)
+    print(f"📊 批次執行摘要 ({summary['tickers']} 檔)")
+    print("=" * 60)
+    print(f"  - 成功 / 失敗：{summary['succeeded']} / {summary['failed']} (重試過：{summary['retried']})")
+    print(f"  - 總耗時：{summary['wall_seconds']}s，吞吐量：{summary['throughput_per_hour']} 檔/小時")
+    print(f"  - 延遲 p50 / p95 / max：{summary['latency_p50_s']} / {summary['latency_p95_s']} / {summary['latency_max_s']} s")
+    print(f"  - LLM 成本 (直接呼叫部分)：${summary['llm_cost_usd']}")
+    failed = [r["ticker"] for r in summary["runs"] if not r["success"]]
+    if failed:
+        print(f"  - 失敗清單：{', '.join(failed)}")
+    print("=" * 60)
+
+
+async def run_batch(args) -> dict:
+    tickers = load_tickers(args.tickers)
+    agent = load_agent(args.agent)
+    if args.output_dir:
+        Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+
+    print(f"🚀 Running {len(tickers)} tickers with concurrency={args.concurrency} (agent: {args.agent})")
+    semaphore = asyncio.Semaphore(args.concurrency)
+    start = time.perf_counter()
+    records = await asyncio.gather(*[run_ticker(agent, t, args, semaphore) for t in tickers])
+    return summarize(list(records), time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="批次產生股票分析報告")
+    parser.add_argument("tickers", help="ticker 清單檔 (每行一個)")
+    parser.add_argument("--agent", default="my_agent.agent:root_agent", help="Agent 位置 (module:attr)")
+    parser.add_argument("--query-template", default="請分析 {ticker}", help="送給 Agent 的輸入樣板")
+    parser.add_argument("--concurrency", type=int, default=4, help="同時執行的 Session 數")
+    parser.add_argument("--retries", type=int, default=2, help="失敗重試次數")
+    parser.add_argument("--retry-backoff", type=float, default=10.0, help="重試間隔基數 (秒，指數成長)")
+    parser.add_argument("--timeout", type=float, default=1800.0, help="單一 ticker 的逾時 (秒)")
+    parser.add_argument("--output-dir", default="batch_output", help="報告輸出目錄 (空字串表示不輸出)")
+    parser.add_argument("--summary", default="batch_summary.json", help="摘要 JSON 輸出路徑")
+    args = parser.parse_args()
+
+    if not Path(args.tickers).exists():
+        print(f"❌ 找不到 ticker 清單：{args.tickers}")
+        sys.exit(1)
+
+    summary = asyncio.run(run_batch(args))
+    print_summary(summary)
+
+    with open(args.summary, "w", encoding="utf-8") as f:
+        json.dump(summary, f, ensure_ascii=False, indent=2)
+    print(f"📝 摘要已寫入：{args.summary}")
+
+    sys.exit(0 if summary["failed"] == 0 else 2)
+
+
+if __name__ == "__main__":
+    main()
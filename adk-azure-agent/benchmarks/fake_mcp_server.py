@@ -0,0 +1,96 @@
+#!/usr/bin/env python3
+"""
+假的 MCP Server (stdio) - 壓測時取代 yfmcp / web-search / fetch-webpage
+
+工具名稱與真實 Server 相同 (加上 agent.py 的 prefix 後為 yf_get_ticker_info、web_search、url_fetch …)，
+回覆內容為固定格式的合成資料，可用 --latency-ms 模擬外部 API 延遲。
+
+使用方式 (通常由 load_test.py 產生的 mcp_config 啟動)：
+    python benchmarks/fake_mcp_server.py --kind yfinance --latency-ms 200
+"""
+import argparse
+import asyncio
+import json
+import random
+
+from mcp.server.fastmcp import FastMCP
+
+
+def _ticker_info(symbol: str) -> dict:
+    rng = random.Random(symbol)
+    price = round(rng.uniform(50, 1500), 2)
+    return {
+        "symbol": symbol,
+        "longName": f"{symbol} Corporation",
+        "currentPrice": price,
+        "targetMeanPrice": round(price * rng.uniform(0.9, 1.4), 2),
+        "trailingPE": round(rng.uniform(8, 40), 2),
+        "marketCap": rng.randint(10**9, 10**13),
+        "grossMargins": round(rng.uniform(0.2, 0.6), 4),
+        "revenueGrowth": round(rng.uniform(-0.1, 0.4), 4),
+        "recommendationKey": rng.choice(["buy", "hold", "strong_buy"]),
+        "longBusinessSummary": f"{symbol} is a synthetic company used for load testing. " * 10,
+    }
+
+
+def build_server(kind: str, latency_ms: float) -> FastMCP:
+    server = FastMCP(f"fake-{kind}")
+
+    async def _delay():
+        if latency_ms:
+            await asyncio.sleep(latency_ms / 1000)
+
+    if kind == "yfinance":
+        @server.tool()
+        async def get_ticker_info(symbol: str) -> str:
+            """Get ticker info (synthetic)"""
+            await _delay()
+            return json.dumps(_ticker_info(symbol))
+
+        @server.tool()
+        async def get_ticker_news(symbol: str) -> str:
+            """Get ticker news (synthetic)"""
+            await _delay()
+            return json.dumps([
+                {"title": f"{symbol} headline {i}", "publisher": "Synthetic News",
+                 "link": f"https://news.example.com/{symbol}/{i}"}
+                for i in range(10)
+            ])
+
+        @server.tool()
+        async def search(query: str) -> str:
+            """Search tickers (synthetic)"""
+            await _delay()
+            return json.dumps({"quotes": [{"symbol": query.upper(), "shortname": f"{query} Corp."}]})
+
+    elif kind == "web-search":
+        @server.tool()
+        async def search(query: str, limit: int = 5) -> str:
+            """Web search (synthetic)"""
+            await _delay()
+            return json.dumps([
+                {"title": f"{query} result {i}", "url": f"https://example.com/{i}",
+                 "description": f"Synthetic search result {i} for {query}."}
+                for i in range(limit)
+            ])
+
+    else:
+        @server.tool()
+        async def fetch(url: str) -> str:
+            """Fetch webpage (synthetic)"""
+            await _delay()
+            return f"# {url}\n\n" + "Synthetic page content. " * 200
+
+    return server
+
+
+def main():
+    parser = argparse.ArgumentParser(description="壓測用假 MCP Server")
+    parser.add_argument("--kind", choices=["yfinance", "web-search", "fetch-webpage"], default="yfinance")
+    parser.add_argument("--latency-ms", type=float, default=0.0, help="每次工具呼叫的模擬延遲")
+    args = parser.parse_args()
+    build_server(args.kind, args.latency_ms).run(transport="stdio")
+
+
+if __name__ == "__main__":
+    main()
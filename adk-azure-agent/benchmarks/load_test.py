@@ -0,0 +1,242 @@
+#!/usr/bin/env python3
+"""
+多 Session 壓力測試 - 量測單一 root_agent 行程能同時服務多少使用者
+
+每個虛擬使用者以獨立的 ADK Session 對 stock_agent 執行完整流程
+(discovery_agent → analysis_agent → read_agent_response_file)，
+模型改用 Fake LLM、MCP Server 改用 benchmarks/fake_mcp_server.py，因此量測到的是本身的 Python 開銷：
+Event Loop 阻塞、log 寫入競爭、MCP stdio 子行程序列化等。
+
+每個併發等級回報：
+- 回合延遲 p50 / p95 / p99 與成功率
+- Event Loop 延遲 (排程的 sleep 實際晚了多久)
+- 開啟的檔案描述子數量與 RSS 峰值
+
+使用方式：
+    python benchmarks/load_test.py --levels 1,2,4,8,16 --sessions 2
+    python benchmarks/load_test.py --levels 8 --llm-latency-ms 300 --mcp-latency-ms 150 --output load.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import resource
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+
+def write_fake_mcp_config(mcp_latency_ms: float) -> Path:
+    """產生指向假 MCP Server 的 mcp_config (server 名稱與正式設定相同，tool prefix 不變)"""
+    server = str(Path(__file__).resolve().parent / "fake_mcp_server.py")
+    config = {
+        "mcpServers": {
+            kind: {"command": sys.executable, "args": [server, "--kind", kind, "--latency-ms", str(mcp_latency_ms)]}
+            for kind in ("yfinance", "web-search", "fetch-webpage")
+        }
+    }
+    fd, path = tempfile.mkstemp(prefix="fake_mcp_config_", suffix=".json")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(config, f)
+    return Path(path)
+
+
+def percentile(samples: list, pct: float) -> float:
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(int(round(pct / 100 * (len(ordered) - 1))), len(ordered) - 1)]
+
+
+# ============================================================================
+# 資源監控
+# ============================================================================
+
+def open_fd_count() -> int:
+    """目前行程開啟的檔案描述子數量 (非 Linux 回傳 -1)"""
+    try:
+        return len(os.listdir("/proc/self/fd"))
+    except OSError:
+        return -1
+
+
+def rss_mb() -> float:
+    """目前 RSS (MB)；無 /proc 時以 ru_maxrss 近似"""
+    try:
+        with open("/proc/self/status", encoding="utf-8") as f:
+            for line in f:
+                if line.startswith("VmRSS:"):
+                    return int(line.split()[1]) / 1024
+    except OSError:
+        pass
+    maxrss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return maxrss / (1024 * 1024) if sys.platform == "darwin" else maxrss / 1024
+
+
+class LoopMonitor:
+    """每 interval 秒醒來一次，記錄實際醒來時間比預期晚多少 (Event Loop 延遲) 並取樣資源用量"""
+
+    def __init__(self, interval: float = 0.05):
+        self.interval = interval
+        self.lags_ms = []
+        self.max_fds = 0
+        self.max_rss_mb = 0.0
+        self._task = None
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            self.lags_ms.append(max(loop.time() - expected, 0.0) * 1000)
+            self.max_fds = max(self.max_fds, open_fd_count())
+            self.max_rss_mb = max(self.max_rss_mb, rss_mb())
+
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+    def summary(self) -> dict:
+        return {
+            "loop_lag_p50_ms": round(percentile(self.lags_ms, 50), 2),
+            "loop_lag_p99_ms": round(percentile(self.lags_ms, 99), 2),
+            "loop_lag_max_ms": round(max(self.lags_ms, default=0.0), 2),
+            "max_open_fds": self.max_fds,
+            "max_rss_mb": round(self.max_rss_mb, 1),
+        }
+
+
+# ============================================================================
+# 壓測
+# ============================================================================
+
+async def run_level(agent, concurrency: int, sessions_per_user: int, ticker_base: int) -> dict:
+    """以 concurrency 個虛擬使用者各執行 sessions_per_user 個 Session"""
+    from my_agent.headless import run_agent_query
+
+    latencies, failures, session_files = [], [], []
+    monitor = LoopMonitor()
+    monitor.start()
+
+    async def user(index: int):
+        for n in range(sessions_per_user):
+            ticker = f"{ticker_base + index}.TW"
+            start = time.perf_counter()
+            try:
+                result = await run_agent_query(agent, f"請分析 {ticker}", ticker=ticker, user_id=f"load-{index}")
+                session_files.append(PROJECT_ROOT / "my_agent" / f"agent_response_{result.session_id}_{ticker}.md")
+                if "read_agent_response_file" not in result.tool_calls or not result.text.strip():
+                    raise RuntimeError(f"incomplete flow: {result.tool_calls}")
+                latencies.append((time.perf_counter() - start) * 1000)
+            except Exception as e:
+                failures.append(f"{ticker}#{n}: {e}")
+
+    wall_start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        await asyncio.gather(*(user(i) for i in range(concurrency)))
+    wall = time.perf_counter() - wall_start
+    await monitor.stop()
+
+    # 清除本次壓測產生的報告檔
+    for path in session_files:
+        path.unlink(missing_ok=True)
+
+    total = concurrency * sessions_per_user
+    report = {
+        "concurrency": concurrency,
+        "sessions": total,
+        "succeeded": len(latencies),
+        "failed": len(failures),
+        "throughput_per_min": round(len(latencies) / wall * 60, 2) if wall else 0.0,
+        "latency_p50_ms": round(percentile(latencies, 50), 1),
+        "latency_p95_ms": round(percentile(latencies, 95), 1),
+        "latency_p99_ms": round(percentile(latencies, 99), 1),
+        "latency_mean_ms": round(statistics.mean(latencies), 1) if latencies else 0.0,
+        **monitor.summary(),
+        "errors": failures[:5],
+    }
+    return report
+
+
+async def main_async(args) -> dict:
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["FAKE_LLM_LATENCY_MS"] = str(args.llm_latency_ms)
+    os.environ["FAKE_LLM_JITTER_MS"] = str(args.llm_jitter_ms)
+    config_path = write_fake_mcp_config(args.mcp_latency_ms)
+    os.environ["MCP_CONFIG_PATH"] = str(config_path)
+
+    log_root = PROJECT_ROOT / "my_agent" / "mcp_logs"
+    existing_dirs = set(log_root.iterdir()) if log_root.exists() else set()
+
+    print(f"🧪 Load test: levels={args.levels}, sessions/user={args.sessions}, "
+          f"LLM latency={args.llm_latency_ms}ms, MCP latency={args.mcp_latency_ms}ms")
+    with contextlib.redirect_stdout(io.StringIO()):
+        from my_agent.agent import root_agent
+
+    baseline = {"open_fds": open_fd_count(), "rss_mb": round(rss_mb(), 1)}
+    levels = []
+    try:
+        for i, concurrency in enumerate(int(x) for x in args.levels.split(",") if x):
+            # 每個等級使用不同的 ticker 區段，避免同名 log 目錄互相影響
+            report = await run_level(root_agent, concurrency, args.sessions, ticker_base=9000 + i * 100)
+            levels.append(report)
+            print(
+                f"  c={concurrency:<3} ok={report['succeeded']}/{report['sessions']} "
+                f"p50={report['latency_p50_ms']:.0f}ms p95={report['latency_p95_ms']:.0f}ms "
+                f"p99={report['latency_p99_ms']:.0f}ms lag_p99={report['loop_lag_p99_ms']:.1f}ms "
+                f"fds={report['max_open_fds']} rss={report['max_rss_mb']:.0f}MB"
+            )
+            for error in report["errors"]:
+                print(f"     ❌ {error}")
+    finally:
+        config_path.unlink(missing_ok=True)
+        if not args.keep_logs and log_root.exists():
+            # 只刪除壓測新建的 ticker 目錄，不動既有的 log
+            for path in set(log_root.iterdir()) - existing_dirs:
+                if path.is_dir():
+                    shutil.rmtree(path, ignore_errors=True)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now().isoformat(),
+            "python": sys.version.split()[0],
+            "llm_latency_ms": args.llm_latency_ms,
+            "mcp_latency_ms": args.mcp_latency_ms,
+            "baseline": baseline,
+        },
+        "levels": levels,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description="root_agent 多 Session 壓力測試 (Fake LLM + 假 MCP Server)")
+    parser.add_argument("--levels", default="1,2,4,8,16", help="併發使用者數 (逗號分隔，依序執行)")
+    parser.add_argument("--sessions", type=int, default=2, help="每位使用者連續執行的 Session 數")
+    parser.add_argument("--llm-latency-ms", type=float, default=200.0, help="Fake LLM 每次回覆延遲")
+    parser.add_argument("--llm-jitter-ms", type=float, default=50.0, help="Fake LLM 隨機延遲上限")
+    parser.add_argument("--mcp-latency-ms", type=float, default=100.0, help="假 MCP Server 每次呼叫延遲")
+    parser.add_argument("--keep-logs", action="store_true", help="保留壓測產生的 mcp_logs")
+    parser.add_argument("--output", help="結果 JSON 路徑")
+    args = parser.parse_args()
+
+    report = asyncio.run(main_async(args))
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"📝 Results written to: {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,416 @@
+#!/usr/bin/env python3
+"""
+效能基準測試 - 以合成的 MCP log 與 Fake LLM 量測 Agent 堆疊各環節的成本
+
+量測項目：
+1. McpCallLogger.log_call 寫入吞吐量
+2. read_latest_mcp_response / extract_data_for_prompt / verify_prompt_data 在 mcp_logs 由 10 成長到 100k 檔時的延遲
+3. Stage Agent 建立成本 (other_agent.create_stage_agent)
+4. 完整流程耗時 (Fake LLM + benchmarks/fake_mcp_server.py，不連線 Azure / Yahoo Finance / 網路搜尋)
+
+所有資料寫入暫存目錄，不會影響 my_agent/mcp_logs。
+
+使用方式：
+    python benchmarks/run_benchmarks.py run --output bench_new.json
+    python benchmarks/run_benchmarks.py run --sizes 10,100,1000,10000,100000 --output bench_full.json
+    python benchmarks/run_benchmarks.py compare bench_base.json bench_new.json --threshold 0.2
+    python benchmarks/run_benchmarks.py run --output bench_new.json --baseline bench_base.json
+"""
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+
+PROJECT_ROOT = Path(__file__).resolve().parent.parent
+sys.path.insert(0, str(PROJECT_ROOT))
+
+TARGET_TICKER = "2330.TW"
+
+
+# ============================================================================
+# 合成資料
+# ============================================================================
+
+def synthetic_ticker_info(ticker: str, rng: random.Random) -> dict:
+    """模擬 yf_get_ticker_info 的回覆 (約 150 個欄位)"""
+    info = {
+        "symbol": ticker,
+        "longName": f"{ticker} Corporation",
+        "currentPrice": round(rng.uniform(50, 1500), 2),
+        "targetMeanPrice": round(rng.uniform(50, 1800), 2),
+        "trailingPE": round(rng.uniform(5, 60), 2),
+        "marketCap": rng.randint(10**9, 10**13),
+        "grossMargins": round(rng.uniform(0.1, 0.7), 4),
+        "revenueGrowth": round(rng.uniform(-0.2, 0.5), 4),
+        "recommendationKey": rng.choice(["buy", "hold", "strong_buy"]),
+        "longBusinessSummary": "Synthetic business summary. " * 40,
+    }
+    for i in range(140):
+        info[f"metric_{i}"] = round(rng.uniform(-1000, 1000), 3)
+    return info
+
+
+def synthetic_news(ticker: str, rng: random.Random, n: int = 10) -> list:
+    return [
+        {
+            "title": f"{ticker} headline {rng.randint(0, 10**6)}",
+            "publisher": rng.choice(["Reuters", "Bloomberg", "CNA"]),
+            "link": f"https://news.example.com/{ticker}/{rng.randint(0, 10**9)}?utm_source=yahoo",
+            "summary": "Synthetic news body. " * 20,
+        }
+        for _ in range(n)
+    ]
+
+
+def synthetic_log_entry(tool_name: str, ticker: str, rng: random.Random) -> dict:
+    if tool_name == "yf_get_ticker_info":
+        response = {"structuredContent": {"result": json.dumps(synthetic_ticker_info(ticker, rng))}, "isError": False}
+    elif tool_name == "yf_get_ticker_news":
+        response = {"content": [{"type": "text", "text": json.dumps(synthetic_news(ticker, rng))}], "isError": False}
+    else:
+        response = {"content": [{"type": "text", "text": f"Search results for {ticker}: " + "lorem ipsum " * 200}]}
+    return {
+        "timestamp": datetime.now().isoformat(),
+        "tool_name": tool_name,
+        "ticker": ticker,
+        "arguments": {"symbol": ticker, "ticker": ticker},
+        "response": response,
+        "success": True,
+        "error": None,
+        "duration_ms": round(rng.uniform(50, 2000), 1),
+    }
+
+
+def populate_logs(log_dir: Path, total_files: int, seed: int = 42) -> None:
+    """
+    產生 total_files 個 log 檔
+
+    目標 ticker 佔 10% (至少 10 檔)、root (舊結構 / unknown) 佔 10%，其餘分散在其他 ticker。
+    一半的檔案時間戳在最近 60 分鐘內 (會被 get_recent_logs 選入)。
+    """
+    rng = random.Random(seed)
+    tools = ["yf_get_ticker_info", "yf_get_ticker_news", "web_search"]
+    now = datetime.now()
+    target_count = max(total_files // 10, min(total_files, 10))
+    root_count = total_files // 10
+    other_tickers = [f"{1000 + i}.TW" for i in range(max((total_files - target_count - root_count) // 50, 1))]
+
+    # 同一份 payload 重複使用以加快產生速度 (解析成本與內容是否相同無關)
+    payloads = {(tool, t): json.dumps(synthetic_log_entry(tool, t, rng), ensure_ascii=False) + "\n"
+                for tool in tools for t in [TARGET_TICKER] + other_tickers[:5]}
+
+    for i in range(total_files):
+        tool = tools[i % len(tools)]
+        minutes_ago = rng.uniform(0, 55) if i % 2 == 0 else rng.uniform(120, 60 * 24 * 30)
+        stamp = (now - timedelta(minutes=minutes_ago)).strftime("%Y%m%d_%H%M%S")
+
+        # 檔名需以 YYYYMMDD_HHMMSS 結尾才會被 get_recent_logs 解析，序號放在時間之前
+        if i < target_count:
+            ticker, target_dir, name = TARGET_TICKER, log_dir / TARGET_TICKER, f"{tool}_{i}_{stamp}"
+        elif i < target_count + root_count:
+            # 舊結構：root 下的 mcp_{ticker}_... (一半屬於目標 ticker)
+            ticker = TARGET_TICKER if i % 4 == 0 else "unknown"
+            target_dir, name = log_dir, f"mcp_{ticker}_{tool}_{i}_{stamp}"
+        else:
+            ticker = other_tickers[i % len(other_tickers)]
+            target_dir, name = log_dir / ticker, f"{tool}_{i}_{stamp}"
+
+        target_dir.mkdir(parents=True, exist_ok=True)
+        payload = payloads.get((tool, ticker)) or payloads[(tool, TARGET_TICKER)]
+        (target_dir / f"{name}.jsonl").write_text(payload, encoding="utf-8")
+
+
+# ============================================================================
+# 量測工具
+# ============================================================================
+
+def measure(fn, repeat: int) -> dict:
+    """執行 fn repeat 次，回傳 median / min / p95 (毫秒)"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize_samples(samples)
+
+
+async def measure_async(coro_fn, repeat: int) -> dict:
+    """在同一個 Event Loop 中執行 coro_fn() repeat 次 (MCP Session 等跨呼叫的快取只建立一次)"""
+    samples = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        with contextlib.redirect_stdout(io.StringIO()):
+            await coro_fn()
+        samples.append((time.perf_counter() - start) * 1000)
+    return summarize_samples(samples)
+
+
+def summarize_samples(samples: list) -> dict:
+    samples = sorted(samples)
+    return {
+        "median_ms": round(statistics.median(samples), 3),
+        "min_ms": round(samples[0], 3),
+        "p95_ms": round(samples[int(0.95 * (len(samples) - 1))], 3),
+    }
+
+
+def metric(value: float, unit: str, lower_is_better: bool = True) -> dict:
+    return {"value": value, "unit": unit, "lower_is_better": lower_is_better}
+
+
+# ============================================================================
+# Benchmarks
+# ============================================================================
+
+def bench_logger_throughput(tmp: Path, calls: int) -> dict:
+    from my_agent.mcp_toolset_wrapper import McpCallLogger
+
+    rng = random.Random(0)
+    with contextlib.redirect_stdout(io.StringIO()):
+        logger = McpCallLogger(log_dir=tmp / "logger_bench")
+    entry = synthetic_log_entry("yf_get_ticker_info", TARGET_TICKER, rng)
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        for _ in range(calls):
+            logger.log_call(
+                tool_name="yf_get_ticker_info", arguments={"symbol": TARGET_TICKER},
+                response=entry["response"], success=True, duration_ms=100.0,
+            )
+    elapsed = time.perf_counter() - start
+    return {
+        "mcp_logger.calls_per_sec": metric(round(calls / elapsed, 1), "calls/s", lower_is_better=False),
+        "mcp_logger.per_call_ms": metric(round(elapsed / calls * 1000, 4), "ms"),
+    }
+
+
+def bench_log_readers(tmp: Path, sizes: list, repeat: int) -> dict:
+    from my_agent import mcp_log_reader
+    from my_agent.tools import prompt_verifier
+
+    results = {}
+    prompt = "台積電目前股價 1,025 元，本益比 22.5，毛利率 53.1%，目標價 1,200 元，上漲空間 17.07%。"
+    original_dirs = (mcp_log_reader.LOG_DIR, prompt_verifier.LOG_DIR)
+    try:
+        for size in sizes:
+            log_dir = tmp / f"mcp_logs_{size}"
+            print(f"  - Generating {size:,} log files...")
+            populate_logs(log_dir, size)
+            mcp_log_reader.LOG_DIR = log_dir
+            prompt_verifier.LOG_DIR = log_dir
+
+            for name, fn in [
+                ("read_latest_mcp_response", lambda: mcp_log_reader.read_latest_mcp_response(TARGET_TICKER)),
+                ("extract_data_for_prompt", lambda: prompt_verifier.extract_data_for_prompt(TARGET_TICKER)),
+                ("verify_prompt_data", lambda: prompt_verifier.verify_prompt_data(TARGET_TICKER, prompt)),
+            ]:
+                stats = measure(fn, repeat)
+                results[f"{name}.files_{size}.median_ms"] = metric(stats["median_ms"], "ms")
+                results[f"{name}.files_{size}.p95_ms"] = metric(stats["p95_ms"], "ms")
+                print(f"    {name}: median {stats['median_ms']:.1f} ms")
+
+            shutil.rmtree(log_dir, ignore_errors=True)
+    finally:
+        mcp_log_reader.LOG_DIR, prompt_verifier.LOG_DIR = original_dirs
+    return results
+
+
+def _load_other_agent():
+    """other_agent.py 以相對匯入撰寫，屬於 my_agent 套件；以 my_agent.other_agent 的名稱載入"""
+    import importlib.util
+    spec = importlib.util.spec_from_file_location("my_agent.other_agent", PROJECT_ROOT / "other_agent.py")
+    module = importlib.util.module_from_spec(spec)
+    sys.modules["my_agent.other_agent"] = module
+    spec.loader.exec_module(module)
+    return module
+
+
+def bench_stage_agent_construction(repeat: int) -> dict:
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            other_agent = _load_other_agent()
+    except Exception as e:
+        print(f"  ⚠️ Skipped (cannot load other_agent: {e})")
+        return {}
+
+    def build():
+        other_agent.create_stage_agent(
+            stage_name="bench_stage",
+            instruction_files=["01_core_principles.md", "07_quality_checklist_v3_4_0.md"],
+            include_base_instructions=True,
+        )
+
+    stats = measure(build, repeat)
+    print(f"    create_stage_agent: median {stats['median_ms']:.1f} ms")
+    return {"create_stage_agent.median_ms": metric(stats["median_ms"], "ms")}
+
+
+def bench_pipeline(tmp: Path, repeat: int) -> dict:
+    """
+    以 Fake LLM 執行完整的 Orchestrator 流程
+
+    MCP Server 改用 fake_mcp_server.py (無延遲)，MCP log 與代碼索引寫入暫存目錄，
+    量測結果只反映本身的 Python 開銷，可作為退步門檻。
+    """
+    from load_test import write_fake_mcp_config  # 同目錄的壓測工具
+
+    os.environ["LLM_BACKEND"] = "fake"
+    os.environ["SYMBOL_INDEX_PATH"] = str(tmp / "symbol_index.json")
+    config_path = write_fake_mcp_config(mcp_latency_ms=0)
+    os.environ["MCP_CONFIG_PATH"] = str(config_path)
+    results = {}
+    try:
+        with contextlib.redirect_stdout(io.StringIO()):
+            from my_agent import mcp_log_reader
+            from my_agent.mcp_toolset_wrapper import _mcp_logger
+            from my_agent.tools import prompt_verifier
+            from my_agent.headless import run_agent_query
+            from my_agent.agent import root_agent
+    except Exception as e:
+        print(f"  ⚠️ Skipped (cannot load agent: {e})")
+        config_path.unlink(missing_ok=True)
+        return results
+
+    log_dir = tmp / "pipeline_logs"
+    log_dir.mkdir(parents=True, exist_ok=True)
+    original_dirs = (_mcp_logger.log_dir, mcp_log_reader.LOG_DIR, prompt_verifier.LOG_DIR)
+    _mcp_logger.log_dir = mcp_log_reader.LOG_DIR = prompt_verifier.LOG_DIR = log_dir
+
+    async def run_once():
+        return await run_agent_query(root_agent, f"請分析 {TARGET_TICKER}", ticker=TARGET_TICKER)
+
+    async def run_repeats():
+        with contextlib.redirect_stdout(io.StringIO()):
+            await run_once()  # 暖機：啟動 MCP 子行程並載入工具
+        return await measure_async(run_once, repeat)
+
+    try:
+        stats = asyncio.run(run_repeats())
+    finally:
+        _mcp_logger.log_dir, mcp_log_reader.LOG_DIR, prompt_verifier.LOG_DIR = original_dirs
+        config_path.unlink(missing_ok=True)
+
+    results["orchestrator_fake_llm.median_ms"] = metric(stats["median_ms"], "ms")
+    print(f"    orchestrator (fake LLM): median {stats['median_ms']:.1f} ms")
+    return results
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--short", "HEAD"], cwd=PROJECT_ROOT, text=True, stderr=subprocess.DEVNULL
+        ).strip()
+    except Exception:
+        return "unknown"
+
+
+def run_all(args) -> dict:
+    sizes = [int(s) for s in args.sizes.split(",") if s]
+    tmp = Path(tempfile.mkdtemp(prefix="agent_bench_"))
+    results = {}
+    try:
+        print("📏 McpCallLogger throughput")
+        results.update(bench_logger_throughput(tmp, args.logger_calls))
+        print("📏 Log readers vs. mcp_logs size")
+        results.update(bench_log_readers(tmp, sizes, args.repeat))
+        print("📏 Stage agent construction")
+        results.update(bench_stage_agent_construction(args.repeat))
+        if not args.skip_pipeline:
+            print("📏 Full pipeline (fake LLM)")
+            results.update(bench_pipeline(tmp, max(args.repeat // 2, 1)))
+    finally:
+        shutil.rmtree(tmp, ignore_errors=True)
+
+    return {
+        "meta": {
+            "commit": _git_commit(),
+            "timestamp": datetime.now().isoformat(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "sizes": sizes,
+            "repeat": args.repeat,
+        },
+        "results": results,
+    }
+
+
+# ============================================================================
+# 比較模式
+# ============================================================================
+
+def compare(base: dict, new: dict, threshold: float) -> list:
+    """比較兩次結果，回傳超過 threshold 的退步項目"""
+    regressions = []
+    print(f"\n{'metric':<55} {'base':>12} {'new':>12} {'change':>9}")
+    print("-" * 92)
+    for name, new_metric in sorted(new["results"].items()):
+        base_metric = base["results"].get(name)
+        if not base_metric or not base_metric["value"]:
+            continue
+        change = (new_metric["value"] - base_metric["value"]) / base_metric["value"]
+        worse = change > threshold if new_metric["lower_is_better"] else change < -threshold
+        flag = " ❌" if worse else ""
+        print(f"{name:<55} {base_metric['value']:>12} {new_metric['value']:>12} {change:>+8.1%}{flag}")
+        if worse:
+            regressions.append({"metric": name, "base": base_metric["value"], "new": new_metric["value"], "change": round(change, 4)})
+
+    print(f"\nbase: {base['meta'].get('commit')}  new: {new['meta'].get('commit')}  threshold: ±{threshold:.0%}")
+    if regressions:
+        print(f"❌ {len(regressions)} regression(s) detected")
+    else:
+        print("✅ No regressions")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Agent 堆疊效能基準測試")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("run", help="執行基準測試")
+    p.add_argument("--sizes", default="10,100,1000,10000", help="mcp_logs 檔案數 (逗號分隔，完整測試加上 100000)")
+    p.add_argument("--repeat", type=int, default=5, help="每項量測重複次數")
+    p.add_argument("--logger-calls", type=int, default=2000, help="McpCallLogger 寫入次數")
+    p.add_argument("--skip-pipeline", action="store_true", help="略過完整流程量測")
+    p.add_argument("--output", default="benchmark_results.json", help="結果 JSON 路徑")
+    p.add_argument("--baseline", help="與此結果比較並標示退步")
+    p.add_argument("--threshold", type=float, default=0.2, help="退步門檻 (預設 20%%)")
+
+    p = sub.add_parser("compare", help="比較兩份結果")
+    p.add_argument("base")
+    p.add_argument("new")
+    p.add_argument("--threshold", type=float, default=0.2, help="退步門檻 (預設 20%%)")
+
+    args = parser.parse_args()
+
+    if args.command == "run":
+        report = run_all(args)
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"\n📝 Results written to: {args.output}")
+        if not args.baseline:
+            return
+        base = json.loads(Path(args.baseline).read_text(encoding="utf-8"))
+        regressions = compare(base, report, args.threshold)
+    else:
+        base = json.loads(Path(args.base).read_text(encoding="utf-8"))
+        new = json.loads(Path(args.new).read_text(encoding="utf-8"))
+        regressions = compare(base, new, args.threshold)
+
+    sys.exit(1 if regressions else 0)
+
+
+if __name__ == "__main__":
+    main()
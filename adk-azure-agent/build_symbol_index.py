@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+重建本地股票代碼索引 (my_agent/.adk/symbol_index.json) - 合併 symbol_seed.json、mcp_logs 中的
+yf_search / yf_get_ticker_info 回覆與額外別名檔
+
+Agent 執行時索引超過 SYMBOL_INDEX_MAX_AGE_HOURS 會自動在背景重建；此工具供排程 (cron) 或手動重建，
+並可用 --lookup 確認查詢結果。
+
+使用方式：
+    python build_symbol_index.py
+    python build_symbol_index.py --extra my_aliases.json
+    python build_symbol_index.py --lookup 台積電 --lookup nvida
+"""
+import argparse
+import os
+import time
+
+from my_agent.tools.symbol_index import get_symbol_index_manager
+
+
+def main():
+    parser = argparse.ArgumentParser(description="重建本地股票代碼 / 公司名稱索引")
+    parser.add_argument("--extra", help="額外別名 JSON 檔 (格式同 my_agent/tools/symbol_seed.json)")
+    parser.add_argument("--output", help="索引輸出路徑 (預設為 SYMBOL_INDEX_PATH 或 my_agent/.adk/symbol_index.json)")
+    parser.add_argument("--lookup", action="append", help="重建後查詢 (可重複)")
+    args = parser.parse_args()
+
+    if args.extra:
+        os.environ["SYMBOL_INDEX_EXTRA"] = args.extra
+    if args.output:
+        os.environ["SYMBOL_INDEX_PATH"] = args.output
+
+    manager = get_symbol_index_manager()
+    index = manager.rebuild()
+    print(f"📝 Symbol index written to: {manager.path}")
+
+    for query in args.lookup or []:
+        started = time.perf_counter()
+        result = index.resolve(query)
+        elapsed_us = (time.perf_counter() - started) * 1e6
+        print(f"\n🔍 {query} → {result['status']} ({elapsed_us:.0f} µs)")
+        for match in result["matches"]:
+            print(f"   {match['symbol']:<10} {match['match']:<6} {match['score']:.2f}  "
+                  f"{match['name'] or match['short_name']} ({match['exchange'] or 'N/A'})")
+
+
+if __name__ == "__main__":
+    main()
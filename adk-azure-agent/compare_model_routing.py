@@ -0,0 +1,204 @@
+#!/usr/bin/env python3
+"""
+模型路由 A/B 比對工具
+
+用途：以相同的驗證 (validator) Prompt 分別呼叫兩個部署，比較 PASS 率、判定一致率、延遲與 Token，
+確認輕量任務 (QA 判定、Stage 0 規劃) 改用較便宜的部署後品質沒有下降。
+
+使用方式：
+    python compare_model_routing.py <SAMPLE_FILE_OR_DIR>... \
+        --a azure/gpt-4o --b azure/gpt-4o-mini --repeat 3 --output ab_result.json
+
+樣本為 Markdown 檔 (例如從 latest_debug_prompt.txt 或過去報告中擷取的 Part A 內容)。
+"""
+import argparse
+import asyncio
+import json
+import re
+import statistics
+import sys
+import time
+from pathlib import Path
+
+import litellm
+from dotenv import load_dotenv
+
+INSTRUCTION_DIR = Path(__file__).parent / "my_agent" / "instructions"
+VALIDATOR_FILES = ["01_core_principles.md", "07_quality_checklist_v3_4_0.md"]
+VALIDATOR_DESCRIPTION = "你是嚴格的品質檢查員 (QA)。你的任務是根據檢查清單審查內容，並給出通過(PASS)或失敗(FAIL)的判定。"
+# 多數決平手時的優先順序 (越前面越優先)，避免結果隨 set 的雜湊順序改變
+VERDICT_PRIORITY = ["FAIL", "PASS", "UNKNOWN", "ERROR"]
+
+
+def parse_frontmatter(content: str) -> str:
+    """去除 YAML frontmatter (與 other_agent.parse_frontmatter 相同規則)，回傳 Markdown 內容"""
+    try:
+        import yaml
+    except ImportError:
+        return content
+
+    match = re.match(r'^---\s*\n(.*?)\n---\s*\n(.*)$', content, re.DOTALL)
+    if not match:
+        return content
+    try:
+        yaml.safe_load(match.group(1))
+    except yaml.YAMLError:
+        return content
+    return match.group(2)
+
+
+def build_validator_system_prompt() -> str:
+    """與 other_agent.create_stage_agent 相同的組裝方式：指令檔 (去除 frontmatter、依檔名排序) 在前，角色說明在後"""
+    parts = []
+    for fname in sorted(VALIDATOR_FILES):
+        path = INSTRUCTION_DIR / fname
+        if path.exists():
+            parts.append(parse_frontmatter(path.read_text(encoding="utf-8")))
+    return "\n\n---\n\n".join(parts) + f"\n\n---\n\n{VALIDATOR_DESCRIPTION}"
+
+
+def build_validation_prompt(content: str) -> str:
+    return f"""
+    請針對以下內容執行 `07_quality_checklist_v3_4_0.md` 中的檢查項目，並判斷是否符合規範。
+    如果完全符合，請只回答 "PASS"。
+    如果有任何不符合之處，請回答 "FAIL: [失敗原因]"，並列出具體修改建議。
+
+    [Content Start]
+    {content}
+    [Content End]
+    """
+
+
+def parse_verdict(text: str) -> str:
+    """取出開頭的 PASS / FAIL 判定，無法判斷時回傳 UNKNOWN"""
+    head = text.strip().lstrip("*#` ").upper()
+    if head.startswith("PASS"):
+        return "PASS"
+    if head.startswith("FAIL"):
+        return "FAIL"
+    return "UNKNOWN"
+
+
+def load_samples(paths) -> dict:
+    samples = {}
+    for p in map(Path, paths):
+        files = sorted(p.glob("*.md")) if p.is_dir() else [p]
+        for f in files:
+            samples[f.name] = f.read_text(encoding="utf-8")
+    return samples
+
+
+async def run_one(model: str, system_prompt: str, sample: str, semaphore: asyncio.Semaphore) -> dict:
+    async with semaphore:
+        start = time.perf_counter()
+        try:
+            response = await litellm.acompletion(
+                model=model,
+                messages=[
+                    {"role": "system", "content": system_prompt},
+                    {"role": "user", "content": build_validation_prompt(sample)},
+                ],
+                max_tokens=1024,
+            )
+            text = response.choices[0].message.content or ""
+            usage = getattr(response, "usage", None)
+            return {
+                "verdict": parse_verdict(text),
+                "latency_ms": (time.perf_counter() - start) * 1000,
+                "prompt_tokens": getattr(usage, "prompt_tokens", 0) or 0,
+                "completion_tokens": getattr(usage, "completion_tokens", 0) or 0,
+                "error": None,
+            }
+        except Exception as e:
+            return {"verdict": "ERROR", "latency_ms": (time.perf_counter() - start) * 1000,
+                    "prompt_tokens": 0, "completion_tokens": 0, "error": str(e)}
+
+
+def summarize(runs: list) -> dict:
+    ok = [r for r in runs if r["verdict"] != "ERROR"]
+    latencies = sorted(r["latency_ms"] for r in ok)
+    return {
+        "calls": len(runs),
+        "errors": len(runs) - len(ok),
+        "pass_rate": round(sum(r["verdict"] == "PASS" for r in ok) / len(ok), 3) if ok else 0.0,
+        "unknown_rate": round(sum(r["verdict"] == "UNKNOWN" for r in ok) / len(ok), 3) if ok else 0.0,
+        "latency_p50_ms": round(statistics.median(latencies), 1) if latencies else None,
+        "latency_p95_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 1) if latencies else None,
+        "avg_completion_tokens": round(statistics.mean(r["completion_tokens"] for r in ok), 1) if ok else 0,
+    }
+
+
+async def run_ab(samples: dict, model_a: str, model_b: str, repeat: int, concurrency: int) -> dict:
+    system_prompt = build_validator_system_prompt()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    results = {model_a: {}, model_b: {}}
+    for model in (model_a, model_b):
+        for name, sample in samples.items():
+            results[model][name] = await asyncio.gather(
+                *[run_one(model, system_prompt, sample, semaphore) for _ in range(repeat)]
+            )
+
+    # 以多數決作為每個樣本的判定，計算 B 與 A 的一致率
+    def majority(runs):
+        verdicts = [r["verdict"] for r in runs]
+        return min(set(verdicts), key=lambda v: (-verdicts.count(v), VERDICT_PRIORITY.index(v)))
+
+    agreement = [majority(results[model_a][n]) == majority(results[model_b][n]) for n in samples]
+
+    return {
+        "samples": len(samples),
+        "repeat": repeat,
+        "models": {
+            model: summarize([r for runs in per_sample.values() for r in runs])
+            for model, per_sample in results.items()
+        },
+        "agreement_rate": round(sum(agreement) / len(agreement), 3) if agreement else 0.0,
+        "per_sample": {
+            n: {model: majority(results[model][n]) for model in results} for n in samples
+        },
+    }
+
+
+def print_report(report: dict, model_a: str, model_b: str):
+    print("\n" + "=" * 60)
+    print(f"📊 A/B 比對報告 ({report['samples']} 個樣本 × {report['repeat']} 次)")
+    print("=" * 60)
+    for model in (model_a, model_b):
+        m = report["models"][model]
+        print(f"\n🤖 {model}")
+        print(f"  - PASS 率：{m['pass_rate']:.0%} (無法判定：{m['unknown_rate']:.0%}，錯誤：{m['errors']})")
+        print(f"  - 延遲 p50 / p95：{m['latency_p50_ms']} / {m['latency_p95_ms']} ms")
+        print(f"  - 平均輸出 Token：{m['avg_completion_tokens']}")
+    print(f"\n🔁 判定一致率 (B vs A)：{report['agreement_rate']:.0%}")
+    print("\n" + "=" * 60)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Validator 模型路由 A/B 比對")
+    parser.add_argument("samples", nargs="+", help="Markdown 樣本檔或目錄")
+    parser.add_argument("--a", default="azure/gpt-4o", help="基準部署 (預設 azure/gpt-4o)")
+    parser.add_argument("--b", default="azure/gpt-4o-mini", help="候選部署 (預設 azure/gpt-4o-mini)")
+    parser.add_argument("--repeat", type=int, default=3, help="每個樣本重複次數")
+    parser.add_argument("--concurrency", type=int, default=4, help="同時呼叫數")
+    parser.add_argument("--output", help="將結果寫入 JSON 檔")
+    args = parser.parse_args()
+
+    load_dotenv(Path(__file__).parent / "my_agent" / ".env")
+
+    samples = load_samples(args.samples)
+    if not samples:
+        print("❌ 找不到任何樣本")
+        sys.exit(1)
+
+    report = asyncio.run(run_ab(samples, args.a, args.b, args.repeat, args.concurrency))
+    print_report(report, args.a, args.b)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+        print(f"📝 結果已寫入：{args.output}")
+
+
+if __name__ == "__main__":
+    main()
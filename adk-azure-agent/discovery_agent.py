@@ -4,11 +4,13 @@
 """
 import sys
 import os
+import asyncio
 
 # 添加父目錄到路徑
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
 from my_agent.agent import model, mcp_toolsets, get_current_time, get_mcp_log, format_search_results, load_system_prompt, save_agent_response
+from my_agent.headless import run_agent_query
 from google.adk.agents.llm_agent import Agent
 
 def main():
@@ -33,8 +35,13 @@ def main():
     print(f"✓ Agent created with {len(discovery_agent.tools)} tools")
     print("✓ Starting execution...\n")
     
-    # 注意：這裡需要正確的執行方式
-    # TODO: 實現正確的 ADK Agent 執行
+    # 以 ADK Runner + InMemorySessionService 執行
+    result = asyncio.run(run_agent_query(discovery_agent, user_query, user_id="discovery_cli"))
     
+    print(result.text or "⚠️ Agent 沒有回覆任何內容")
+    print(f"\n{'='*60}")
+    print(f"✓ Finished in {result.duration_ms / 1000:.1f}s | Tool calls: {', '.join(result.tool_calls) or 'none'}")
+    print(f"{'='*60}")
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+MCP Log 統計工具 - 回答「web_search 本週的 p95 是多少？」、「哪些 ticker 的回覆最大？」、
+「calculate_upside_potential 多常失敗？」這類問題，不需再寫臨時腳本掃 mcp_logs/
+
+以多個行程平行串流處理所有 log 檔，記憶體用量不隨檔案數量成長。
+
+使用方式：
+    python mcp_log_stats.py --since 7d --tool web_search
+    python mcp_log_stats.py --group ticker --sort bytes_total --top 20
+    python mcp_log_stats.py --since 2026-10-01 --until 2026-10-08 --format csv --output stats.csv
+
+--source 預設為 my_agent/mcp_logs，也可指定其他目錄或已註冊的後端 (scheme://...)。
+"""
+import argparse
+import csv
+import io
+import json
+import sys
+import time
+from pathlib import Path
+
+from my_agent.log_analytics import collect_stats, open_log_source, parse_time
+
+SORT_FIELDS = ("calls", "errors", "error_rate", "latency_p50_ms", "latency_p95_ms", "latency_p99_ms",
+               "bytes_total", "bytes_mean", "bytes_max")
+
+
+def render_table(report: dict, groups: list) -> str:
+    lines = []
+    header = f"{'key':<40} {'calls':>7} {'err%':>6} {'p50ms':>8} {'p95ms':>8} {'p99ms':>8} {'avgKB':>8} {'maxKB':>8}"
+    for group in groups:
+        rows = {"overall": {"*": report["overall"]}}.get(group) or report[f"by_{group}"]
+        lines.append(f"\n[{group}]")
+        lines.append(header)
+        for key, s in rows.items():
+            def ms(value):
+                return f"{value:.0f}" if value is not None else "-"
+            lines.append(
+                f"{key[:40]:<40} {s['calls']:>7} {s['error_rate'] * 100:>5.1f}% {ms(s['latency_p50_ms']):>8} "
+                f"{ms(s['latency_p95_ms']):>8} {ms(s['latency_p99_ms']):>8} "
+                f"{s['bytes_mean'] / 1024:>8.1f} {s['bytes_max'] / 1024:>8.1f}"
+            )
+    return "\n".join(lines)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="彙整 mcp_logs 的工具呼叫統計 (次數、錯誤率、延遲分位數、回覆大小)")
+    parser.add_argument("--source", default=str(Path(__file__).parent / "my_agent" / "mcp_logs"),
+                        help="log 目錄或後端位置 (scheme://...)")
+    parser.add_argument("--since", help="起始時間 (ISO 格式，或 30m / 24h / 7d / 2w 表示往前推)")
+    parser.add_argument("--until", help="結束時間 (格式同 --since)")
+    parser.add_argument("--tool", action="append", help="只統計指定工具 (可重複)")
+    parser.add_argument("--ticker", action="append", help="只統計指定 ticker (可重複)")
+    parser.add_argument("--group", choices=("all", "overall", "tool", "ticker"), default="all", help="輸出的分組")
+    parser.add_argument("--sort", choices=SORT_FIELDS, default="calls", help="各分組的排序欄位 (由大到小)")
+    parser.add_argument("--top", type=int, help="每個分組只輸出前 N 筆")
+    parser.add_argument("--format", choices=("table", "json", "csv"), default="table", help="輸出格式")
+    parser.add_argument("--output", help="輸出檔路徑 (預設為標準輸出)")
+    parser.add_argument("--workers", type=int, help="平行處理的行程數 (預設為 CPU 核心數)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    stats = collect_stats(
+        open_log_source(args.source),
+        since=parse_time(args.since),
+        until=parse_time(args.until),
+        tools=args.tool,
+        tickers=args.ticker,
+        workers=args.workers,
+    )
+    elapsed = time.perf_counter() - started
+    groups = ["overall", "tool", "ticker"] if args.group == "all" else [args.group]
+
+    if args.format == "json":
+        report = stats.to_dict(args.sort, args.top)
+        for group in ("tool", "ticker"):
+            if group not in groups:
+                report.pop(f"by_{group}")
+        if "overall" not in groups:
+            report.pop("overall")
+        output = json.dumps(report, ensure_ascii=False, indent=2)
+    elif args.format == "csv":
+        buffer = io.StringIO()
+        all_rows = stats.to_rows(args.sort, args.top)
+        rows = [row for row in all_rows if row["group"] in groups]
+        writer = csv.DictWriter(buffer, fieldnames=list(all_rows[0].keys()))
+        writer.writeheader()
+        writer.writerows(rows)
+        output = buffer.getvalue()
+    else:
+        output = render_table(stats.to_dict(args.sort, args.top), groups)
+
+    if args.output:
+        Path(args.output).write_text(output, encoding="utf-8")
+        print(f"📝 Stats written to: {args.output}")
+    else:
+        print(output)
+
+    print(f"📊 {stats.records} records from {stats.files} files in {elapsed:.2f}s"
+          + (f" ({stats.bad_lines} unparsable lines)" if stats.bad_lines else ""), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
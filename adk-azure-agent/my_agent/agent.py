@@ -1,7 +1,7 @@
 from google.adk.agents.llm_agent import Agent
-from google.adk.models import LiteLlm
 from google.adk.tools.mcp_tool import McpToolset, StdioConnectionParams
 from mcp.client.stdio import StdioServerParameters  # ADK 1.21.0 寫法
+import os
 from dotenv import load_dotenv
 from datetime import datetime
 from pathlib import Path
@@ -11,36 +11,63 @@ from .mcp_toolset_wrapper import patch_mcp_tool
 patch_mcp_tool()
 
 # 匯入 MCP Log 讀取工具
-from .mcp_log_reader import read_latest_mcp_response, format_mcp_response
+from .mcp_log_reader import read_latest_mcp_response, format_mcp_response, query_mcp_log
 
 load_dotenv()
 
 # 新增驗證工具
 from .tools.format_key_message import validate_key_message
 from .tools.prompt_verifier import extract_data_for_prompt
+from .tools.context_packer import pack_extracted_data
+from .tools.page_passages import search_fetched_pages, get_passage_store, clean_fetched_content, KEY_MESSAGE_QUERY
+from .tools.dedupe import dedupe_tool_content
+from .tools.symbol_index import lookup_symbol, symbol_index_before_model, get_symbol_index_manager
 from .tools.calculate_upside import calculate_upside_potential
 from .tools.save_output import save_agent_response
+from .model_router import get_model_for_role
+from .tool_invoker import get_tool_registry
+from .llm_scheduler import schedule_before_model, schedule_after_model, schedule_on_model_error
+from .metrics import get_metrics, metrics_before_model, metrics_after_model, metrics_on_model_error
+from .loop_watchdog import loop_activity
+from .tracing import (
+    trace_before_agent, trace_after_agent, trace_before_tool, trace_after_tool, trace_before_model, trace_after_model,
+)
 
 def extract_data_tool(ticker: str) -> str:
     """
     從 mcp_logs 提取已記錄的關鍵數據，用於撰寫報告
-    此工具會彙整多個 log 檔案中的數據 (包含 Yahoo Finance 和 Web Search)
+    此工具會彙整多個 log 檔案中的數據 (包含 Yahoo Finance 和 Web Search)，
+    依關鍵訊息所需欄位 (股價、目標價、評等、利潤率、成長率、新聞) 排序並限制在 Token 預算內
     
     Args:
         ticker: 股票代碼
         
     Returns:
-        JSON 格式的整合數據 (extracted_data)
+        依來源工具分組的 `欄位: 數值` 清單；未顯示的欄位可用 extract_more_data_tool 取得
+    """
+    try:
+        data = extract_data_for_prompt(ticker)
+        # 網頁抓取結果只放入與關鍵訊息主題最相關的段落
+        passages = get_passage_store().search(ticker, KEY_MESSAGE_QUERY, top_k=3)
+        return pack_extracted_data(data, passages=passages)
+    except Exception as e:
+        return f"Error extracting data: {str(e)}"
+
+def extract_more_data_tool(ticker: str, cursor: int = 0, keyword: str = "") -> str:
+    """
+    取得 extract_data_tool 未顯示的其餘欄位 (分頁)
+    
+    Args:
+        ticker: 股票代碼
+        cursor: 從第幾個欄位開始 (使用上一頁結尾提示的 cursor)
+        keyword: 只顯示欄位名稱含有此字串的欄位 (例如 "margin"、"news"、"eps")，空字串表示不篩選
+        
+    Returns:
+        下一頁的 `欄位: 數值` 清單
     """
-    import json
     try:
         data = extract_data_for_prompt(ticker)
-        # 只回傳 extracted_data 和 source_map，避免过多雜訊
-        result = {
-            "extracted_data": data["extracted_data"],
-            "source_map": data["source_map"]
-        }
-        return json.dumps(result, ensure_ascii=False, indent=2)
+        return pack_extracted_data(data, cursor=cursor, keyword=keyword or None)
     except Exception as e:
         return f"Error extracting data: {str(e)}"
 
@@ -48,24 +75,29 @@ def get_current_time() -> str:
     """取得當前時間"""
     return datetime.now().strftime("%Y-%m-%d %H:%M:%S")
 
-def get_mcp_log(ticker: str) -> str:
+def get_mcp_log(ticker: str, tool: str = "", fields: str = "", max_items: int = 10, cursor: int = 0) -> str:
     """
-    讀取指定 ticker 的最新 MCP 回覆記錄
+    讀取指定 ticker 的最新 MCP 回覆記錄 (每個工具最新一次的回覆)
     
     Args:
         ticker: 股票代碼（例如：2330.TW, AAPL）
+        tool: 只讀取名稱含有此字串的工具，逗號分隔 (例如 "ticker_info" 或 "ticker_info,ticker_news")，空字串表示全部
+        fields: 只取這些欄位，逗號分隔的 JSONPath 風格路徑 (例如 "currentPrice,targetMedianPrice" 或 "$[*].title")，空字串表示全部
+        max_items: 陣列最多顯示的項目數 (例如新聞只看前 5 則)，0 表示不限制
+        cursor: 內容過長時分頁，使用上一頁結尾提示的 cursor
     
     Returns:
-        MCP 回覆的原始資料（JSON 格式字串）
+        MCP 回覆資料（JSON 格式字串）
     """
-    import json
-    response = read_latest_mcp_response(ticker)
-    if not response:
-        return f"❌ 找不到 {ticker} 的記錄"
-    
-    # 用 code block 包裝 JSON，確保格式正確
-    json_str = json.dumps(response, ensure_ascii=False, indent=2)
-    return f"```json\n{json_str}\n```"
+    def split(value: str):
+        return [part.strip() for part in (value or "").split(",") if part.strip()] or None
+
+    try:
+        # 網頁只保留主文，新聞 / 搜尋結果清單去除重複報導
+        return query_mcp_log(ticker, tools=split(tool), fields=split(fields), max_items=max_items, cursor=cursor,
+                             transform=lambda name, content: dedupe_tool_content(name, clean_fetched_content(name, content)))
+    except ValueError as e:
+        return f"❌ {e}"
 
 def format_search_results(search_results_json: str) -> str:
     """
@@ -160,9 +192,9 @@ __AGENT_ACTION__: USE_TICKER={symbol}
 # ============================================================================
 
 def load_mcp_config():
-    """讀取 mcp_config.json 並回傳 mcpServers 設定"""
+    """讀取 mcp_config.json 並回傳 mcpServers 設定 (可用 MCP_CONFIG_PATH 指定其他設定檔，例如壓測用的假 Server)"""
     import json
-    config_path = Path(__file__).parent.parent / "mcp_config.json"
+    config_path = Path(os.getenv("MCP_CONFIG_PATH") or Path(__file__).parent.parent / "mcp_config.json")
     if not config_path.exists():
         print(f"⚠️ Config not found: {config_path}")
         return {}
@@ -228,39 +260,61 @@ for name, config in mcp_servers.items():
             tool_name_prefix=prefix
         )
         mcp_toolsets.append(toolset)
+        get_metrics().register_tool_prefix(prefix, name)
         print(f"✓ Loaded MCP server: {name} (prefix: {prefix})")
         
     except Exception as e:
         print(f"❌ Failed to load MCP server {name}: {e}")
 
+# 共用給不經 LLM 的直接工具呼叫 (invoke_mcp_tool)
+get_tool_registry().register_toolsets(mcp_toolsets)
+
+# 啟動時於背景載入本地代碼索引，第一次查詢不必在 Event Loop 上讀檔或重建
+get_symbol_index_manager().warm_up()
+
 # ============================================================================
 # Model Initialization
 # ============================================================================
 
-model = LiteLlm(model="azure/gpt-4o")
+# 依角色路由模型 (設定見 model_routing.json)，`model` 保留給外部腳本沿用
+model = get_model_for_role("orchestrator")
 
 # ============================================================================
 # Sub-Agents
 # ============================================================================
 
 discovery_agent = Agent(
-    model=model,
+    model=get_model_for_role("discovery"),
     name='discovery_agent',
     description='負責 Ticker 探索與資料獲取。擁有 Yahoo Finance 與 Web Search 工具。',
     instruction=load_system_prompt("get_ticker_info.md"),
-    tools=[get_current_time, get_mcp_log, format_search_results, save_agent_response] + mcp_toolsets
+    tools=[get_current_time, lookup_symbol, get_mcp_log, format_search_results, save_agent_response] + mcp_toolsets,
+    before_model_callback=[symbol_index_before_model, schedule_before_model, metrics_before_model, trace_before_model],
+    after_model_callback=[schedule_after_model, metrics_after_model, trace_after_model],
+    on_model_error_callback=[schedule_on_model_error, metrics_on_model_error],
+    before_agent_callback=trace_before_agent,
+    after_agent_callback=trace_after_agent,
+    before_tool_callback=trace_before_tool,
+    after_tool_callback=trace_after_tool
 )
 
 analysis_agent = Agent(
-    model=model,
+    model=get_model_for_role("writer"),
     name='analysis_agent',
     description='負責分析資料並生成關鍵訊息。擁有資料讀取與分析工具。',
     instruction=load_system_prompt("generate_key_message.md"),
     tools=[
-        get_current_time, get_mcp_log, extract_data_tool, 
+        get_current_time, get_mcp_log, extract_data_tool, extract_more_data_tool, search_fetched_pages,
         validate_key_message, calculate_upside_potential, 
         save_agent_response, format_search_results
-    ] + mcp_toolsets
+    ] + mcp_toolsets,
+    before_model_callback=[schedule_before_model, metrics_before_model, trace_before_model],
+    after_model_callback=[schedule_after_model, metrics_after_model, trace_after_model],
+    on_model_error_callback=[schedule_on_model_error, metrics_on_model_error],
+    before_agent_callback=trace_before_agent,
+    after_agent_callback=trace_after_agent,
+    before_tool_callback=trace_before_tool,
+    after_tool_callback=trace_after_tool
 )
 
 # ============================================================================
@@ -290,10 +344,12 @@ def read_agent_response_file(ticker: str, tool_context: ToolContext = None) -> s
         filename = f"agent_response_{session_id}_{ticker}.md"
         file_path = Path(__file__).parent / filename
         
-        if not file_path.exists(): 
-            return f"尚未生成任何報告 (檔案不存在: {filename})。請確認 Ticker 是否正確或 Discovery Agent 是否執行成功。"
-            
-        return file_path.read_text(encoding="utf-8")
+        # 同步工具在 Event Loop 上執行，標記後卡頓會歸屬到此工具
+        with loop_activity("tool read_agent_response_file"):
+            if not file_path.exists(): 
+                return f"尚未生成任何報告 (檔案不存在: {filename})。請確認 Ticker 是否正確或 Discovery Agent 是否執行成功。"
+                
+            return file_path.read_text(encoding="utf-8")
     except Exception as e:
         return f"Error reading file: {str(e)}"
 
@@ -305,7 +361,14 @@ root_agent = Agent(
     instruction=load_system_prompt("orchestrator.md"),
     # 在這裡註冊 sub_agents，ADK 會自動提供 Transfer 工具
     sub_agents=[discovery_agent, analysis_agent],
-    tools=[read_agent_response_file]
+    tools=[read_agent_response_file],
+    before_model_callback=[schedule_before_model, metrics_before_model, trace_before_model],
+    after_model_callback=[schedule_after_model, metrics_after_model, trace_after_model],
+    on_model_error_callback=[schedule_on_model_error, metrics_on_model_error],
+    before_agent_callback=trace_before_agent,
+    after_agent_callback=trace_after_agent,
+    before_tool_callback=trace_before_tool,
+    after_tool_callback=trace_after_tool
 )
 
 print(f"✓ Orchestrator initializes with {len(root_agent.sub_agents)} sub-agents")
@@ -0,0 +1,260 @@
+"""
+Fake LLM - 可重現的本地模型後端，用於離線壓測與量測自身 Python 的開銷
+
+不連線 Azure，依腳本回傳固定 (或樣板) 的回覆，包含 function call 回合，
+因此可以完整驅動 stock_agent → discovery_agent → analysis_agent 與各項工具。
+
+啟用方式 (透過 model_router，不需修改 Agent 定義)：
+    LLM_BACKEND=fake                       # 所有角色改用 FakeLlm
+    MODEL_ROUTE_VALIDATOR=fake/validator   # 或只替換單一角色
+
+其他設定：
+    FAKE_LLM_SCRIPT=path/to/script.json    # 自訂腳本 (格式同 DEFAULT_SCRIPT)
+    FAKE_LLM_LATENCY_MS=200                # 每次回覆的固定延遲
+    FAKE_LLM_JITTER_MS=50                  # 額外隨機延遲上限 (以 FAKE_LLM_SEED 固定亂數)
+    FAKE_LLM_COMPLETION_TOKENS=...         # 固定回報的輸出 Token 數 (預設依回覆長度估計)
+
+腳本規則依序比對，第一個符合的規則生效：
+    {"agent": "discovery_agent", "steps": [...]}   # 以 ADK 注入的 Agent 名稱比對
+    {"match": "品質檢查員", "steps": [...]}          # 以正規表示式比對 system + user prompt
+
+每個 step 為以下其中一種，字串中的 {ticker} / {query} / {agent} / {last_response} 會被代入：
+    {"tool": "yf_get_ticker_info", "args": {"symbol": "{ticker}"}}
+    {"transfer": "analysis_agent"}
+    {"text": "..."}
+已在本回合收到回覆的 tool / transfer 步驟會被跳過；text 步驟代表本回合結束。
+"""
+import os
+import re
+import json
+import random
+import asyncio
+from typing import AsyncGenerator, Dict, List, Optional
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.llm_request import LlmRequest
+from google.adk.models.llm_response import LlmResponse
+from google.genai import types
+
+from .llm_scheduler import estimate_tokens
+
+
+STAGE_0_JSON = {
+    "ticker": "{ticker}",
+    "company_name": "{ticker} Corp.",
+    "report_date": "2026-01-13",
+    "analysis_start_date": "2025-01-13",
+    "analysis_end_date": "2026-01-13",
+    "data_source": "Yahoo Finance",
+    "analysis_angles": ["競爭格局", "供需分析"],
+    "report_type": "標準成長框架",
+    "report_title": "# {ticker} Corp. ({ticker}) - 投資分析報告",
+    "table_of_contents": "目錄\n\n1. Part A: 深度分析報告\n   1.1 重要訊息\n   1.2 估值與目標價\n\n2. Part B: 重點摘要表格\n\n3. 附錄 (Appendix)",
+}
+
+FAKE_KEY_MESSAGE = "{ticker} 最新股價與目標價之間仍有上漲空間，營收與毛利率維持成長，建議持續追蹤後續財報與產業需求變化。"
+
+DEFAULT_SCRIPT: List[Dict] = [
+    # my_agent/agent.py 的多 Agent 流程
+    {"agent": "stock_agent", "steps": [
+        {"transfer": "discovery_agent"},
+        {"transfer": "analysis_agent"},
+        {"tool": "read_agent_response_file", "args": {"ticker": "{ticker}"}},
+        {"text": "{last_response}"},
+    ]},
+    {"agent": "discovery_agent", "steps": [
+        {"tool": "yf_get_ticker_info", "args": {"symbol": "{ticker}", "ticker": "{ticker}"}},
+        {"tool": "save_agent_response", "args": {"content": "Ticker: {ticker}", "ticker": "{ticker}", "mode": "overwrite"}},
+        {"transfer": "stock_agent"},
+    ]},
+    {"agent": "analysis_agent", "steps": [
+        {"tool": "extract_data_tool", "args": {"ticker": "{ticker}"}},
+        {"tool": "calculate_upside_potential", "args": {"current_price": 100.0, "target_price": 120.0, "ticker": "{ticker}"}},
+        {"tool": "validate_key_message", "args": {"content": FAKE_KEY_MESSAGE, "ticker": "{ticker}"}},
+        {"tool": "save_agent_response", "args": {"content": FAKE_KEY_MESSAGE, "ticker": "{ticker}", "mode": "append"}},
+        {"transfer": "stock_agent"},
+    ]},
+    # other_agent.py 的流水線入口
+    {"agent": "stock_analyst", "steps": [
+        {"tool": "run_analysis_pipeline", "args": {"user_request": "{query}"}},
+        {"text": "{last_response}"},
+    ]},
+    # 流水線各階段 (直接呼叫，無 Agent 名稱，以 prompt 內容比對)
+    {"match": "品質檢查員", "steps": [{"text": "PASS"}]},
+    {"match": r"指揮官 \(Stage 0\)", "steps": [{"text": json.dumps(STAGE_0_JSON, ensure_ascii=False)}]},
+    {"match": ".*", "steps": [{"text": "## {agent}\n\n" + FAKE_KEY_MESSAGE}]},
+]
+
+_AGENT_NAME_PATTERN = re.compile(r'Your internal name is "([^"]+)"')
+_TICKER_PATTERN = re.compile(r"\b(\d{4}\.TWO?|[A-Z]{1,5}(?:\.[A-Z]{1,2})?)\b")
+
+
+def _render(value, variables: Dict[str, str]):
+    """遞迴代入樣板變數 (未知的變數保留原樣，避免 JSON 大括號被誤判)"""
+    if isinstance(value, str):
+        return re.sub(r"\{(\w+)\}", lambda m: str(variables.get(m.group(1), m.group(0))), value)
+    if isinstance(value, dict):
+        return {k: _render(v, variables) for k, v in value.items()}
+    if isinstance(value, list):
+        return [_render(v, variables) for v in value]
+    return value
+
+
+def _is_context_message(content: types.Content) -> bool:
+    """ADK 將其他 Agent 的事件轉為 "For context:" 開頭的 user 訊息"""
+    parts = content.parts or []
+    return bool(parts) and (parts[0].text or "").startswith("For context:")
+
+
+class FakeLlm(BaseLlm):
+    """依腳本回覆的本地模型 (相同輸入永遠得到相同輸出)"""
+
+    model: str = "fake/gpt-4o"
+    script: List[Dict] = DEFAULT_SCRIPT
+    latency_ms: float = 0.0
+    jitter_ms: float = 0.0
+    completion_tokens: Optional[int] = None
+    stream_chunks: int = 4
+    seed: int = 0
+
+    @classmethod
+    def supported_models(cls) -> list[str]:
+        return [r"fake/.*"]
+
+    @classmethod
+    def from_env(cls, model: str = "fake/gpt-4o") -> "FakeLlm":
+        script = DEFAULT_SCRIPT
+        script_path = os.getenv("FAKE_LLM_SCRIPT")
+        if script_path:
+            with open(script_path, "r", encoding="utf-8") as f:
+                script = json.load(f)
+        completion_tokens = os.getenv("FAKE_LLM_COMPLETION_TOKENS")
+        return cls(
+            model=model,
+            script=script,
+            latency_ms=float(os.getenv("FAKE_LLM_LATENCY_MS", "0")),
+            jitter_ms=float(os.getenv("FAKE_LLM_JITTER_MS", "0")),
+            completion_tokens=int(completion_tokens) if completion_tokens else None,
+            seed=int(os.getenv("FAKE_LLM_SEED", "0")),
+        )
+
+    # ------------------------------------------------------------------
+    # 腳本解析
+    # ------------------------------------------------------------------
+    def _select_step(self, llm_request: LlmRequest, variables: Dict[str, str]) -> Dict:
+        agent_name = variables["agent"]
+
+        rule = None
+        for candidate in self.script:
+            if "agent" in candidate and candidate["agent"] == agent_name:
+                rule = candidate
+                break
+            if "match" in candidate and re.search(candidate["match"], variables["_prompt_text"]):
+                rule = candidate
+                break
+        if rule is None:
+            return {"text": f"(fake response for {agent_name})"}
+
+        # 本回合已收到回覆的工具次數 (同名工具可出現在多個步驟，例如兩次 transfer)
+        responded: Dict[str, int] = {}
+        for content in variables["_turn_contents"]:
+            for part in content.parts or []:
+                if part.function_response:
+                    responded[part.function_response.name] = responded.get(part.function_response.name, 0) + 1
+
+        seen: Dict[str, int] = {}
+        for step in rule["steps"]:
+            name = step.get("tool") or ("transfer_to_agent" if "transfer" in step else None)
+            if name is None:
+                return step
+            seen[name] = seen.get(name, 0) + 1
+            if responded.get(name, 0) < seen[name]:
+                return step
+        return {"text": variables["last_response"] or "Done."}
+
+    def _variables(self, llm_request: LlmRequest) -> Dict:
+        contents = llm_request.contents or []
+        system_text = str(llm_request.config.system_instruction or "") if llm_request.config else ""
+        match = _AGENT_NAME_PATTERN.search(system_text)
+
+        # 本回合：最後一則「真正的」使用者訊息之後的內容
+        turn_start = 0
+        query = ""
+        for i, content in enumerate(contents):
+            if content.role == "user" and not _is_context_message(content):
+                text = "".join(p.text or "" for p in content.parts or [])
+                if text.strip():
+                    turn_start, query = i, text
+        turn_contents = contents[turn_start:]
+
+        last_response = ""
+        for content in turn_contents:
+            for part in content.parts or []:
+                if part.function_response:
+                    response = part.function_response.response or {}
+                    result = response.get("result", response) if isinstance(response, dict) else response
+                    last_response = result if isinstance(result, str) else json.dumps(result, ensure_ascii=False, default=str)
+
+        # ticker：優先從使用者訊息取得，其次為整段對話中出現的代碼
+        all_text = " ".join(p.text or "" for c in contents for p in (c.parts or []))
+        ticker_match = _TICKER_PATTERN.search(query) or _TICKER_PATTERN.search(all_text)
+        prompt_text = system_text + "\n" + all_text
+        return {
+            "agent": match.group(1) if match else "direct",
+            "query": query,
+            "ticker": ticker_match.group(1) if ticker_match else "2330.TW",
+            "last_response": last_response[:4000],
+            "_turn_contents": turn_contents,
+            "_prompt_text": prompt_text,
+        }
+
+    # ------------------------------------------------------------------
+    # BaseLlm
+    # ------------------------------------------------------------------
+    async def generate_content_async(
+        self, llm_request: LlmRequest, stream: bool = False
+    ) -> AsyncGenerator[LlmResponse, None]:
+        variables = self._variables(llm_request)
+        step = _render(self._select_step(llm_request, variables), variables)
+
+        if "tool" in step or "transfer" in step:
+            name = step.get("tool") or "transfer_to_agent"
+            args = step.get("args", {}) if "tool" in step else {"agent_name": step["transfer"]}
+            parts = [types.Part(function_call=types.FunctionCall(name=name, args=args))]
+            output_text = json.dumps(args, ensure_ascii=False)
+        else:
+            output_text = step.get("text", "")
+            parts = [types.Part(text=output_text)]
+
+        # 依請求內容決定亂數，確保相同輸入的延遲也相同
+        request_text = "".join(p.text or "" for c in (llm_request.contents or []) for p in (c.parts or []))
+        rng = random.Random(f"{self.seed}:{request_text}")
+        delay = (self.latency_ms + rng.uniform(0, self.jitter_ms)) / 1000
+
+        prompt_tokens = estimate_tokens(request_text) + estimate_tokens(
+            str(llm_request.config.system_instruction or "") if llm_request.config else ""
+        )
+        completion_tokens = self.completion_tokens if self.completion_tokens is not None else estimate_tokens(output_text)
+        usage = types.GenerateContentResponseUsageMetadata(
+            prompt_token_count=prompt_tokens,
+            candidates_token_count=completion_tokens,
+            total_token_count=prompt_tokens + completion_tokens,
+        )
+
+        if stream and "text" in step and output_text:
+            size = max(len(output_text) // self.stream_chunks, 1)
+            for i in range(0, len(output_text), size):
+                await asyncio.sleep(delay / self.stream_chunks)
+                yield LlmResponse(
+                    content=types.Content(role="model", parts=[types.Part(text=output_text[i:i + size])]),
+                    partial=True,
+                )
+        else:
+            await asyncio.sleep(delay)
+
+        yield LlmResponse(
+            content=types.Content(role="model", parts=parts),
+            usage_metadata=usage,
+            partial=False,
+            turn_complete=True,
+        )
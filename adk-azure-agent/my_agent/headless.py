@@ -0,0 +1,98 @@
+"""
+Headless 執行 - 不經過 adk web，直接以 ADK Runner + InMemorySessionService 執行 Agent
+
+Usage:
+    from my_agent.headless import run_agent_query
+    result = await run_agent_query(root_agent, "分析 2330.TW", ticker="2330.TW")
+    print(result.text)
+"""
+import time
+import uuid
+import importlib
+from dataclasses import dataclass, field
+from typing import List, Optional
+
+from google.adk.runners import Runner
+from google.adk.sessions import InMemorySessionService
+from google.genai import types
+
+from .llm_ledger import get_llm_ledger
+from .mcp_toolset_wrapper import ticker_scope
+
+
+APP_NAME = "stock_agent_headless"
+
+
+def load_agent(spec: str = "my_agent.agent:root_agent"):
+    """依 module:attr 載入 Agent (例如 my_agent.agent:root_agent)"""
+    module_name, _, attr = spec.partition(":")
+    return getattr(importlib.import_module(module_name), attr or "root_agent")
+
+
+@dataclass
+class HeadlessResult:
+    """單次 Headless 執行的結果"""
+    query: str
+    session_id: str
+    text: str = ""
+    events: int = 0
+    tool_calls: List[str] = field(default_factory=list)
+    authors: List[str] = field(default_factory=list)
+    duration_ms: float = 0.0
+    run_id: Optional[str] = None
+
+
+async def run_agent_query(
+    agent,
+    query: str,
+    ticker: str = None,
+    user_id: str = "headless",
+    session_id: str = None,
+    session_service: InMemorySessionService = None,
+) -> HeadlessResult:
+    """
+    以全新的 Session 執行一次 Agent 查詢並回傳最終回覆
+
+    每次執行使用獨立的 Session、MCP ticker 上下文與 LLM Ledger run，
+    因此可在同一行程中同時執行多個查詢而互不干擾。
+
+    Args:
+        agent: 要執行的 Agent (例如 my_agent.agent.root_agent)
+        query: 使用者輸入
+        ticker: 已知的股票代碼 (用於 mcp_logs 與 Ledger 歸檔)
+        session_service: 可共用的 Session Service (預設每次建立新的 InMemorySessionService)
+    """
+    session_service = session_service or InMemorySessionService()
+    runner = Runner(agent=agent, app_name=APP_NAME, session_service=session_service)
+    session = await session_service.create_session(
+        app_name=APP_NAME,
+        user_id=user_id,
+        session_id=session_id or f"{ticker or 'query'}_{uuid.uuid4().hex[:8]}",
+    )
+
+    result = HeadlessResult(query=query, session_id=session.id)
+    final_texts = []
+    start = time.perf_counter()
+
+    with get_llm_ledger().run(ticker=ticker or "unknown") as run_id, ticker_scope(ticker or "unknown"):
+        result.run_id = run_id
+        async for event in runner.run_async(
+            user_id=user_id,
+            session_id=session.id,
+            new_message=types.Content(role="user", parts=[types.Part(text=query)]),
+        ):
+            result.events += 1
+            if event.author and event.author not in result.authors:
+                result.authors.append(event.author)
+            for call in event.get_function_calls():
+                result.tool_calls.append(call.name)
+
+            if event.partial or not event.is_final_response() or not event.content or not event.content.parts:
+                continue
+            text = "".join(p.text or "" for p in event.content.parts if not getattr(p, "thought", False))
+            if text.strip():
+                final_texts.append(text)
+
+    result.duration_ms = (time.perf_counter() - start) * 1000
+    result.text = "\n\n".join(final_texts)
+    return result
@@ -0,0 +1,312 @@
+"""
+本地持久化工作佇列 - 以 SQLite 實作 enqueue / lease / heartbeat / retry / dead-letter
+
+多個 Worker 行程 (甚至共用檔案系統的多台主機) 可同時從同一個佇列取工作：
+- lease：以 BEGIN IMMEDIATE 取得寫入鎖後挑選一筆工作並標記租約，確保同一筆工作只會被一個 Worker 取得
+- heartbeat：長時間執行的工作需定期延長租約；租約過期的工作會被其他 Worker 重新取得
+- fail：未超過 max_attempts 時依指數退避重新排入，超過則移入 dead-letter (status = dead)
+
+Usage:
+    queue = JobQueue("jobs.db")
+    queue.enqueue({"ticker": "2330.TW"}, dedupe_key="2330.TW")
+    job = queue.lease("worker-1", lease_seconds=300)
+    ...
+    queue.complete(job.id, "worker-1", result={"output": "..."})
+
+注意：WAL 模式需要共享記憶體，不適用於網路檔案系統 (NFS / SMB)；跨主機共用時請以 wal=False 開啟。
+"""
+import json
+import time
+import sqlite3
+import threading
+from dataclasses import dataclass
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+
+PENDING = "pending"
+LEASED = "leased"
+DONE = "done"
+DEAD = "dead"
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    kind TEXT NOT NULL DEFAULT 'report',
+    payload TEXT NOT NULL,
+    dedupe_key TEXT,
+    status TEXT NOT NULL DEFAULT 'pending',
+    priority INTEGER NOT NULL DEFAULT 0,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    max_attempts INTEGER NOT NULL DEFAULT 3,
+    lease_owner TEXT,
+    lease_expires_at REAL,
+    available_at REAL NOT NULL,
+    created_at REAL NOT NULL,
+    updated_at REAL NOT NULL,
+    last_error TEXT,
+    result TEXT
+);
+CREATE UNIQUE INDEX IF NOT EXISTS idx_jobs_dedupe ON jobs(dedupe_key) WHERE dedupe_key IS NOT NULL AND status IN ('pending', 'leased');
+CREATE INDEX IF NOT EXISTS idx_jobs_ready ON jobs(status, priority, available_at);
+"""
+
+
+@dataclass
+class Job:
+    """佇列中的一筆工作"""
+    id: int
+    kind: str
+    payload: Dict[str, Any]
+    status: str
+    attempts: int
+    max_attempts: int
+    lease_owner: Optional[str] = None
+    lease_expires_at: Optional[float] = None
+    last_error: Optional[str] = None
+
+    @classmethod
+    def from_row(cls, row: sqlite3.Row) -> "Job":
+        return cls(
+            id=row["id"],
+            kind=row["kind"],
+            payload=json.loads(row["payload"]),
+            status=row["status"],
+            attempts=row["attempts"],
+            max_attempts=row["max_attempts"],
+            lease_owner=row["lease_owner"],
+            lease_expires_at=row["lease_expires_at"],
+            last_error=row["last_error"],
+        )
+
+
+class JobQueue:
+    """SQLite 工作佇列 (每個行程各自建立實例，連線不可跨 fork 共用；同一實例可從多個執行緒使用)"""
+
+    def __init__(self, db_path: str = None, wal: bool = True, retry_backoff: float = 30.0):
+        if db_path is None:
+            db_path = Path(__file__).parent / ".adk" / "job_queue.db"
+
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.retry_backoff = retry_backoff
+        self.wal = wal
+
+        self._local = threading.local()
+        self._connections: List[sqlite3.Connection] = []
+        self._connections_lock = threading.Lock()
+        self._conn.executescript(SCHEMA)
+
+    @property
+    def _conn(self) -> sqlite3.Connection:
+        """每個執行緒各自的連線 (Worker 以 asyncio.to_thread 存取佇列，sqlite3 連線不可跨執行緒同時使用)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            # isolation_level=None：自行以 BEGIN IMMEDIATE 控制交易
+            conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None, check_same_thread=False)
+            conn.row_factory = sqlite3.Row
+            conn.execute("PRAGMA busy_timeout = 30000")
+            if self.wal:
+                conn.execute("PRAGMA journal_mode = WAL")
+                conn.execute("PRAGMA synchronous = NORMAL")
+            self._local.conn = conn
+            with self._connections_lock:
+                self._connections.append(conn)
+        return conn
+
+    def close(self):
+        with self._connections_lock:
+            connections, self._connections = self._connections, []
+        for conn in connections:
+            conn.close()
+        self._local = threading.local()
+
+    def _transaction(self):
+        return _ImmediateTransaction(self._conn)
+
+    # ------------------------------------------------------------------
+    # Producer
+    # ------------------------------------------------------------------
+    def enqueue(
+        self,
+        payload: Dict[str, Any],
+        kind: str = "report",
+        priority: int = 0,
+        max_attempts: int = 3,
+        dedupe_key: str = None,
+        delay_seconds: float = 0,
+    ) -> Optional[int]:
+        """
+        加入一筆工作
+
+        Returns:
+            工作 id；若 dedupe_key 相同的工作仍在排隊或執行中則回傳 None
+        """
+        now = time.time()
+        try:
+            cursor = self._conn.execute(
+                "INSERT INTO jobs (kind, payload, dedupe_key, priority, max_attempts, available_at, created_at, updated_at) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (kind, json.dumps(payload, ensure_ascii=False), dedupe_key, priority, max_attempts,
+                 now + delay_seconds, now, now),
+            )
+            return cursor.lastrowid
+        except sqlite3.IntegrityError:
+            return None
+
+    # ------------------------------------------------------------------
+    # Consumer
+    # ------------------------------------------------------------------
+    def lease(self, worker_id: str, lease_seconds: float = 300, kind: str = None) -> Optional[Job]:
+        """
+        取得下一筆可執行的工作 (優先順序數字小者優先，其次為先進先出)
+
+        租約已過期的工作視為 Worker 中途死亡，會被重新取得；若已達 max_attempts 則移入 dead-letter。
+        """
+        now = time.time()
+        kind_filter = "AND kind = ?" if kind else ""
+        params = [now, now] + ([kind] if kind else [])
+
+        with self._transaction():
+            while True:
+                row = self._conn.execute(
+                    f"SELECT * FROM jobs WHERE ((status = '{PENDING}' AND available_at <= ?) "
+                    f"OR (status = '{LEASED}' AND lease_expires_at < ?)) {kind_filter} "
+                    "ORDER BY priority, id LIMIT 1",
+                    params,
+                ).fetchone()
+                if row is None:
+                    return None
+
+                if row["status"] == LEASED and row["attempts"] >= row["max_attempts"]:
+                    self._conn.execute(
+                        f"UPDATE jobs SET status = '{DEAD}', lease_owner = NULL, updated_at = ?, "
+                        "last_error = COALESCE(last_error, 'lease expired') WHERE id = ?",
+                        (now, row["id"]),
+                    )
+                    continue
+
+                self._conn.execute(
+                    f"UPDATE jobs SET status = '{LEASED}', lease_owner = ?, lease_expires_at = ?, "
+                    "attempts = attempts + 1, updated_at = ? WHERE id = ?",
+                    (worker_id, now + lease_seconds, now, row["id"]),
+                )
+                job = Job.from_row(row)
+                job.status = LEASED
+                job.attempts += 1
+                job.lease_owner = worker_id
+                job.lease_expires_at = now + lease_seconds
+                return job
+
+    def heartbeat(self, job_id: int, worker_id: str, lease_seconds: float = 300) -> bool:
+        """延長租約；回傳 False 表示租約已被收回 (Worker 應放棄此工作)"""
+        now = time.time()
+        cursor = self._conn.execute(
+            f"UPDATE jobs SET lease_expires_at = ?, updated_at = ? "
+            f"WHERE id = ? AND lease_owner = ? AND status = '{LEASED}'",
+            (now + lease_seconds, now, job_id, worker_id),
+        )
+        return cursor.rowcount == 1
+
+    def complete(self, job_id: int, worker_id: str, result: Dict[str, Any] = None) -> bool:
+        """標記完成"""
+        cursor = self._conn.execute(
+            f"UPDATE jobs SET status = '{DONE}', result = ?, lease_owner = NULL, last_error = NULL, updated_at = ? "
+            f"WHERE id = ? AND lease_owner = ? AND status = '{LEASED}'",
+            (json.dumps(result or {}, ensure_ascii=False), time.time(), job_id, worker_id),
+        )
+        return cursor.rowcount == 1
+
+    def fail(self, job_id: int, worker_id: str, error: str) -> str:
+        """
+        標記失敗：未達 max_attempts 時依指數退避重新排入，否則移入 dead-letter
+
+        Returns:
+            工作的新狀態 (pending / dead)，租約已不屬於此 Worker 時回傳空字串
+        """
+        now = time.time()
+        with self._transaction():
+            row = self._conn.execute(
+                f"SELECT attempts, max_attempts FROM jobs WHERE id = ? AND lease_owner = ? AND status = '{LEASED}'",
+                (job_id, worker_id),
+            ).fetchone()
+            if row is None:
+                return ""
+
+            if row["attempts"] >= row["max_attempts"]:
+                status, available_at = DEAD, now
+            else:
+                status, available_at = PENDING, now + self.retry_backoff * 2 ** (row["attempts"] - 1)
+
+            self._conn.execute(
+                "UPDATE jobs SET status = ?, available_at = ?, lease_owner = NULL, lease_expires_at = NULL, "
+                "last_error = ?, updated_at = ? WHERE id = ?",
+                (status, available_at, error, now, job_id),
+            )
+            return status
+
+    # ------------------------------------------------------------------
+    # 管理
+    # ------------------------------------------------------------------
+    def stats(self) -> Dict[str, int]:
+        counts = {PENDING: 0, LEASED: 0, DONE: 0, DEAD: 0}
+        for row in self._conn.execute("SELECT status, COUNT(*) AS n FROM jobs GROUP BY status"):
+            counts[row["status"]] = row["n"]
+        return counts
+
+    def dead_letters(self, limit: int = 100) -> List[Job]:
+        rows = self._conn.execute(
+            f"SELECT * FROM jobs WHERE status = '{DEAD}' ORDER BY updated_at DESC LIMIT ?", (limit,)
+        ).fetchall()
+        return [Job.from_row(r) for r in rows]
+
+    def requeue_dead(self, job_ids: List[int] = None) -> Tuple[int, int]:
+        """
+        將 dead-letter 重新排入 (重設嘗試次數)；未指定 id 時全部重排
+
+        dedupe_key 相同的工作已在排隊或執行中 (或同一批中已重排一筆) 時略過，留在 dead-letter。
+
+        Returns:
+            (重新排入數, 略過數)
+        """
+        now = time.time()
+        where = f"status = '{DEAD}'"
+        params: list = []
+        if job_ids:
+            where += f" AND id IN ({','.join('?' * len(job_ids))})"
+            params += list(job_ids)
+
+        requeued = skipped = 0
+        with self._transaction():
+            rows = self._conn.execute(f"SELECT id FROM jobs WHERE {where} ORDER BY id", params).fetchall()
+            for row in rows:
+                try:
+                    self._conn.execute(
+                        f"UPDATE jobs SET status = '{PENDING}', attempts = 0, available_at = ?, updated_at = ? WHERE id = ?",
+                        (now, now, row["id"]),
+                    )
+                    requeued += 1
+                except sqlite3.IntegrityError:
+                    skipped += 1
+        return requeued, skipped
+
+    def has_unfinished(self) -> bool:
+        row = self._conn.execute(
+            f"SELECT 1 FROM jobs WHERE status IN ('{PENDING}', '{LEASED}') LIMIT 1"
+        ).fetchone()
+        return row is not None
+
+
+class _ImmediateTransaction:
+    """BEGIN IMMEDIATE 交易：立即取得寫入鎖，避免兩個 Worker 同時選到同一筆工作"""
+
+    def __init__(self, conn: sqlite3.Connection):
+        self.conn = conn
+
+    def __enter__(self):
+        self.conn.execute("BEGIN IMMEDIATE")
+        return self.conn
+
+    def __exit__(self, exc_type, exc, tb):
+        self.conn.execute("ROLLBACK" if exc_type else "COMMIT")
+        return False
@@ -0,0 +1,355 @@
+"""
+LLM 呼叫帳本 - 記錄每次模型呼叫的 Token、延遲與成本
+
+記錄依 run_id 分組保存，總筆數超過 LLM_LEDGER_MAX_RECORDS (預設 20000) 時淘汰最久沒有新呼叫的 run
+(每次流水線結束時已匯出 JSONL，長時間執行的行程不會無限累積)。
+"""
+import os
+import json
+import time
+import hashlib
+import uuid
+import contextvars
+from collections import OrderedDict
+from contextlib import contextmanager
+from dataclasses import dataclass, asdict, field
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .metrics import get_metrics
+from .tracing import get_tracer
+
+
+# 每百萬 Token 的美金價格 (Azure OpenAI 牌價，可依合約調整)
+MODEL_PRICING = {
+    "azure/gpt-4o": {"input": 2.50, "cached_input": 1.25, "output": 10.00},
+    "azure/gpt-4o-mini": {"input": 0.15, "cached_input": 0.075, "output": 0.60},
+}
+
+DEFAULT_MAX_RECORDS = 20000
+
+
+@dataclass
+class LlmCallRecord:
+    """單次模型呼叫的記錄"""
+    run_id: str
+    ticker: str
+    agent_name: str
+    stage: str
+    attempt: int
+    model: str
+    prompt_tokens: int = 0
+    completion_tokens: int = 0
+    cached_tokens: int = 0
+    ttft_ms: Optional[float] = None
+    duration_ms: float = 0.0
+    cost_usd: float = 0.0
+    prompt_prefix_hash: Optional[str] = None
+    cache_hit: bool = False
+    stopped_early: bool = False
+    usage_estimated: bool = False  # 回覆沒有 usage_metadata (例如串流提前中止)，Token 數為估計值
+    success: bool = True
+    error: Optional[str] = None
+    timestamp: str = field(default_factory=lambda: datetime.now().isoformat())
+
+
+def estimate_cost(model: str, prompt_tokens: int, completion_tokens: int, cached_tokens: int = 0) -> float:
+    """依 MODEL_PRICING 估算單次呼叫成本 (USD)"""
+    pricing = MODEL_PRICING.get(model)
+    if not pricing:
+        return 0.0
+    uncached = max(prompt_tokens - cached_tokens, 0)
+    cost = (
+        uncached * pricing["input"]
+        + cached_tokens * pricing["cached_input"]
+        + completion_tokens * pricing["output"]
+    )
+    return round(cost / 1_000_000, 6)
+
+
+def resolve_served_model(requested: str, served: Optional[str]) -> str:
+    """
+    以回覆中實際服務的模型 (LlmResponse.model_version，例如 gpt-4o-2024-08-06) 取代請求的主要部署名稱
+
+    LiteLLM fallback 接手時回覆來自 chain 中的其他部署；對應到 MODEL_PRICING 中名稱最長的相符項目
+    (gpt-4o-mini-2024-07-18 → azure/gpt-4o-mini)，找不到時保留回覆中的名稱。
+    """
+    if not served:
+        return requested
+    served_name = served.split("/")[-1]
+    candidates = [m for m in list(MODEL_PRICING) + [requested] if served_name.startswith(m.split("/")[-1])]
+    return max(candidates, key=lambda m: len(m.split("/")[-1])) if candidates else served
+
+
+def prompt_prefix_hash(system_prompt: str, prefix_chars: int = 4096) -> str:
+    """
+    計算 System Prompt 前綴的雜湊值
+
+    Azure OpenAI 的 Prompt Caching 以 1024 tokens 起跳的共同前綴為單位，
+    同一 Agent 多次呼叫的前綴雜湊應保持一致，否則快取無法命中。
+    """
+    return hashlib.sha256(system_prompt[:prefix_chars].encode("utf-8")).hexdigest()[:12]
+
+
+# 當前流水線執行的上下文 (run_id, ticker)，以 ContextVar 保存以支援多個報告同時執行
+_current_run: contextvars.ContextVar[Optional[Dict[str, str]]] = contextvars.ContextVar(
+    "llm_ledger_current_run", default=None
+)
+
+
+class LlmCallTimer:
+    """量測單次呼叫的首個 Token 時間 (TTFT) 與總時間"""
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        self.first_token_at: Optional[float] = None
+
+    def mark_first_token(self):
+        if self.first_token_at is None:
+            self.first_token_at = time.perf_counter()
+
+    @property
+    def ttft_ms(self) -> Optional[float]:
+        if self.first_token_at is None:
+            return None
+        return (self.first_token_at - self.start) * 1000
+
+    @property
+    def elapsed_ms(self) -> float:
+        return (time.perf_counter() - self.start) * 1000
+
+
+class LlmUsageLedger:
+    """彙整 LLM 呼叫記錄 (依 run_id 分組、總筆數有上限)，可依 run / ticker / stage 匯總並匯出"""
+
+    def __init__(self, max_records: int = DEFAULT_MAX_RECORDS):
+        self.max_records = max_records
+        # run_id -> 呼叫記錄；依最後一次新增記錄的時間排序，最久沒有活動的 run 在最前面
+        self._runs: "OrderedDict[str, List[LlmCallRecord]]" = OrderedDict()
+        self._size = 0
+        self.evicted_runs = 0
+        self.total_cost_usd = 0.0  # 行程啟動以來的累計成本 (不受淘汰影響)
+
+    @property
+    def records(self) -> List[LlmCallRecord]:
+        """目前保留的所有記錄"""
+        return [r for records in self._runs.values() for r in records]
+
+    def _append(self, record: LlmCallRecord):
+        records = self._runs.setdefault(record.run_id, [])
+        self._runs.move_to_end(record.run_id)
+        records.append(record)
+        self._size += 1
+
+        # 超過上限時淘汰最久沒有活動的 run；只剩目前的 run 時捨棄它最舊的記錄
+        while self._size > self.max_records:
+            oldest_id = next(iter(self._runs))
+            if oldest_id == record.run_id:
+                records.pop(0)
+                self._size -= 1
+            else:
+                self._size -= len(self._runs.pop(oldest_id))
+                self.evicted_runs += 1
+
+    # ------------------------------------------------------------------
+    # Run 管理
+    # ------------------------------------------------------------------
+    @contextmanager
+    def run(self, ticker: str = "unknown", run_id: str = None):
+        """
+        標記一次流水線執行，期間的所有呼叫都會帶上 run_id
+
+        Usage:
+            with ledger.run(ticker="AMD") as run_id:
+                ...
+        """
+        run_id = run_id or f"{datetime.now().strftime('%Y%m%d_%H%M%S')}_{uuid.uuid4().hex[:6]}"
+        token = _current_run.set({"run_id": run_id, "ticker": ticker})
+        try:
+            yield run_id
+        finally:
+            _current_run.reset(token)
+
+    def set_ticker(self, ticker: str):
+        """Stage 0 解析出 ticker 後回填到當前 run (含已記錄的呼叫)"""
+        current = _current_run.get()
+        if current is not None and ticker:
+            current["ticker"] = ticker
+            for r in self._runs.get(current["run_id"], ()):
+                r.ticker = ticker
+
+    def current_run_id(self) -> Optional[str]:
+        """目前 run 的 run_id (不在 run 中時回傳 None)"""
+        current = _current_run.get()
+        return current.get("run_id") if current else None
+
+    def current_ticker(self) -> Optional[str]:
+        """目前 run 的 ticker (不在 run 中時回傳 None)"""
+        current = _current_run.get()
+        return current.get("ticker") if current else None
+
+    # ------------------------------------------------------------------
+    # 記錄
+    # ------------------------------------------------------------------
+    def record(
+        self,
+        agent_name: str,
+        model: str,
+        usage_metadata: Any = None,
+        stage: str = None,
+        attempt: int = 1,
+        ttft_ms: float = None,
+        duration_ms: float = 0.0,
+        prompt_prefix_hash: str = None,
+        cache_hit: bool = False,
+        stopped_early: bool = False,
+        success: bool = True,
+        error: str = None,
+        estimated_usage: Tuple[int, int] = None,
+    ) -> LlmCallRecord:
+        """
+        記錄一次模型呼叫
+
+        Args:
+            agent_name: Agent 名稱
+            model: 模型名稱 (e.g. azure/gpt-4o)
+            usage_metadata: LlmResponse.usage_metadata (可為 None)
+            stage: 流水線階段 (預設使用 agent_name)
+            attempt: 第幾次嘗試 (驗證重試時遞增)
+            ttft_ms: 首個 Token 時間（毫秒）
+            duration_ms: 總執行時間（毫秒）
+            prompt_prefix_hash: System Prompt 前綴雜湊 (用於確認 Prompt Caching 的前綴穩定性)
+            cache_hit: 是否命中本地 LLM 回覆快取 (未實際呼叫模型)
+            stopped_early: 是否因串流停止條件提前中止生成
+            estimated_usage: usage_metadata 缺漏時改用的 (prompt, completion) 估計 Token 數，記錄會標記 usage_estimated
+        """
+        prompt_tokens = getattr(usage_metadata, "prompt_token_count", None) or 0
+        completion_tokens = getattr(usage_metadata, "candidates_token_count", None) or 0
+        cached_tokens = getattr(usage_metadata, "cached_content_token_count", None) or 0
+        usage_estimated = usage_metadata is None and estimated_usage is not None
+        if usage_estimated:
+            prompt_tokens, completion_tokens = estimated_usage
+
+        current = _current_run.get() or {}
+        record = LlmCallRecord(
+            run_id=current.get("run_id", "adhoc"),
+            ticker=current.get("ticker", "unknown"),
+            agent_name=agent_name,
+            stage=stage or agent_name,
+            attempt=attempt,
+            model=model,
+            prompt_tokens=prompt_tokens,
+            completion_tokens=completion_tokens,
+            cached_tokens=cached_tokens,
+            ttft_ms=round(ttft_ms, 1) if ttft_ms is not None else None,
+            duration_ms=round(duration_ms, 1),
+            cost_usd=estimate_cost(model, prompt_tokens, completion_tokens, cached_tokens),
+            prompt_prefix_hash=prompt_prefix_hash,
+            cache_hit=cache_hit,
+            stopped_early=stopped_early,
+            usage_estimated=usage_estimated,
+            success=success,
+            error=error,
+        )
+        self._append(record)
+        self.total_cost_usd += record.cost_usd
+
+        if not cache_hit:
+            get_metrics().observe_llm_call(
+                agent_name=agent_name, model=model, duration_ms=duration_ms, success=success,
+                ttft_ms=ttft_ms, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+                cached_tokens=cached_tokens, source="direct",
+            )
+        get_tracer().record_span(
+            f"llm {agent_name}", "llm", duration_ms, agent=agent_name, model=model, stage=record.stage,
+            attempt=attempt, prompt_tokens=prompt_tokens, completion_tokens=completion_tokens,
+            cache_hit=cache_hit, ttft_ms=record.ttft_ms, status=None if success else "error",
+        )
+        return record
+
+    # ------------------------------------------------------------------
+    # 匯總與匯出
+    # ------------------------------------------------------------------
+    def filter(self, run_id: str = None, ticker: str = None) -> List[LlmCallRecord]:
+        records = self._runs.get(run_id, []) if run_id is not None else self.records
+        return [r for r in records if ticker is None or r.ticker == ticker]
+
+    def summarize(self, group_by: str = "stage", run_id: str = None, ticker: str = None) -> Dict[str, Dict[str, Any]]:
+        """
+        依指定欄位 (stage / agent_name / run_id / ticker) 匯總
+
+        Returns:
+            {group_key: {calls, prompt_tokens, completion_tokens, cached_tokens, duration_ms, cost_usd, ...}}
+        """
+        summary: Dict[str, Dict[str, Any]] = {}
+        for r in self.filter(run_id=run_id, ticker=ticker):
+            key = getattr(r, group_by)
+            s = summary.setdefault(key, {
+                "calls": 0, "retries": 0, "errors": 0, "cache_hits": 0, "estimated_calls": 0,
+                "prompt_tokens": 0, "completion_tokens": 0, "cached_tokens": 0,
+                "duration_ms": 0.0, "ttft_ms_max": 0.0, "cost_usd": 0.0,
+            })
+            s["calls"] += 1
+            s["retries"] += 1 if r.attempt > 1 else 0
+            s["errors"] += 0 if r.success else 1
+            s["cache_hits"] += 1 if r.cache_hit else 0
+            s["estimated_calls"] += 1 if r.usage_estimated else 0
+            s["prompt_tokens"] += r.prompt_tokens
+            s["completion_tokens"] += r.completion_tokens
+            s["cached_tokens"] += r.cached_tokens
+            s["duration_ms"] += r.duration_ms
+            s["ttft_ms_max"] = max(s["ttft_ms_max"], r.ttft_ms or 0.0)
+            s["cost_usd"] += r.cost_usd
+        for s in summary.values():
+            s["cache_ratio"] = round(s["cached_tokens"] / s["prompt_tokens"], 3) if s["prompt_tokens"] else 0.0
+            s["cost_usd"] = round(s["cost_usd"], 6)
+        return summary
+
+    def export_jsonl(self, path, run_id: str = None) -> Path:
+        """將記錄匯出為 JSONL (每行一次呼叫)"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        with open(path, "a", encoding="utf-8") as f:
+            for r in self.filter(run_id=run_id):
+                f.write(json.dumps(asdict(r), ensure_ascii=False) + "\n")
+        return path
+
+    def format_summary_table(self, group_by: str = "stage", run_id: str = None, ticker: str = None) -> str:
+        """產生 Markdown 表格形式的匯總"""
+        summary = self.summarize(group_by=group_by, run_id=run_id, ticker=ticker)
+        lines = [
+            f"| {group_by} | calls | retries | prompt | completion | cached | cache% | duration(s) | max TTFT(ms) | cost(USD) |",
+            "|---|---|---|---|---|---|---|---|---|---|",
+        ]
+        totals = {"calls": 0, "retries": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                  "cached_tokens": 0, "duration_ms": 0.0, "cost_usd": 0.0}
+        for key, s in sorted(summary.items(), key=lambda kv: -kv[1]["cost_usd"]):
+            lines.append(
+                f"| {key} | {s['calls']} | {s['retries']} | {s['prompt_tokens']:,} | {s['completion_tokens']:,} | "
+                f"{s['cached_tokens']:,} | {s['cache_ratio']:.0%} | {s['duration_ms'] / 1000:.1f} | "
+                f"{s['ttft_ms_max']:.0f} | {s['cost_usd']:.4f} |"
+            )
+            for k in totals:
+                totals[k] += s[k]
+        cache_ratio = totals["cached_tokens"] / totals["prompt_tokens"] if totals["prompt_tokens"] else 0.0
+        lines.append(
+            f"| **Total** | {totals['calls']} | {totals['retries']} | {totals['prompt_tokens']:,} | "
+            f"{totals['completion_tokens']:,} | {totals['cached_tokens']:,} | {cache_ratio:.0%} | "
+            f"{totals['duration_ms'] / 1000:.1f} | - | {totals['cost_usd']:.4f} |"
+        )
+        return "\n".join(lines)
+
+
+# 全域 ledger 實例
+_llm_ledger = None
+
+
+def get_llm_ledger() -> LlmUsageLedger:
+    """取得全域 LLM Ledger"""
+    global _llm_ledger
+    if _llm_ledger is None:
+        _llm_ledger = LlmUsageLedger(
+            max_records=int(os.getenv("LLM_LEDGER_MAX_RECORDS", str(DEFAULT_MAX_RECORDS))),
+        )
+    return _llm_ledger
@@ -0,0 +1,219 @@
+"""
+LLM 回覆快取 - 以 (model, system prompt hash, user prompt hash) 為 key 的磁碟快取
+
+預設關閉，透過環境變數開啟：
+    LLM_CACHE_MODE=readwrite   # off | readwrite | readonly | offline
+    LLM_CACHE_DIR=...          # 預設 my_agent/.adk/llm_cache
+    LLM_CACHE_TTL=86400        # 秒，0 表示永不過期
+    LLM_CACHE_MAX_ENTRIES=2000
+    LLM_CACHE_MAX_MB=200
+    LLM_CACHE_BYPASS=1         # 暫時略過快取 (不讀也不寫)
+
+offline 模式只讀快取，未命中時拋出 LlmCacheMiss，可讓測試中的流水線完全離線且結果固定。
+"""
+import os
+import json
+import time
+import hashlib
+import contextvars
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Dict, Optional
+
+
+CACHE_MODES = ("off", "readwrite", "readonly", "offline")
+
+
+class LlmCacheMiss(RuntimeError):
+    """offline 模式下快取未命中"""
+
+
+# 以 ContextVar 控制單次呼叫是否略過快取 (例如：強制重新產生某個 stage)
+_bypass: contextvars.ContextVar[bool] = contextvars.ContextVar("llm_cache_bypass", default=False)
+
+
+@contextmanager
+def bypass_llm_cache():
+    """在此區塊內的 LLM 呼叫略過快取"""
+    token = _bypass.set(True)
+    try:
+        yield
+    finally:
+        _bypass.reset(token)
+
+
+def _sha256(text: str) -> str:
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class LlmResponseCache:
+    """磁碟上的 LLM 回覆快取 (每個 key 一個 JSON 檔，以 mtime 實作 LRU)"""
+
+    def __init__(
+        self,
+        cache_dir: str = None,
+        mode: str = "off",
+        ttl_seconds: float = 86400,
+        max_entries: int = 2000,
+        max_bytes: int = 200 * 1024 * 1024,
+    ):
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown LLM cache mode: {mode} (expected one of {CACHE_MODES})")
+
+        if cache_dir is None:
+            cache_dir = Path(__file__).parent / ".adk" / "llm_cache"
+
+        self.cache_dir = Path(cache_dir)
+        self.mode = mode
+        self.ttl_seconds = ttl_seconds
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+        if self.enabled:
+            self.cache_dir.mkdir(parents=True, exist_ok=True)
+            print(f"✓ LLM response cache enabled ({self.mode}): {self.cache_dir}/")
+
+    @property
+    def enabled(self) -> bool:
+        return self.mode != "off"
+
+    @property
+    def bypassed(self) -> bool:
+        return _bypass.get() or os.getenv("LLM_CACHE_BYPASS", "") not in ("", "0", "false")
+
+    @staticmethod
+    def make_key(model: str, system_prompt: str, user_prompt: str, variant: str = "") -> str:
+        """
+        產生快取 key
+
+        system prompt 已包含完整的 instruction bundle，因此其雜湊即代表指令版本；
+        variant 用於區分同一 prompt 的不同呼叫方式 (例如提前中止的串流驗證)。
+        """
+        parts = [model, _sha256(system_prompt or ""), _sha256(user_prompt or ""), variant]
+        return _sha256("\n".join(parts))
+
+    def _path(self, key: str) -> Path:
+        return self.cache_dir / f"{key}.json"
+
+    # ------------------------------------------------------------------
+    # 讀寫
+    # ------------------------------------------------------------------
+    def get(self, key: str) -> Optional[str]:
+        """讀取快取，未命中回傳 None (offline 模式拋出 LlmCacheMiss)"""
+        if not self.enabled or self.bypassed:
+            return None
+
+        path = self._path(key)
+        text = None
+        try:
+            stat = path.stat()
+            if self.ttl_seconds and time.time() - stat.st_mtime > self.ttl_seconds and self.mode != "offline":
+                path.unlink(missing_ok=True)
+            else:
+                with open(path, "r", encoding="utf-8") as f:
+                    text = json.load(f).get("response_text")
+                # 更新 mtime 作為 LRU 的最近使用時間
+                os.utime(path, None)
+        except FileNotFoundError:
+            pass
+        except Exception as e:
+            print(f"⚠️ Failed to read LLM cache entry {path.name}: {e}")
+
+        if text is None:
+            self.misses += 1
+            if self.mode == "offline":
+                raise LlmCacheMiss(f"LLM cache miss in offline mode (key={key[:12]})")
+            return None
+
+        self.hits += 1
+        return text
+
+    def put(self, key: str, response_text: str, metadata: Dict[str, Any] = None):
+        """寫入快取 (原子寫入：先寫暫存檔再 rename)"""
+        if self.mode != "readwrite" or self.bypassed or not response_text:
+            return
+
+        entry = {
+            "key": key,
+            "created_at": time.time(),
+            "response_text": response_text,
+            **(metadata or {}),
+        }
+        path = self._path(key)
+        tmp_path = path.with_suffix(f".tmp{os.getpid()}")
+        try:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+            self.writes += 1
+            self._evict()
+        except Exception as e:
+            print(f"⚠️ Failed to write LLM cache entry {path.name}: {e}")
+            tmp_path.unlink(missing_ok=True)
+
+    def _evict(self):
+        """依 LRU 淘汰超過筆數或容量上限的項目"""
+        entries = []
+        total_bytes = 0
+        for p in self.cache_dir.glob("*.json"):
+            try:
+                stat = p.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, p))
+            total_bytes += stat.st_size
+
+        if len(entries) <= self.max_entries and total_bytes <= self.max_bytes:
+            return
+
+        entries.sort()  # 最久未使用的排最前面
+        while entries and (len(entries) > self.max_entries or total_bytes > self.max_bytes):
+            _, size, p = entries.pop(0)
+            p.unlink(missing_ok=True)
+            total_bytes -= size
+            self.evictions += 1
+
+    def clear(self):
+        """清除所有快取項目"""
+        for p in self.cache_dir.glob("*.json"):
+            p.unlink(missing_ok=True)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "mode": self.mode,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+
+
+# 全域 cache 實例
+_llm_response_cache = None
+
+
+def get_llm_response_cache() -> LlmResponseCache:
+    """取得全域 LLM 回覆快取 (依環境變數設定)"""
+    global _llm_response_cache
+    if _llm_response_cache is None:
+        _llm_response_cache = LlmResponseCache(
+            cache_dir=os.getenv("LLM_CACHE_DIR") or None,
+            mode=os.getenv("LLM_CACHE_MODE", "off").lower(),
+            ttl_seconds=float(os.getenv("LLM_CACHE_TTL", "86400")),
+            max_entries=int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2000")),
+            max_bytes=int(float(os.getenv("LLM_CACHE_MAX_MB", "200")) * 1024 * 1024),
+        )
+    return _llm_response_cache
+
+
+def set_llm_response_cache(cache: LlmResponseCache):
+    """替換全域快取 (測試時可指向固定的快取目錄並使用 offline 模式)"""
+    global _llm_response_cache
+    _llm_response_cache = cache
@@ -0,0 +1,342 @@
+"""
+LLM 呼叫排程器 - 在所有模型呼叫前套用全行程共用的 RPM / TPM Token Bucket
+
+多份報告同時執行時，stage agents、validator 與 corrector 都打同一個 Azure 部署，
+沒有協調就會觸發 429，LiteLLM 的重試又會浪費數分鐘。排程器在送出請求前先排隊：
+
+- RPM / TPM 兩個 Token Bucket (TPM 以估計的 prompt tokens + max_output_tokens 扣除，與 Azure 的計算方式一致)
+- 互動式 Session 優先於批次工作 (priority_scope("batch"))
+- 回應後以實際用量回補 / 追扣 TPM；遇到 429 時暫停所有請求直到 retry-after
+- stats() 提供排隊深度與等待時間
+
+預設關閉，透過環境變數開啟：
+    AZURE_OPENAI_RPM=300
+    AZURE_OPENAI_TPM=50000
+"""
+import os
+import json
+import time
+import heapq
+import asyncio
+import itertools
+import contextvars
+from collections import deque
+from contextlib import contextmanager
+from typing import Any, Dict, Optional
+
+
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BATCH = 10
+
+PRIORITY_NAMES = {
+    "interactive": PRIORITY_INTERACTIVE,
+    "batch": PRIORITY_BATCH,
+}
+
+# Azure 以 10 秒為單位檢查用量，Bucket 容量取 10 秒的額度避免瞬間爆量
+BURST_SECONDS = 10
+
+DEFAULT_MAX_OUTPUT_TOKENS = 4096
+
+
+# 當前呼叫的優先順序 (數字越小越優先)，預設為互動式
+_priority: contextvars.ContextVar[int] = contextvars.ContextVar("llm_scheduler_priority", default=PRIORITY_INTERACTIVE)
+
+
+@contextmanager
+def priority_scope(priority):
+    """
+    在此區塊內的 LLM 呼叫使用指定優先順序
+
+    Usage:
+        with priority_scope("batch"):
+            await run_analysis_pipeline(...)
+    """
+    if isinstance(priority, str):
+        priority = PRIORITY_NAMES[priority]
+    token = _priority.set(priority)
+    try:
+        yield
+    finally:
+        _priority.reset(token)
+
+
+def _priority_name(priority: int) -> str:
+    for name, value in PRIORITY_NAMES.items():
+        if value == priority:
+            return name
+    return str(priority)
+
+
+def estimate_tokens(text: str) -> int:
+    """粗估 Token 數：CJK 字元約 1 token / 字，其餘約 4 字元 / token"""
+    if not text:
+        return 0
+    cjk = sum(1 for ch in text if "\u2e80" <= ch <= "\u9fff" or "\uf900" <= ch <= "\ufaff")
+    return cjk + (len(text) - cjk) // 4 + 1
+
+
+def estimate_request_tokens(llm_request) -> int:
+    """估計 ADK LlmRequest 的 Token 用量 (system instruction + 對話內容 + 工具 Schema + 輸出上限)"""
+    texts = []
+    config = getattr(llm_request, "config", None)
+    if config is not None and config.system_instruction:
+        texts.append(str(config.system_instruction))
+    for content in getattr(llm_request, "contents", None) or []:
+        for part in content.parts or []:
+            if part.text:
+                texts.append(part.text)
+            elif part.function_call:
+                texts.append(json.dumps(part.function_call.args or {}, ensure_ascii=False, default=str))
+            elif part.function_response:
+                texts.append(json.dumps(part.function_response.response or {}, ensure_ascii=False, default=str))
+    if config is not None:
+        for tool in config.tools or []:
+            texts.append(str(tool))
+
+    max_output = (getattr(config, "max_output_tokens", None) if config is not None else None) or DEFAULT_MAX_OUTPUT_TOKENS
+    return sum(estimate_tokens(t) for t in texts) + max_output
+
+
+class TokenBucket:
+    """以每分鐘速率持續補充的 Token Bucket (允許短暫透支，之後由補充速率攤還)"""
+
+    def __init__(self, rate_per_minute: float, burst_seconds: float = BURST_SECONDS):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = max(rate_per_minute * burst_seconds / 60.0, 1.0)
+        self.tokens = self.capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float):
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def time_until(self, amount: float, now: float) -> float:
+        """距離可扣除 amount 所需的秒數 (超過容量的請求視為需要整個 Bucket)"""
+        self._refill(now)
+        amount = min(amount, self.capacity)
+        if self.tokens >= amount:
+            return 0.0
+        return (amount - self.tokens) / self.rate
+
+    def debit_for(self, amount: float) -> float:
+        """consume 實際扣除的數量 (超過容量的請求只扣整個 Bucket，其餘由 record_usage 追扣)"""
+        return min(amount, self.capacity)
+
+    def consume(self, amount: float) -> float:
+        debited = self.debit_for(amount)
+        self.tokens -= debited
+        return debited
+
+    def adjust(self, delta: float):
+        """依實際用量修正 (正數回補、負數追扣)"""
+        self.tokens = min(self.capacity, self.tokens + delta)
+
+
+class _Waiter:
+    __slots__ = ("future", "tokens", "priority", "enqueued_at")
+
+    def __init__(self, future: asyncio.Future, tokens: int, priority: int):
+        self.future = future
+        self.tokens = tokens
+        self.priority = priority
+        self.enqueued_at = time.monotonic()
+
+
+class LlmScheduler:
+    """全行程共用的 LLM 呼叫排程器 (依優先順序排隊，RPM / TPM 同時滿足才放行)"""
+
+    def __init__(self, rpm: float = 0, tpm: float = 0, history: int = 1000):
+        self.request_bucket = TokenBucket(rpm) if rpm else None
+        self.token_bucket = TokenBucket(tpm) if tpm else None
+
+        self._heap = []
+        self._seq = itertools.count()
+        self._wakeup: Optional[asyncio.TimerHandle] = None
+        self._paused_until = 0.0
+
+        self.max_queue_depth = 0
+        self.rate_limited = 0
+        self._granted: Dict[str, int] = {}
+        self._wait_ms_total: Dict[str, float] = {}
+        self._recent_waits: Dict[str, deque] = {}
+        self._history = history
+
+        if self.enabled:
+            print(f"✓ LLM scheduler enabled (RPM={rpm or '∞'}, TPM={tpm or '∞'})")
+
+    @property
+    def enabled(self) -> bool:
+        return self.request_bucket is not None or self.token_bucket is not None
+
+    @property
+    def queue_depth(self) -> int:
+        return sum(1 for _, _, w in self._heap if not w.future.done())
+
+    # ------------------------------------------------------------------
+    # 排隊與放行
+    # ------------------------------------------------------------------
+    async def acquire(self, estimated_tokens: int, priority: int = None) -> float:
+        """
+        等待直到 RPM / TPM 額度足夠
+
+        Returns:
+            排隊等待時間 (毫秒)
+        """
+        if not self.enabled:
+            return 0.0
+
+        priority = _priority.get() if priority is None else priority
+        waiter = _Waiter(asyncio.get_running_loop().create_future(), estimated_tokens, priority)
+        heapq.heappush(self._heap, (priority, next(self._seq), waiter))
+        self.max_queue_depth = max(self.max_queue_depth, len(self._heap))
+        self._dispatch()
+
+        await waiter.future
+
+        wait_ms = (time.monotonic() - waiter.enqueued_at) * 1000
+        name = _priority_name(priority)
+        self._granted[name] = self._granted.get(name, 0) + 1
+        self._wait_ms_total[name] = self._wait_ms_total.get(name, 0.0) + wait_ms
+        self._recent_waits.setdefault(name, deque(maxlen=self._history)).append(wait_ms)
+        return wait_ms
+
+    def _dispatch(self):
+        """依優先順序放行佇列前端的請求；額度不足時排程在可放行的時間點再檢查"""
+        if self._wakeup is not None:
+            self._wakeup.cancel()
+            self._wakeup = None
+
+        now = time.monotonic()
+        while self._heap:
+            _, _, waiter = self._heap[0]
+            if waiter.future.done():  # 已取消
+                heapq.heappop(self._heap)
+                continue
+
+            delay = max(
+                self._paused_until - now,
+                self.request_bucket.time_until(1, now) if self.request_bucket else 0.0,
+                self.token_bucket.time_until(waiter.tokens, now) if self.token_bucket else 0.0,
+            )
+            if delay > 0:
+                self._wakeup = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+
+            heapq.heappop(self._heap)
+            if self.request_bucket:
+                self.request_bucket.consume(1)
+            if self.token_bucket:
+                self.token_bucket.consume(waiter.tokens)
+            waiter.future.set_result(None)
+
+    def record_usage(self, estimated_tokens: int, actual_tokens: int):
+        """
+        回應後以實際用量修正 TPM (估計過多時回補，不足時追扣)
+
+        以 consume 實際扣除的數量對帳：大型請求放行時只扣了 capacity，差額在此追扣 (允許透支，由補充速率攤還)。
+        失敗的呼叫傳入 actual_tokens=0，全數退回放行時扣除的額度。
+        """
+        if self.token_bucket:
+            self.token_bucket.adjust(self.token_bucket.debit_for(estimated_tokens) - actual_tokens)
+
+    def report_rate_limited(self, retry_after: float = None):
+        """收到 429 時暫停所有請求 (預設 10 秒)"""
+        self.rate_limited += 1
+        self._paused_until = max(self._paused_until, time.monotonic() + (retry_after or BURST_SECONDS))
+
+    # ------------------------------------------------------------------
+    # 指標
+    # ------------------------------------------------------------------
+    def stats(self) -> Dict[str, Any]:
+        waits = {}
+        for name, recent in self._recent_waits.items():
+            ordered = sorted(recent)
+            waits[name] = {
+                "granted": self._granted.get(name, 0),
+                "avg_wait_ms": round(self._wait_ms_total[name] / self._granted[name], 1),
+                "p50_wait_ms": round(ordered[len(ordered) // 2], 1),
+                "p95_wait_ms": round(ordered[int(0.95 * (len(ordered) - 1))], 1),
+                "max_wait_ms": round(ordered[-1], 1),
+            }
+        return {
+            "enabled": self.enabled,
+            "queue_depth": self.queue_depth,
+            "max_queue_depth": self.max_queue_depth,
+            "rate_limited": self.rate_limited,
+            "waits": waits,
+        }
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """判斷是否為 429 (LiteLLM RateLimitError 或訊息含 429)"""
+    return type(error).__name__ == "RateLimitError" or "429" in str(error)
+
+
+# 全域 scheduler 實例
+_llm_scheduler = None
+
+
+def get_llm_scheduler() -> LlmScheduler:
+    """取得全域 LLM 排程器 (依環境變數設定)"""
+    global _llm_scheduler
+    if _llm_scheduler is None:
+        _llm_scheduler = LlmScheduler(
+            rpm=float(os.getenv("AZURE_OPENAI_RPM", "0")),
+            tpm=float(os.getenv("AZURE_OPENAI_TPM", "0")),
+        )
+    return _llm_scheduler
+
+
+# ============================================================================
+# ADK Agent Callbacks
+# ============================================================================
+
+# (invocation_id, agent_name) -> (估計的 Token 數, 放行時間)，供 after_model_callback 以實際用量修正
+_pending_estimates: Dict[tuple, tuple] = {}
+# 超過此秒數仍未對帳的項目 (例如呼叫被取消、沒有觸發任何 callback) 視為遺失並清除
+PENDING_ESTIMATE_TTL = 600.0
+
+
+def _purge_stale_estimates(now: float):
+    for key in [k for k, (_, granted_at) in _pending_estimates.items() if now - granted_at > PENDING_ESTIMATE_TTL]:
+        _pending_estimates.pop(key, None)
+
+
+async def schedule_before_model(callback_context, llm_request):
+    """before_model_callback：ADK Agent 的模型呼叫前先經過排程器"""
+    scheduler = get_llm_scheduler()
+    if not scheduler.enabled:
+        return None
+
+    estimated = estimate_request_tokens(llm_request)
+    wait_ms = await scheduler.acquire(estimated)
+    now = time.monotonic()
+    _purge_stale_estimates(now)
+    _pending_estimates[(callback_context.invocation_id, callback_context.agent_name)] = (estimated, now)
+    if wait_ms > 1000:
+        print(f"⏳ [LLM Scheduler] {callback_context.agent_name} waited {wait_ms / 1000:.1f}s")
+    return None
+
+
+def schedule_after_model(callback_context, llm_response):
+    """after_model_callback：以實際 Token 用量修正 TPM"""
+    usage = getattr(llm_response, "usage_metadata", None)
+    if usage is None:
+        return None  # 串流的中間片段沒有用量資訊
+    pending = _pending_estimates.pop((callback_context.invocation_id, callback_context.agent_name), None)
+    if pending is not None:
+        actual = (usage.prompt_token_count or 0) + (usage.candidates_token_count or 0)
+        get_llm_scheduler().record_usage(pending[0], actual)
+    return None
+
+
+def schedule_on_model_error(callback_context, llm_request, error):
+    """on_model_error_callback：退回未對帳的估計值；429 時讓排程器暫停放行 (回傳 None，錯誤照常拋出)"""
+    pending = _pending_estimates.pop((callback_context.invocation_id, callback_context.agent_name), None)
+    if pending is not None:
+        get_llm_scheduler().record_usage(pending[0], 0)
+    if is_rate_limit_error(error):
+        print(f"🚦 [LLM Scheduler] {callback_context.agent_name} rate limited, pausing dispatch")
+        get_llm_scheduler().report_rate_limited()
+    return None
@@ -0,0 +1,389 @@
+"""
+MCP Log 統計 - 以串流方式彙整 mcp_logs/ 的工具呼叫記錄
+
+- 每個工具 / 每個 ticker 的呼叫次數、錯誤率、快取命中、延遲分位數與回覆大小
+- 分位數使用可合併的對數分桶 sketch (相對誤差約 1%)，記憶體用量與記錄筆數無關
+- Log 來源以 LogSource 抽象：目前支援目錄 (含 .jsonl.gz 封存檔)，之後的封存 / 資料庫後端只需實作
+  iter_shards() 與 read_shard()，並以 register_log_source() 註冊
+- 各 shard 在多個行程中平行處理，各自產生部分統計後於主行程合併
+
+Usage:
+    stats = collect_stats(open_log_source("my_agent/mcp_logs"), since=parse_time("7d"))
+    stats.to_dict()
+"""
+import os
+import gzip
+import json
+import math
+import re
+from concurrent.futures import ProcessPoolExecutor, FIRST_COMPLETED, wait
+from datetime import datetime, timedelta
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional
+
+# 檔名結尾的時間戳記 (..._{YYYYMMDD}_{HHMMSS}.jsonl)，用來在不開檔的情況下略過時間範圍外的檔案
+_FILENAME_STAMP = re.compile(r"_(\d{8})_(\d{6})\.jsonl(?:\.gz)?$")
+
+
+# ============================================================================
+# 可合併的統計結構
+# ============================================================================
+
+class QuantileSketch:
+    """對數分桶的分位數 sketch (DDSketch 形式)：固定相對誤差、可合併、桶數只與數值範圍有關"""
+
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.relative_accuracy = relative_accuracy
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self._log_gamma = math.log(self.gamma)
+        self.buckets: Dict[int, int] = {}
+        self.zero_count = 0
+        self.count = 0
+        self.total = 0.0
+        self.min = math.inf
+        self.max = -math.inf
+
+    def add(self, value: float):
+        self.count += 1
+        self.total += value
+        self.min = min(self.min, value)
+        self.max = max(self.max, value)
+        if value <= 1e-9:
+            self.zero_count += 1
+            return
+        key = math.ceil(math.log(value) / self._log_gamma)
+        self.buckets[key] = self.buckets.get(key, 0) + 1
+
+    def merge(self, other: "QuantileSketch"):
+        self.count += other.count
+        self.total += other.total
+        self.min = min(self.min, other.min)
+        self.max = max(self.max, other.max)
+        self.zero_count += other.zero_count
+        for key, count in other.buckets.items():
+            self.buckets[key] = self.buckets.get(key, 0) + count
+
+    def quantile(self, q: float) -> Optional[float]:
+        if self.count == 0:
+            return None
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                estimate = 2 * self.gamma ** key / (self.gamma + 1)
+                return min(max(estimate, self.min), self.max)
+        return self.max
+
+    @property
+    def mean(self) -> Optional[float]:
+        return self.total / self.count if self.count else None
+
+
+class ToolStats:
+    """一組記錄 (某工具、某 ticker 或全部) 的統計"""
+
+    def __init__(self):
+        self.calls = 0
+        self.errors = 0
+        self.cache_hits = 0
+        self.first_seen: Optional[str] = None
+        self.last_seen: Optional[str] = None
+        self.latency_ms = QuantileSketch()
+        self.payload_bytes = QuantileSketch()
+
+    def add(self, record: Dict[str, Any], size: int):
+        self.calls += 1
+        if not record.get("success", True):
+            self.errors += 1
+        if record.get("cache_hit"):
+            self.cache_hits += 1
+        duration = record.get("duration_ms")
+        if isinstance(duration, (int, float)):
+            self.latency_ms.add(float(duration))
+        self.payload_bytes.add(size)
+        timestamp = record.get("timestamp")
+        if isinstance(timestamp, str):
+            if self.first_seen is None or timestamp < self.first_seen:
+                self.first_seen = timestamp
+            if self.last_seen is None or timestamp > self.last_seen:
+                self.last_seen = timestamp
+
+    def merge(self, other: "ToolStats"):
+        self.calls += other.calls
+        self.errors += other.errors
+        self.cache_hits += other.cache_hits
+        self.latency_ms.merge(other.latency_ms)
+        self.payload_bytes.merge(other.payload_bytes)
+        for seen in (other.first_seen, other.last_seen):
+            if seen is None:
+                continue
+            if self.first_seen is None or seen < self.first_seen:
+                self.first_seen = seen
+            if self.last_seen is None or seen > self.last_seen:
+                self.last_seen = seen
+
+    def to_dict(self) -> Dict[str, Any]:
+        def ms(value):
+            return round(value, 1) if value is not None else None
+
+        return {
+            "calls": self.calls,
+            "errors": self.errors,
+            "error_rate": round(self.errors / self.calls, 4) if self.calls else 0.0,
+            "cache_hit_rate": round(self.cache_hits / self.calls, 4) if self.calls else 0.0,
+            "latency_p50_ms": ms(self.latency_ms.quantile(0.50)),
+            "latency_p95_ms": ms(self.latency_ms.quantile(0.95)),
+            "latency_p99_ms": ms(self.latency_ms.quantile(0.99)),
+            "latency_mean_ms": ms(self.latency_ms.mean),
+            "latency_max_ms": ms(self.latency_ms.max if self.latency_ms.count else None),
+            "bytes_total": int(self.payload_bytes.total),
+            "bytes_mean": int(self.payload_bytes.mean or 0),
+            "bytes_p95": int(self.payload_bytes.quantile(0.95) or 0),
+            "bytes_max": int(self.payload_bytes.max if self.payload_bytes.count else 0),
+            "first_seen": self.first_seen,
+            "last_seen": self.last_seen,
+        }
+
+
+class LogStats:
+    """整體、各工具與各 ticker 的統計 (可合併，供平行處理後彙整)"""
+
+    def __init__(self):
+        self.overall = ToolStats()
+        self.by_tool: Dict[str, ToolStats] = {}
+        self.by_ticker: Dict[str, ToolStats] = {}
+        self.files = 0
+        self.records = 0
+        self.bad_lines = 0
+
+    def add(self, record: Dict[str, Any], size: int):
+        self.records += 1
+        self.overall.add(record, size)
+        tool = str(record.get("tool_name") or "unknown")
+        ticker = str(record.get("ticker") or "unknown")
+        self.by_tool.setdefault(tool, ToolStats()).add(record, size)
+        self.by_ticker.setdefault(ticker, ToolStats()).add(record, size)
+
+    def merge(self, other: "LogStats"):
+        self.files += other.files
+        self.records += other.records
+        self.bad_lines += other.bad_lines
+        self.overall.merge(other.overall)
+        for mine, theirs in ((self.by_tool, other.by_tool), (self.by_ticker, other.by_ticker)):
+            for key, stats in theirs.items():
+                mine.setdefault(key, ToolStats()).merge(stats)
+
+    def to_dict(self, sort_by: str = "calls", top: int = None) -> Dict[str, Any]:
+        def ranked(groups: Dict[str, ToolStats]) -> Dict[str, Dict[str, Any]]:
+            rows = sorted(((k, v.to_dict()) for k, v in groups.items()),
+                          key=lambda kv: kv[1].get(sort_by) or 0, reverse=True)
+            return dict(rows[:top] if top else rows)
+
+        return {
+            "files": self.files,
+            "records": self.records,
+            "bad_lines": self.bad_lines,
+            "overall": self.overall.to_dict(),
+            "by_tool": ranked(self.by_tool),
+            "by_ticker": ranked(self.by_ticker),
+        }
+
+    def to_rows(self, sort_by: str = "calls", top: int = None) -> List[Dict[str, Any]]:
+        """攤平成 CSV 列：group (overall / tool / ticker)、key 與各統計欄位"""
+        data = self.to_dict(sort_by, top)
+        rows = [{"group": "overall", "key": "*", **data["overall"]}]
+        for group, field in (("tool", "by_tool"), ("ticker", "by_ticker")):
+            rows.extend({"group": group, "key": key, **values} for key, values in data[field].items())
+        return rows
+
+
+# ============================================================================
+# Log 來源
+# ============================================================================
+
+class LogSource:
+    """Log 來源：將記錄切成可獨立處理的 shard (必須可 pickle，供子行程讀取)"""
+
+    def iter_shards(self, since: datetime = None, until: datetime = None) -> Iterator[Any]:
+        raise NotImplementedError
+
+    def read_shard(self, shard: Any) -> Iterator[tuple]:
+        """逐筆產生 (record, size_bytes)；無法解析的行產生 (None, size)"""
+        raise NotImplementedError
+
+
+class DirectoryLogSource(LogSource):
+    """mcp_logs 目錄 (ticker 子目錄 + 根目錄的舊格式檔案)，每個 .jsonl / .jsonl.gz 為一個 shard"""
+
+    def __init__(self, root):
+        self.root = Path(root)
+
+    def iter_shards(self, since: datetime = None, until: datetime = None) -> Iterator[str]:
+        if not self.root.exists():
+            return
+        # os.walk 為串流列舉，不會一次載入所有檔名
+        for dirpath, _, filenames in os.walk(self.root):
+            for name in filenames:
+                if not (name.endswith(".jsonl") or name.endswith(".jsonl.gz")):
+                    continue
+                if not _filename_in_window(name, since, until):
+                    continue
+                yield os.path.join(dirpath, name)
+
+    def read_shard(self, shard: str) -> Iterator[tuple]:
+        opener = gzip.open if shard.endswith(".gz") else open
+        with opener(shard, "rb") as f:
+            for line in f:
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    yield json.loads(line), len(line)
+                except ValueError:
+                    yield None, len(line)
+
+
+def _filename_in_window(name: str, since: Optional[datetime], until: Optional[datetime]) -> bool:
+    """依檔名時間戳記粗略篩選；檔案內可能有多筆記錄 (舊格式)，因此 since 只排除早於當天的檔案"""
+    if since is None and until is None:
+        return True
+    match = _FILENAME_STAMP.search(name)
+    if not match:
+        return True
+    try:
+        stamp = datetime.strptime(match.group(1) + match.group(2), "%Y%m%d%H%M%S")
+    except ValueError:
+        return True
+    if until is not None and stamp > until:
+        return False
+    if since is not None and stamp < since - timedelta(days=1):
+        return False
+    return True
+
+
+# 其他後端以 "scheme://..." 指定，例如 register_log_source("sqlite", SqliteLogSource)
+_SOURCE_TYPES: Dict[str, Callable[[str], LogSource]] = {}
+
+
+def register_log_source(scheme: str, factory: Callable[[str], LogSource]):
+    _SOURCE_TYPES[scheme] = factory
+
+
+def open_log_source(location) -> LogSource:
+    """依位置建立 LogSource：'scheme://rest' 使用已註冊的後端，其餘視為目錄"""
+    location = str(location)
+    if "://" in location:
+        scheme, rest = location.split("://", 1)
+        if scheme not in _SOURCE_TYPES:
+            raise ValueError(f"Unknown log source scheme: {scheme} (registered: {sorted(_SOURCE_TYPES)})")
+        return _SOURCE_TYPES[scheme](rest)
+    return DirectoryLogSource(location)
+
+
+# ============================================================================
+# 彙整
+# ============================================================================
+
+def parse_time(value: Optional[str]) -> Optional[datetime]:
+    """解析 ISO 時間或相對時間 (例如 30m、24h、7d、2w 表示現在往前推)"""
+    if not value:
+        return None
+    match = re.fullmatch(r"(\d+(?:\.\d+)?)([mhdw])", value.strip())
+    if match:
+        amount, unit = float(match.group(1)), match.group(2)
+        delta = {"m": timedelta(minutes=amount), "h": timedelta(hours=amount),
+                 "d": timedelta(days=amount), "w": timedelta(weeks=amount)}[unit]
+        return datetime.now() - delta
+    return datetime.fromisoformat(value)
+
+
+def _matches(record: Dict[str, Any], since: Optional[str], until: Optional[str],
+             tools: Optional[frozenset], tickers: Optional[frozenset]) -> bool:
+    if tools is not None and record.get("tool_name") not in tools:
+        return False
+    if tickers is not None and str(record.get("ticker") or "unknown").upper() not in tickers:
+        return False
+    if since is not None or until is not None:
+        timestamp = record.get("timestamp")
+        if not isinstance(timestamp, str):
+            return False
+        # ISO 格式字串可直接比較，不需逐筆轉成 datetime
+        if since is not None and timestamp < since:
+            return False
+        if until is not None and timestamp > until:
+            return False
+    return True
+
+
+def _process_shards(source: LogSource, shards: List[Any], since: Optional[str], until: Optional[str],
+                    tools: Optional[frozenset], tickers: Optional[frozenset]) -> LogStats:
+    """子行程：處理一批 shard，回傳部分統計"""
+    stats = LogStats()
+    for shard in shards:
+        try:
+            for record, size in source.read_shard(shard):
+                if not isinstance(record, dict):
+                    stats.bad_lines += 1
+                    continue
+                if _matches(record, since, until, tools, tickers):
+                    stats.add(record, size)
+        except OSError:
+            continue
+        stats.files += 1
+    return stats
+
+
+def _batched(items: Iterable[Any], size: int) -> Iterator[List[Any]]:
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def collect_stats(
+    source: LogSource,
+    since: datetime = None,
+    until: datetime = None,
+    tools: Iterable[str] = None,
+    tickers: Iterable[str] = None,
+    workers: int = None,
+    batch_size: int = 200,
+) -> LogStats:
+    """
+    平行彙整 source 中的記錄
+
+    shard 以 batch_size 為一批送入行程池，同時最多只有 workers * 2 批在處理中，
+    因此主行程的記憶體用量不隨檔案數量成長。workers=1 時在目前行程處理 (方便除錯)。
+    """
+    since_iso = since.isoformat() if since else None
+    until_iso = until.isoformat() if until else None
+    tool_set = frozenset(tools) if tools else None
+    ticker_set = frozenset(t.upper() for t in tickers) if tickers else None
+    workers = workers or os.cpu_count() or 1
+
+    total = LogStats()
+    batches = _batched(source.iter_shards(since, until), batch_size)
+
+    if workers <= 1:
+        for batch in batches:
+            total.merge(_process_shards(source, batch, since_iso, until_iso, tool_set, ticker_set))
+        return total
+
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        pending = set()
+        for batch in batches:
+            pending.add(pool.submit(_process_shards, source, batch, since_iso, until_iso, tool_set, ticker_set))
+            if len(pending) >= workers * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    total.merge(future.result())
+        for future in pending:
+            total.merge(future.result())
+    return total
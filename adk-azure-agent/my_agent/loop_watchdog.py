@@ -0,0 +1,219 @@
+"""
+Event Loop 卡頓偵測 - 找出在 async 路徑中執行的阻塞 I/O
+
+- Heartbeat：Event Loop 上的協程每 interval 醒來一次，量測實際比預期晚了多少 (Event Loop 延遲)
+- Watchdog：背景執行緒發現 heartbeat 停止超過門檻時，立即擷取 Event Loop 執行緒當下的 stack
+- 歸屬：以 loop_activity / attribute_activity 標記目前 Task 正在執行的工具或階段，
+  卡頓記錄會附上當時 Task 的標籤 (例如 "mcp yf_get_ticker_info"、"Stage 0.5")
+
+預設關閉，透過環境變數開啟：
+    LOOP_WATCHDOG=1
+    LOOP_WATCHDOG_THRESHOLD_MS=200    # 超過此時間視為卡頓並擷取 stack
+    LOOP_WATCHDOG_INTERVAL_MS=50      # heartbeat 間隔
+
+卡頓會以 logger.warning 輸出 (含 stack)，並寫入 metrics：event_loop_lag_seconds、event_loop_stalls_total。
+"""
+import os
+import sys
+import time
+import asyncio
+import logging
+import functools
+import threading
+import traceback
+import contextvars
+import weakref
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, List, Optional, Union
+
+from .metrics import get_metrics
+
+logger = logging.getLogger(__name__)
+
+# 目前 Task 的活動標籤 (巢狀時以 " > " 串接)
+_activity: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("loop_activity", default=None)
+# Task -> 活動標籤；Watchdog 執行緒無法讀取 ContextVar，因此另外以 Task 為 key 保存
+_task_labels: "weakref.WeakKeyDictionary[asyncio.Task, str]" = weakref.WeakKeyDictionary()
+
+
+class LoopWatchdog:
+    """Heartbeat 協程 + Watchdog 執行緒"""
+
+    def __init__(self, enabled: bool = False, threshold_ms: float = 200.0, interval_ms: float = 50.0,
+                 max_records: int = 100, stack_limit: int = 25):
+        self.enabled = enabled
+        self.threshold = threshold_ms / 1000
+        self.interval = interval_ms / 1000
+        self.max_records = max_records
+        self.stack_limit = stack_limit
+        self.stalls: List[Dict[str, Any]] = []
+
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._loop_thread_id: Optional[int] = None
+        self._last_beat = time.monotonic()
+        self._pending: Optional[Dict[str, Any]] = None  # 進行中的卡頓 (已擷取 stack，尚未恢復)
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._heartbeat_task: Optional[asyncio.Task] = None
+
+        metrics = get_metrics()
+        self._lag_histogram = metrics.histogram(
+            "event_loop_lag_seconds", "How late the event loop heartbeat woke up")
+        self._stall_counter = metrics.counter(
+            "event_loop_stalls", "Event loop stalls longer than the watchdog threshold", ["activity"])
+
+    # ------------------------------------------------------------------
+    # 啟動 / 停止
+    # ------------------------------------------------------------------
+    def ensure_started(self):
+        """在目前的 Event Loop 上啟動 heartbeat (已啟動則不動作；需在 Event Loop 內呼叫)"""
+        if not self.enabled:
+            return
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        if self._loop is loop and self._heartbeat_task is not None and not self._heartbeat_task.done():
+            return
+
+        with self._lock:
+            first_start = self._loop is None
+            self._loop = loop
+            self._loop_thread_id = threading.get_ident()
+            self._last_beat = time.monotonic()
+            self._pending = None
+        self._heartbeat_task = loop.create_task(self._heartbeat(), name="loop-watchdog-heartbeat")
+        if first_start:
+            threading.Thread(target=self._watch, name="loop-watchdog", daemon=True).start()
+            print(f"✓ Event loop watchdog enabled (threshold {self.threshold * 1000:.0f}ms)")
+
+    def stop(self):
+        self._stop.set()
+        if self._heartbeat_task is not None:
+            self._heartbeat_task.cancel()
+
+    # ------------------------------------------------------------------
+    # Heartbeat (Event Loop 上)
+    # ------------------------------------------------------------------
+    async def _heartbeat(self):
+        loop = asyncio.get_running_loop()
+        while not self._stop.is_set():
+            expected = loop.time() + self.interval
+            await asyncio.sleep(self.interval)
+            lag = max(loop.time() - expected, 0.0)
+            with self._lock:
+                self._last_beat = time.monotonic()
+                stall, self._pending = self._pending, None
+            self._lag_histogram.observe(lag)
+            if stall is not None:
+                self._record_stall(stall, lag)
+
+    def _record_stall(self, stall: Dict[str, Any], lag: float):
+        stall["blocked_ms"] = round(lag * 1000, 1)
+        self._stall_counter.inc(activity=stall["activity"] or "unknown")
+        self.stalls.append(stall)
+        del self.stalls[:-self.max_records]
+        logger.warning(
+            f"🐢 Event loop blocked for {stall['blocked_ms']:.0f}ms "
+            f"(activity: {stall['activity'] or 'unknown'}, task: {stall['task']})\n"
+            + "".join(stall["stack"])
+        )
+
+    # ------------------------------------------------------------------
+    # Watchdog (背景執行緒)
+    # ------------------------------------------------------------------
+    def _watch(self):
+        while not self._stop.wait(self.interval / 2):
+            with self._lock:
+                if self._pending is not None or self._loop is None:
+                    continue
+                blocked = time.monotonic() - self._last_beat - self.interval
+                if blocked < self.threshold:
+                    continue
+                loop, thread_id = self._loop, self._loop_thread_id
+
+            frame = sys._current_frames().get(thread_id)
+            task = asyncio.current_task(loop)
+            stall = {
+                "timestamp": time.time(),
+                "detected_after_ms": round(blocked * 1000, 1),
+                "activity": _task_labels.get(task) if task is not None else None,
+                "task": task.get_name() if task is not None else None,
+                "stack": traceback.format_stack(frame, limit=self.stack_limit) if frame is not None else [],
+            }
+            with self._lock:
+                # heartbeat 可能在擷取期間恢復，此時放棄這次記錄
+                if time.monotonic() - self._last_beat - self.interval >= self.threshold:
+                    self._pending = stall
+
+
+# 全域 watchdog 實例
+_loop_watchdog = None
+
+
+def get_loop_watchdog() -> LoopWatchdog:
+    """取得全域 Watchdog (依環境變數設定)"""
+    global _loop_watchdog
+    if _loop_watchdog is None:
+        _loop_watchdog = LoopWatchdog(
+            enabled=os.getenv("LOOP_WATCHDOG", "") not in ("", "0", "false"),
+            threshold_ms=float(os.getenv("LOOP_WATCHDOG_THRESHOLD_MS", "200")),
+            interval_ms=float(os.getenv("LOOP_WATCHDOG_INTERVAL_MS", "50")),
+        )
+    return _loop_watchdog
+
+
+# ============================================================================
+# 活動標籤
+# ============================================================================
+
+@contextmanager
+def loop_activity(label: str):
+    """標記目前 Task 正在執行的工作 (卡頓記錄會附上此標籤)；關閉時不做任何事"""
+    watchdog = get_loop_watchdog()
+    if not watchdog.enabled:
+        yield
+        return
+    watchdog.ensure_started()
+
+    parent = _activity.get()
+    full_label = f"{parent} > {label}" if parent else label
+    token = _activity.set(full_label)
+    try:
+        task = asyncio.current_task()
+    except RuntimeError:
+        task = None
+    if task is not None:
+        _task_labels[task] = full_label
+    try:
+        yield
+    finally:
+        _activity.reset(token)
+        if task is not None:
+            if parent:
+                _task_labels[task] = parent
+            else:
+                _task_labels.pop(task, None)
+
+
+def attribute_activity(label: Union[str, Callable[..., str]]):
+    """
+    async 函式的 decorator 版本：label 可為字串，或以函式參數產生標籤的 callable
+
+    Usage:
+        @attribute_activity(lambda agent, *args, **kwargs: f"llm {agent.name}")
+        async def _execute_agent_and_get_text(agent, prompt, ...): ...
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        async def wrapper(*args, **kwargs):
+            if not get_loop_watchdog().enabled:
+                return await fn(*args, **kwargs)
+            try:
+                text = label(*args, **kwargs) if callable(label) else label
+            except Exception:
+                text = fn.__name__
+            with loop_activity(text):
+                return await fn(*args, **kwargs)
+        return wrapper
+    return decorator
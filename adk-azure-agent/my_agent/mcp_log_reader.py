@@ -1,10 +1,50 @@
 """
 MCP Log 讀取工具 - 讀取指定 ticker 的最新 MCP 回覆記錄
 """
+import os
+import re
 import json
+import threading
 from pathlib import Path
 from datetime import datetime
-from typing import Optional, Dict, Any
+from typing import Optional, Dict, Any, List, Callable
+
+# MCP logs 目錄 (測試 / benchmark 可替換)
+LOG_DIR = Path(__file__).parent / "mcp_logs"
+
+
+def parse_mcp_content(raw_response: Any) -> Any:
+    """
+    解析 MCP 回覆 (CallToolResult) 的內容
+
+    優先從 content[0].text 提取，其次為 structuredContent.result；
+    內容為 JSON 時轉為 dict / list，無法解析時回傳原始資料。
+    """
+    parsed_content = None
+
+    if isinstance(raw_response, dict):
+        if 'content' in raw_response and raw_response['content']:
+            # 從 content[0].text 提取
+            content_text = raw_response['content'][0].get('text', '')
+            if content_text:
+                try:
+                    parsed_content = json.loads(content_text)
+                except:
+                    parsed_content = content_text
+        elif 'structuredContent' in raw_response:
+            # 從 structuredContent.result 提取
+            result_text = raw_response['structuredContent'].get('result', '')
+            if result_text:
+                try:
+                    parsed_content = json.loads(result_text)
+                except:
+                    parsed_content = result_text
+
+    # 如果無法解析，就用原始的
+    if parsed_content is None:
+        parsed_content = raw_response
+
+    return parsed_content
 
 
 def read_latest_mcp_response(ticker: str) -> Optional[Dict[str, Any]]:
@@ -19,7 +59,7 @@ def read_latest_mcp_response(ticker: str) -> Optional[Dict[str, Any]]:
         彙整後的 Dict，key 為 tool_name，value 為該工具最新的 response
     """
     # MCP logs 目錄
-    log_dir = Path(__file__).parent / "mcp_logs"
+    log_dir = LOG_DIR
     
     if not log_dir.exists():
         return None
@@ -40,60 +80,244 @@ def read_latest_mcp_response(ticker: str) -> Optional[Dict[str, Any]]:
     if not candidate_files:
         return None
     
-    # 彙整結果的容器
-    aggregated_response = {}
-    
-    # 依時間排序 (舊->新)，確保新的覆蓋舊的
-    sorted_files = sorted(candidate_files)
-    
-    for file_path in sorted_files:
+    return get_log_summary_index().summary(ticker, candidate_files)
+
+
+class McpLogSummaryIndex:
+    """
+    每個 ticker 的 MCP 回覆彙整 (tool_name -> 最新回覆) 預先計算並保存在記憶體
+
+    每個 log 檔只在新增或內容變動 (大小 / 修改時間改變) 時重新解析，
+    其餘呼叫只需列出檔案並比對 stat，不再重讀整個目錄的 JSONL。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # ticker -> (檔案指紋, 彙整結果, {path: (size, mtime_ns, tool_name, parsed_content)})
+        self._summaries: Dict[str, tuple] = {}
+
+    def summary(self, ticker: str, candidate_files: List[Path]) -> Dict[str, Any]:
+        stats = []
+        for file_path in candidate_files:
+            try:
+                stat = file_path.stat()
+            except OSError:
+                continue
+            stats.append((file_path, stat.st_size, stat.st_mtime_ns))
+        # 依時間排序 (舊->新)，確保新的覆蓋舊的
+        stats.sort()
+        fingerprint = tuple(stats)
+
+        with self._lock:
+            cached = self._summaries.get(ticker)
+        if cached and cached[0] == fingerprint:
+            return dict(cached[1])
+
+        # 只保留目前仍存在的檔案，記憶體用量不會隨歷史 log 累積
+        previous_files = cached[2] if cached else {}
+        files = {}
+        aggregated_response = {}
+        for file_path, size, mtime_ns in stats:
+            entry = previous_files.get(file_path)
+            if entry is None or entry[:2] != (size, mtime_ns):
+                entry = (size, mtime_ns) + self._parse_last_entry(file_path)
+            files[file_path] = entry
+            tool_name, parsed_content = entry[2], entry[3]
+            if tool_name:
+                # 存入彙整字典 (Key 為工具名稱，確保每個工具只留最新一份)
+                aggregated_response[tool_name] = parsed_content
+
+        with self._lock:
+            self._summaries[ticker] = (fingerprint, aggregated_response, files)
+        return dict(aggregated_response)
+
+    @staticmethod
+    def _parse_last_entry(file_path: Path) -> tuple:
+        """解析 log 檔最後一行，回傳 (tool_name, parsed_content)；無效時 tool_name 為 None"""
         try:
             with open(file_path, 'r', encoding='utf-8') as f:
                 lines = f.readlines()
-                if not lines:
-                    continue
-                
-                # 解析最後一行的 JSON
-                last_entry = json.loads(lines[-1])
-                tool_name = last_entry.get('tool_name')
-                raw_response = last_entry.get('response')
-                
-                if not tool_name or not raw_response:
-                    continue
-                
-                # 解析 Content
-                parsed_content = None
-                
-                if isinstance(raw_response, dict):
-                    if 'content' in raw_response and raw_response['content']:
-                        # 從 content[0].text 提取
-                        content_text = raw_response['content'][0].get('text', '')
-                        if content_text:
-                            try:
-                                parsed_content = json.loads(content_text)
-                            except:
-                                parsed_content = content_text
-                    elif 'structuredContent' in raw_response:
-                        # 從 structuredContent.result 提取
-                        result_text = raw_response['structuredContent'].get('result', '')
-                        if result_text:
-                            try:
-                                parsed_content = json.loads(result_text)
-                            except:
-                                parsed_content = result_text
-                
-                # 如果無法解析，就用原始的
-                if parsed_content is None:
-                    parsed_content = raw_response
+            if not lines:
+                return None, None
 
-                # 存入彙整字典 (Key 為工具名稱，確保每個工具只留最新一份)
-                aggregated_response[tool_name] = parsed_content
-                
+            # 解析最後一行的 JSON
+            last_entry = json.loads(lines[-1])
+            tool_name = last_entry.get('tool_name')
+            raw_response = last_entry.get('response')
+            if not tool_name or not raw_response:
+                return None, None
+
+            # 解析 Content
+            return tool_name, parse_mcp_content(raw_response)
         except Exception as e:
             print(f"⚠️ Error reading MCP log {file_path}: {e}")
-            continue
+            return None, None
+
+    def clear(self):
+        with self._lock:
+            self._summaries.clear()
+
+
+# 全域彙整索引
+_log_summary_index = None
+
+
+def get_log_summary_index() -> McpLogSummaryIndex:
+    global _log_summary_index
+    if _log_summary_index is None:
+        _log_summary_index = McpLogSummaryIndex()
+    return _log_summary_index
+
+
+# ============================================================================
+# 欄位投影與分頁 (get_mcp_log 工具)
+# ============================================================================
+
+# get_mcp_log 每頁的最大字元數 (約 4 字元 / token)
+DEFAULT_PAGE_CHARS = int(os.getenv("GET_MCP_LOG_PAGE_CHARS", "16000"))
+
+_PATH_TOKEN = re.compile(r"\.?([^.\[\]]+)|\[(\*|-?\d+|-?\d*:-?\d*)\]")
+
+
+def _parse_path(path: str) -> List[tuple]:
+    """解析 JSONPath 風格的欄位路徑，例如 $.news[*].title、news[0:3]、*.currentPrice"""
+    path = path.strip()
+    if path.startswith("$"):
+        path = path[1:]
+    tokens, pos = [], 0
+    while pos < len(path):
+        match = _PATH_TOKEN.match(path, pos)
+        if not match:
+            raise ValueError(f"Invalid field path: {path}")
+        name, bracket = match.groups()
+        if name is not None:
+            tokens.append(("wild",) if name == "*" else ("key", name))
+        elif bracket == "*":
+            tokens.append(("wild",))
+        elif ":" in bracket:
+            start, stop = bracket.split(":")
+            tokens.append(("slice", int(start) if start else None, int(stop) if stop else None))
+        else:
+            tokens.append(("index", int(bracket)))
+        pos = match.end()
+    return tokens
+
+
+def select_path(content: Any, path: str) -> tuple:
+    """
+    依路徑取值
+
+    Returns:
+        (found, value)：路徑含 * 或切片時 value 為所有符合值的 list
+    """
+    tokens = _parse_path(path)
+    values = [content]
+    multi = False
+    for token in tokens:
+        next_values = []
+        for value in values:
+            if token[0] == "key" and isinstance(value, dict) and token[1] in value:
+                next_values.append(value[token[1]])
+            elif token[0] == "index" and isinstance(value, list) and -len(value) <= token[1] < len(value):
+                next_values.append(value[token[1]])
+            elif token[0] == "wild":
+                multi = True
+                if isinstance(value, dict):
+                    next_values.extend(value.values())
+                elif isinstance(value, list):
+                    next_values.extend(value)
+            elif token[0] == "slice" and isinstance(value, list):
+                multi = True
+                next_values.extend(value[token[1]:token[2]])
+        values = next_values
+    if multi:
+        return bool(values), values
+    return bool(values), values[0] if values else None
+
+
+def limit_items(value: Any, max_items: int) -> Any:
+    """遞迴將所有 list 截斷為 max_items 項，並以字串標示省略數量"""
+    if isinstance(value, dict):
+        return {k: limit_items(v, max_items) for k, v in value.items()}
+    if isinstance(value, list):
+        items = [limit_items(v, max_items) for v in value[:max_items]]
+        if len(value) > max_items:
+            items.append(f"... ({len(value) - max_items} more items)")
+        return items
+    return value
+
+
+def query_mcp_log(
+    ticker: str,
+    tools: List[str] = None,
+    fields: List[str] = None,
+    max_items: int = None,
+    cursor: int = 0,
+    page_chars: int = None,
+    transform: Callable[[str, Any], Any] = None,
+) -> str:
+    """
+    以工具篩選、欄位投影、陣列截斷與分頁讀取 ticker 的 MCP 回覆彙整
+
+    Args:
+        ticker: 股票代碼
+        tools: 工具名稱關鍵字 (部分符合即可，例如 "ticker_info")
+        fields: 欄位路徑 (例如 "currentPrice"、"$.news[*].title")，套用到每個工具的回覆
+        max_items: 陣列最多保留的項目數
+        cursor: 從輸出的第幾個字元開始 (上一頁提示的 cursor)
+        page_chars: 每頁最大字元數
+        transform: 投影前套用到每個工具回覆的函式 (tool_name, content) -> content，例如網頁主文擷取
+    """
+    response = read_latest_mcp_response(ticker)
+    if not response:
+        return f"❌ 找不到 {ticker} 的記錄"
+
+    if tools:
+        keywords = [t.lower() for t in tools]
+        response = {name: content for name, content in response.items()
+                    if any(k in name.lower() for k in keywords)}
+        if not response:
+            return f"❌ 找不到 {ticker} 符合 {', '.join(tools)} 的工具記錄 (可用: {', '.join(read_latest_mcp_response(ticker))})"
+
+    if transform is not None:
+        response = {name: transform(name, content) for name, content in response.items()}
+
+    if fields:
+        projected = {}
+        for name, content in response.items():
+            selected = {}
+            for path in fields:
+                found, value = select_path(content, path)
+                if found:
+                    selected[path] = value
+            if selected:
+                projected[name] = selected
+        response = projected
+        if not response:
+            return f"❌ {ticker} 的記錄中沒有欄位 {', '.join(fields)}"
+
+    if max_items is not None and max_items > 0:
+        response = limit_items(response, max_items)
+
+    text = json.dumps(response, ensure_ascii=False, indent=2)
+    page_chars = page_chars or DEFAULT_PAGE_CHARS
+    cursor = max(cursor, 0)
+    if cursor >= len(text):
+        return f"(已無更多內容，總長度 {len(text)} 字元)"
+
+    end = min(cursor + page_chars, len(text))
+    if end < len(text):
+        # 盡量在換行處分頁，避免切斷欄位
+        newline = text.rfind("\n", cursor, end)
+        if newline > cursor:
+            end = newline + 1
+    page = text[cursor:end]
+    if end >= len(text) and cursor == 0:
+        return f"```json\n{page}\n```"
 
-    return aggregated_response
+    footer = (f"\n\n(第 {cursor}-{end} / {len(text)} 字元。"
+              + (f"繼續讀取請以相同參數呼叫 get_mcp_log 並設定 cursor={end})" if end < len(text) else "已是最後一頁)"))
+    return f"```json\n{page}\n```{footer}"
 
 
 def format_mcp_response(response: Dict[str, Any], ticker: str) -> str:
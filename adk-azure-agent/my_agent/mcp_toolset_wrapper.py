@@ -3,10 +3,18 @@ MCP 工具呼叫記錄器 - 攔截實際回覆結果
 """
 import time
 import json
+import contextvars
+from contextlib import contextmanager
 from datetime import datetime
 from pathlib import Path
 from typing import Any
 
+from .shared_cache import get_shared_cache
+from .metrics import get_metrics
+from .tracing import get_tracer
+from .profiling import profile_section
+from .loop_watchdog import attribute_activity
+
 
 class McpCallLogger:
     """記錄 MCP 工具的呼叫參數和回覆結果"""
@@ -29,9 +37,15 @@ class McpCallLogger:
         response: Any,
         success: bool = True,
         error: str = None,
-        duration_ms: float = None
+        duration_ms: float = None,
+        cache_hit: bool = False
     ):
-        """記錄一次 MCP 工具呼叫"""
+        """
+        記錄一次 MCP 工具呼叫 (cache_hit=True 表示回覆來自共用快取)
+
+        Returns:
+            寫入的記錄大小 (bytes)，供 metrics 統計回覆大小
+        """
         # 從 arguments 中提取 ticker（如果有）
         ticker = arguments.get('ticker', arguments.get('symbol'))
 
@@ -71,19 +85,23 @@ class McpCallLogger:
             "response": self._serialize(response),
             "success": success,
             "error": error,
-            "duration_ms": duration_ms
+            "duration_ms": duration_ms,
+            "cache_hit": cache_hit
         }
         
         # 寫入 JSONL 格式
         # 寫入 JSONL 格式
+        line = json.dumps(log_entry, ensure_ascii=False) + '\n'
         with open(log_file, 'a', encoding='utf-8') as f:
-            f.write(json.dumps(log_entry, ensure_ascii=False) + '\n')
+            f.write(line)
             
         # [NEW] 同時輸出到 Terminal 讓用戶確認
         status = "✅" if success else "❌"
-        print(f"{status} [MCP] Call {tool_name} (ticker={ticker})")
+        print(f"{status} [MCP] Call {tool_name} (ticker={ticker}){' [cache]' if cache_hit else ''}")
         if error:
             print(f"      Error: {error}")
+
+        return len(line.encode('utf-8'))
     
     def _serialize(self, obj: Any) -> Any:
         """將物件序列化為 JSON 可處理的格式"""
@@ -106,9 +124,52 @@ class McpCallLogger:
 _mcp_logger = McpCallLogger()
 
 
-# 全域變數用於追蹤最近一次出現的有效 ticker
+# 可放入共用快取的唯讀工具與 TTL (秒)；需以 SHARED_CACHE=1 開啟
+MCP_CACHE_TTLS = {
+    "yf_get_ticker_info": 900,
+    "yf_get_ticker_news": 900,
+    "yf_search": 86400,
+}
+
+
+def _is_cacheable_response(response: Any) -> bool:
+    return isinstance(response, dict) and not response.get("isError")
+
+
+# 全域變數用於追蹤最近一次出現的有效 ticker (未使用 ticker_scope 時的預設上下文)
 _LAST_SEEN_TICKER = "unknown"
 
+# 每個 Session 獨立的 ticker 上下文 (可變的 dict，讓同一 Session 內的平行工具呼叫共用)
+_ticker_context: contextvars.ContextVar[dict] = contextvars.ContextVar("mcp_ticker_context", default=None)
+
+
+@contextmanager
+def ticker_scope(ticker: str = "unknown"):
+    """
+    在此區塊內的 MCP 呼叫使用獨立的「最近 ticker」上下文
+
+    同一行程同時執行多個 Session (例如批次執行) 時，避免 A 股票的 url_fetch 被記錄到 B 股票底下。
+    """
+    token = _ticker_context.set({"ticker": ticker})
+    try:
+        yield
+    finally:
+        _ticker_context.reset(token)
+
+
+def _get_last_seen_ticker() -> str:
+    scope = _ticker_context.get()
+    return scope["ticker"] if scope is not None else _LAST_SEEN_TICKER
+
+
+def _set_last_seen_ticker(ticker: str):
+    global _LAST_SEEN_TICKER
+    scope = _ticker_context.get()
+    if scope is not None:
+        scope["ticker"] = ticker
+    else:
+        _LAST_SEEN_TICKER = ticker
+
 def patch_mcp_tool():
     """
     Monkey patch McpTool:
@@ -122,10 +183,9 @@ def patch_mcp_tool():
     # ------------------------------------------------------------------------
     original_run_async = McpTool.run_async
     
+    @attribute_activity(lambda self, **kwargs: f"mcp {getattr(self, 'name', 'unknown')}")
     async def logged_run_async(self, *, args: dict, tool_context):
         """包裝後的 run_async 方法"""
-        global _LAST_SEEN_TICKER
-        
         start_time = time.time()
         tool_name = getattr(self, 'name', 'unknown')
         
@@ -137,12 +197,12 @@ def patch_mcp_tool():
         current_ticker = log_args.get('ticker', log_args.get('symbol'))
         
         if current_ticker and isinstance(current_ticker, str) and current_ticker.strip():
-            # 如果這次有 ticker，更新全域上下文
-            _LAST_SEEN_TICKER = current_ticker.strip()
-            ticker = _LAST_SEEN_TICKER
+            # 如果這次有 ticker，更新 (Session 或全域) 上下文
+            ticker = current_ticker.strip()
+            _set_last_seen_ticker(ticker)
         else:
             # 如果這次沒有 ticker (例如 url_fetch)，使用最近一次的上下文
-            ticker = _LAST_SEEN_TICKER
+            ticker = _get_last_seen_ticker()
         
         # 將最終決定的 ticker 放回 log_args 以便記錄
         log_args['ticker'] = ticker
@@ -152,20 +212,50 @@ def patch_mcp_tool():
         if 'ticker' in execution_args:
             del execution_args['ticker']
 
+        cache_hit = False
+        cache_used = False
         try:
-            # 呼叫原始方法 (使用淨化過的 args)
-            result = await original_run_async(self, args=execution_args, tool_context=tool_context)
+            with profile_section(f"mcp {tool_name}", ticker=ticker):
+                cache_ttl = MCP_CACHE_TTLS.get(tool_name)
+                shared_cache = get_shared_cache()
+                cache_used = bool(cache_ttl and shared_cache.enabled)
+                if cache_used:
+                    # 同一台主機的其他行程已抓過相同參數時直接使用共用快取
+                    fetched = False
+
+                    async def fetch():
+                        nonlocal fetched
+                        fetched = True
+                        return await original_run_async(self, args=execution_args, tool_context=tool_context)
+
+                    cache_key = f"{tool_name}:{json.dumps(execution_args, ensure_ascii=False, sort_keys=True)}"
+                    result = await shared_cache.get_or_compute_async(
+                        "mcp", cache_key, fetch, ttl_seconds=cache_ttl, should_cache=_is_cacheable_response
+                    )
+                    cache_hit = not fetched
+                else:
+                    # 呼叫原始方法 (使用淨化過的 args)
+                    result = await original_run_async(self, args=execution_args, tool_context=tool_context)
             
             # 計算執行時間
             duration_ms = (time.time() - start_time) * 1000
             
             # 記錄成功呼叫 (使用包含 ticker 的 log_args)
-            _mcp_logger.log_call(
+            payload_bytes = _mcp_logger.log_call(
                 tool_name=tool_name,
                 arguments=log_args,
                 response=result,
                 success=True,
-                duration_ms=duration_ms
+                duration_ms=duration_ms,
+                cache_hit=cache_hit
+            )
+            get_metrics().observe_mcp_call(
+                tool_name, duration_ms, success=True, payload_bytes=payload_bytes,
+                cache_hit=cache_hit if cache_used else None
+            )
+            get_tracer().annotate(
+                ticker=ticker, payload_bytes=payload_bytes, cache_hit=cache_hit,
+                mcp_server=get_metrics().server_for_tool(tool_name)
             )
             
             return result
@@ -183,6 +273,7 @@ def patch_mcp_tool():
                 error=str(e),
                 duration_ms=duration_ms
             )
+            get_metrics().observe_mcp_call(tool_name, duration_ms, success=False)
             
             raise
 
@@ -0,0 +1,376 @@
+"""
+行程內 Metrics - MCP 工具 / LLM 呼叫的延遲直方圖、錯誤計數、回覆大小與快取命中率
+
+資料只保存在記憶體 (固定 bucket 的直方圖，不隨呼叫次數成長)，透過以下方式輸出：
+    METRICS_PORT=9464                      # 啟動 HTTP 端點，GET /metrics 回傳 OpenMetrics / Prometheus 文字格式
+    METRICS_SNAPSHOT_PATH=metrics.json     # 定期寫入快照 (含由 bucket 估計的 p50 / p95 / p99)
+    METRICS_SNAPSHOT_INTERVAL=60           # 快照間隔 (秒)
+
+Usage:
+    from my_agent.metrics import get_metrics
+    get_metrics().observe_mcp_call("yf_get_ticker_info", duration_ms=120, success=True, payload_bytes=4096)
+    print(get_metrics().render_openmetrics())
+"""
+import os
+import json
+import time
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence, Tuple
+
+
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+SIZE_BUCKETS = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304)
+
+OPENMETRICS_CONTENT_TYPE = "application/openmetrics-text; version=1.0.0; charset=utf-8"
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(labelnames: Sequence[str], values: Tuple[str, ...], extra: Dict[str, str] = None) -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(labelnames, values)]
+    pairs += [f'{name}="{_escape(value)}"' for name, value in (extra or {}).items()]
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class Counter:
+    """單調遞增計數器 (輸出時名稱加上 _total)"""
+
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [f"{self.name}_total{_format_labels(self.labelnames, k)} {_format_value(v)}" for k, v in items]
+
+    def snapshot(self) -> List[Dict]:
+        with self._lock:
+            items = sorted(self._values.items())
+        return [{"labels": dict(zip(self.labelnames, k)), "value": v} for k, v in items]
+
+
+class Histogram:
+    """固定 bucket 的直方圖 (累積計數，與 Prometheus 相容)"""
+
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # key -> [bucket counts..., sum, count]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(n, "")) for n in self.labelnames)
+        with self._lock:
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(self.buckets) + [0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    state[i] += 1
+                    break
+            state[-2] += value
+            state[-1] += 1
+
+    def _quantile(self, counts: List[int], total: int, q: float) -> float:
+        """由 bucket 線性內插估計分位數 (落在 +Inf bucket 時回傳最後一個有限上界)"""
+        if total == 0:
+            return 0.0
+        rank = q * total
+        cumulative = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets, counts):
+            if cumulative + count >= rank and count:
+                if bound == float("inf"):
+                    return lower
+                return lower + (bound - lower) * (rank - cumulative) / count
+            cumulative += count
+            lower = bound if bound != float("inf") else lower
+        return lower
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        lines = []
+        for key, state in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, state[:len(self.buckets)]):
+                cumulative += count
+                labels = _format_labels(self.labelnames, key, {"le": _format_value(bound)})
+                lines.append(f"{self.name}_bucket{labels} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_count{labels} {state[-1]}")
+            lines.append(f"{self.name}_sum{labels} {_format_value(round(state[-2], 6))}")
+        return lines
+
+    def snapshot(self) -> List[Dict]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self._values.items())
+        result = []
+        for key, state in items:
+            counts, total = state[:len(self.buckets)], state[-1]
+            result.append({
+                "labels": dict(zip(self.labelnames, key)),
+                "count": total,
+                "sum": round(state[-2], 6),
+                "mean": round(state[-2] / total, 6) if total else 0.0,
+                "p50": round(self._quantile(counts, total, 0.50), 6),
+                "p95": round(self._quantile(counts, total, 0.95), 6),
+                "p99": round(self._quantile(counts, total, 0.99), 6),
+            })
+        return result
+
+
+class MetricsRegistry:
+    """集中管理所有 metrics，並提供 MCP / LLM / 快取的記錄方法"""
+
+    def __init__(self):
+        self._metrics: Dict[str, object] = {}
+        self._tool_servers: Dict[str, str] = {}  # tool prefix -> MCP server 名稱
+
+        self.mcp_duration = self.histogram(
+            "mcp_tool_duration_seconds", "MCP tool call latency", ["tool", "server"])
+        self.mcp_calls = self.counter(
+            "mcp_tool_calls", "MCP tool calls by outcome", ["tool", "server", "status"])
+        self.mcp_payload = self.histogram(
+            "mcp_tool_response_bytes", "Size of MCP tool responses as logged", ["tool", "server"], SIZE_BUCKETS)
+        self.cache_requests = self.counter(
+            "cache_requests", "Cache lookups by cache name and result", ["cache", "result"])
+        self.llm_duration = self.histogram(
+            "llm_call_duration_seconds", "LLM call latency", ["agent", "model", "source"])
+        self.llm_ttft = self.histogram(
+            "llm_time_to_first_token_seconds", "LLM time to first token (streaming calls)", ["agent", "model"])
+        self.llm_calls = self.counter(
+            "llm_calls", "LLM calls by outcome", ["agent", "model", "status"])
+        self.llm_tokens = self.counter(
+            "llm_tokens", "LLM tokens by kind", ["model", "kind"])
+
+    # ------------------------------------------------------------------
+    # 註冊
+    # ------------------------------------------------------------------
+    def counter(self, name: str, documentation: str, labelnames: Sequence[str] = ()) -> Counter:
+        return self._metrics.setdefault(name, Counter(name, documentation, labelnames))
+
+    def histogram(self, name: str, documentation: str, labelnames: Sequence[str] = (),
+                  buckets: Sequence[float] = LATENCY_BUCKETS) -> Histogram:
+        return self._metrics.setdefault(name, Histogram(name, documentation, labelnames, buckets))
+
+    def register_tool_prefix(self, prefix: str, server: str):
+        """記錄 tool 前綴對應的 MCP Server (例如 yf_ -> yfinance)，供 server 標籤使用"""
+        self._tool_servers[prefix] = server
+
+    def server_for_tool(self, tool_name: str) -> str:
+        for prefix, server in self._tool_servers.items():
+            if tool_name.startswith(prefix):
+                return server
+        return "unknown"
+
+    # ------------------------------------------------------------------
+    # 記錄
+    # ------------------------------------------------------------------
+    def observe_mcp_call(self, tool_name: str, duration_ms: float, success: bool,
+                         payload_bytes: int = None, cache_hit: bool = None):
+        server = self.server_for_tool(tool_name)
+        self.mcp_duration.observe(duration_ms / 1000, tool=tool_name, server=server)
+        self.mcp_calls.inc(tool=tool_name, server=server, status="success" if success else "error")
+        if payload_bytes is not None:
+            self.mcp_payload.observe(payload_bytes, tool=tool_name, server=server)
+        if cache_hit is not None:
+            self.observe_cache("mcp", cache_hit)
+
+    def observe_cache(self, cache: str, hit: bool):
+        self.cache_requests.inc(cache=cache, result="hit" if hit else "miss")
+
+    def observe_llm_call(self, agent_name: str, model: str, duration_ms: float, success: bool = True,
+                         ttft_ms: float = None, prompt_tokens: int = 0, completion_tokens: int = 0,
+                         cached_tokens: int = 0, source: str = "direct"):
+        self.llm_duration.observe(duration_ms / 1000, agent=agent_name, model=model, source=source)
+        self.llm_calls.inc(agent=agent_name, model=model, status="success" if success else "error")
+        if ttft_ms is not None:
+            self.llm_ttft.observe(ttft_ms / 1000, agent=agent_name, model=model)
+        for kind, amount in (("prompt", prompt_tokens), ("completion", completion_tokens), ("cached", cached_tokens)):
+            if amount:
+                self.llm_tokens.inc(amount, model=model, kind=kind)
+
+    # ------------------------------------------------------------------
+    # 輸出
+    # ------------------------------------------------------------------
+    def render_openmetrics(self) -> str:
+        lines = []
+        for metric in self._metrics.values():
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.extend(metric.samples())
+        lines.append("# EOF")
+        return "\n".join(lines) + "\n"
+
+    def snapshot(self) -> Dict:
+        data = {"timestamp": time.time(), "metrics": {}}
+        for metric in self._metrics.values():
+            data["metrics"][metric.name] = {"type": metric.type_name, "series": metric.snapshot()}
+
+        # 各快取的命中率
+        ratios = {}
+        for series in self.cache_requests.snapshot():
+            entry = ratios.setdefault(series["labels"]["cache"], {"hit": 0.0, "miss": 0.0})
+            entry[series["labels"]["result"]] = series["value"]
+        data["cache_hit_ratio"] = {
+            cache: round(v["hit"] / (v["hit"] + v["miss"]), 3) if v["hit"] + v["miss"] else 0.0
+            for cache, v in ratios.items()
+        }
+        return data
+
+    def write_snapshot(self, path) -> Path:
+        """原子寫入快照 (先寫暫存檔再取代)"""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        tmp.write_text(json.dumps(self.snapshot(), ensure_ascii=False, indent=2), encoding="utf-8")
+        os.replace(tmp, path)
+        return path
+
+
+# ============================================================================
+# Exporters
+# ============================================================================
+
+def start_metrics_server(registry: MetricsRegistry, port: int, host: str = "0.0.0.0") -> ThreadingHTTPServer:
+    """在背景執行緒啟動 /metrics HTTP 端點"""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404)
+                return
+            body = registry.render_openmetrics().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", OPENMETRICS_CONTENT_TYPE)
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # 不要在 Terminal 輸出每次抓取
+
+    server = ThreadingHTTPServer((host, port), Handler)
+    threading.Thread(target=server.serve_forever, name="metrics-http", daemon=True).start()
+    print(f"✓ Metrics endpoint: http://{host}:{port}/metrics")
+    return server
+
+
+def start_snapshot_writer(registry: MetricsRegistry, path: str, interval: float = 60.0) -> threading.Thread:
+    """在背景執行緒定期寫入快照檔"""
+
+    def loop():
+        while True:
+            time.sleep(interval)
+            try:
+                registry.write_snapshot(path)
+            except Exception as e:
+                print(f"⚠️ Failed to write metrics snapshot: {e}")
+
+    thread = threading.Thread(target=loop, name="metrics-snapshot", daemon=True)
+    thread.start()
+    print(f"✓ Metrics snapshot: {path} (every {interval:.0f}s)")
+    return thread
+
+
+# 全域 registry 實例
+_metrics: Optional[MetricsRegistry] = None
+
+
+def get_metrics() -> MetricsRegistry:
+    """取得全域 Metrics Registry (第一次呼叫時依環境變數啟動輸出端點)"""
+    global _metrics
+    if _metrics is None:
+        _metrics = MetricsRegistry()
+        port = os.getenv("METRICS_PORT")
+        if port:
+            try:
+                start_metrics_server(_metrics, int(port), os.getenv("METRICS_HOST", "0.0.0.0"))
+            except OSError as e:
+                # 多個 Worker 行程共用同一個 port 時只有第一個能綁定
+                print(f"⚠️ Metrics endpoint not started on port {port}: {e}")
+        snapshot_path = os.getenv("METRICS_SNAPSHOT_PATH")
+        if snapshot_path:
+            start_snapshot_writer(_metrics, snapshot_path, float(os.getenv("METRICS_SNAPSHOT_INTERVAL", "60")))
+    return _metrics
+
+
+# ============================================================================
+# ADK Agent Callbacks
+# ============================================================================
+
+# (invocation_id, agent_name) -> (模型呼叫開始時間, 模型名稱)
+_llm_started: Dict[tuple, Tuple[float, str]] = {}
+
+
+def metrics_before_model(callback_context, llm_request):
+    """before_model_callback：記錄 ADK Agent 模型呼叫的開始時間 (排在排程器之後，不含排隊時間)"""
+    _llm_started[(callback_context.invocation_id, callback_context.agent_name)] = (
+        time.perf_counter(), getattr(llm_request, "model", None) or "unknown"
+    )
+    return None
+
+
+def metrics_after_model(callback_context, llm_response):
+    """after_model_callback：記錄 ADK Agent 模型呼叫的延遲與 Token 數"""
+    if getattr(llm_response, "partial", False):
+        return None
+    started = _llm_started.pop((callback_context.invocation_id, callback_context.agent_name), None)
+    if started is None:
+        return None
+    start, model = started
+    usage = getattr(llm_response, "usage_metadata", None)
+    get_metrics().observe_llm_call(
+        agent_name=callback_context.agent_name,
+        model=model,
+        duration_ms=(time.perf_counter() - start) * 1000,
+        success=not getattr(llm_response, "error_code", None),
+        prompt_tokens=getattr(usage, "prompt_token_count", None) or 0,
+        completion_tokens=getattr(usage, "candidates_token_count", None) or 0,
+        cached_tokens=getattr(usage, "cached_content_token_count", None) or 0,
+        source="agent",
+    )
+    return None
+
+
+def metrics_on_model_error(callback_context, llm_request, error):
+    """on_model_error_callback：模型呼叫拋出例外時清除開始時間並記錄為錯誤 (回傳 None，錯誤照常拋出)"""
+    started = _llm_started.pop((callback_context.invocation_id, callback_context.agent_name), None)
+    if started is None:
+        return None
+    start, model = started
+    get_metrics().observe_llm_call(
+        agent_name=callback_context.agent_name,
+        model=model,
+        duration_ms=(time.perf_counter() - start) * 1000,
+        success=False,
+        source="agent",
+    )
+    return None
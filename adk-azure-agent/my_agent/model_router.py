@@ -0,0 +1,98 @@
+"""
+模型路由 - 依角色 (writer / validator / corrector / planner ...) 選擇 Azure 部署
+
+設定來源 (優先順序由高到低)：
+1. 環境變數 MODEL_ROUTE_<ROLE>，例如 MODEL_ROUTE_VALIDATOR=azure/gpt-4o-mini,azure/gpt-4o
+2. model_routing.json (專案根目錄，可用 MODEL_ROUTING_CONFIG 指定其他路徑)
+3. DEFAULT_ROUTES
+
+每個角色對應一條 fallback chain：第一個為主要部署，其餘交給 LiteLLM 的 fallbacks 依序嘗試。
+
+離線壓測時設定 LLM_BACKEND=fake (或將角色路由到 "fake/..." 模型) 即改用 FakeLlm，不連線 Azure。
+"""
+import os
+import json
+from pathlib import Path
+from typing import Dict, List
+
+from google.adk.models.base_llm import BaseLlm
+from google.adk.models.lite_llm import LiteLlm
+
+
+DEFAULT_MODEL = "azure/gpt-4o"
+
+DEFAULT_ROUTES: Dict[str, List[str]] = {
+    "orchestrator": [DEFAULT_MODEL],
+    "writer": [DEFAULT_MODEL],
+    "corrector": [DEFAULT_MODEL],
+    "discovery": [DEFAULT_MODEL],
+    "validator": [DEFAULT_MODEL],
+    "planner": [DEFAULT_MODEL],
+}
+
+
+class ModelRouter:
+    """依角色建立 (並快取) 對應的 LiteLlm 模型"""
+
+    def __init__(self, config_path: str = None):
+        if config_path is None:
+            config_path = os.getenv("MODEL_ROUTING_CONFIG") or Path(__file__).parent.parent / "model_routing.json"
+
+        self.config_path = Path(config_path)
+        self.routes: Dict[str, List[str]] = {role: list(chain) for role, chain in DEFAULT_ROUTES.items()}
+        self._models: Dict[str, BaseLlm] = {}
+        self._load_config()
+
+    def _load_config(self):
+        if not self.config_path.exists():
+            return
+        try:
+            with open(self.config_path, "r", encoding="utf-8") as f:
+                config = json.load(f)
+            for role, chain in config.get("roles", {}).items():
+                if isinstance(chain, str):
+                    chain = [chain]
+                if chain:
+                    self.routes[role] = list(chain)
+        except Exception as e:
+            print(f"❌ Error loading {self.config_path.name}: {e}")
+
+    def chain(self, role: str) -> List[str]:
+        """取得角色的 fallback chain (環境變數優先)"""
+        override = os.getenv(f"MODEL_ROUTE_{role.upper()}")
+        if override:
+            return [m.strip() for m in override.split(",") if m.strip()]
+        return self.routes.get(role) or [DEFAULT_MODEL]
+
+    def get_model(self, role: str) -> BaseLlm:
+        """取得角色對應的模型實例 (同一角色共用一個實例)"""
+        if role not in self._models:
+            chain = self.chain(role)
+            if os.getenv("LLM_BACKEND", "").lower() == "fake" or chain[0].startswith("fake/"):
+                from .fake_llm import FakeLlm
+                model_name = chain[0] if chain[0].startswith("fake/") else f"fake/{chain[0].split('/')[-1]}"
+                self._models[role] = FakeLlm.from_env(model=model_name)
+                print(f"✓ Model route: {role} -> {model_name} (fake backend)")
+                return self._models[role]
+
+            kwargs = {"fallbacks": chain[1:]} if len(chain) > 1 else {}
+            self._models[role] = LiteLlm(model=chain[0], **kwargs)
+            print(f"✓ Model route: {role} -> {' -> '.join(chain)}")
+        return self._models[role]
+
+
+# 全域 router 實例
+_model_router = None
+
+
+def get_model_router() -> ModelRouter:
+    """取得全域 Model Router"""
+    global _model_router
+    if _model_router is None:
+        _model_router = ModelRouter()
+    return _model_router
+
+
+def get_model_for_role(role: str) -> BaseLlm:
+    """取得指定角色的模型 (e.g. get_model_for_role("validator"))"""
+    return get_model_router().get_model(role)
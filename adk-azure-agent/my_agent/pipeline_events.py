@@ -0,0 +1,133 @@
+"""
+流水線進度事件 - 讓長時間執行的分析流水線能即時回報進度與已完成的章節
+"""
+import asyncio
+import contextvars
+from dataclasses import dataclass, field
+from datetime import datetime
+from typing import Any, AsyncGenerator, Callable, Optional
+
+from google.adk.agents import BaseAgent
+from google.adk.agents.invocation_context import InvocationContext
+from google.adk.events import Event
+from google.genai import types
+
+
+# 事件類型
+STAGE_STARTED = "stage_started"
+STAGE_FINISHED = "stage_finished"
+VALIDATION_ATTEMPT = "validation_attempt"
+VALIDATION_RESULT = "validation_result"
+SECTION_READY = "section_ready"
+PIPELINE_FINISHED = "pipeline_finished"
+PIPELINE_FAILED = "pipeline_failed"
+
+
+@dataclass
+class PipelineEvent:
+    """流水線進度事件"""
+    type: str
+    stage: str = ""
+    message: str = ""
+    attempt: Optional[int] = None
+    text: Optional[str] = None
+    timestamp: str = field(default_factory=lambda: datetime.now().isoformat())
+
+
+# 當前流水線的事件佇列；未設定時 emit_progress 不做任何事 (非串流模式零成本)
+_progress_queue: contextvars.ContextVar[Optional[asyncio.Queue]] = contextvars.ContextVar(
+    "pipeline_progress_queue", default=None
+)
+
+
+def emit_progress(type: str, stage: str = "", message: str = "", attempt: int = None, text: str = None):
+    """從流水線任意深度送出進度事件"""
+    queue = _progress_queue.get()
+    if queue is not None:
+        queue.put_nowait(PipelineEvent(type=type, stage=stage, message=message, attempt=attempt, text=text))
+
+
+async def stream_progress(pipeline_fn: Callable[..., Any], *args, **kwargs) -> AsyncGenerator[PipelineEvent, None]:
+    """
+    以背景 Task 執行 pipeline_fn，並以 async generator 逐一產出其進度事件
+
+    最後一個事件為 PIPELINE_FINISHED (text 為 pipeline_fn 的回傳值)；
+    若 pipeline_fn 拋出例外，先產出 PIPELINE_FAILED 再將例外往上拋。
+    """
+    queue: asyncio.Queue = asyncio.Queue()
+    ctx = contextvars.copy_context()
+    ctx.run(_progress_queue.set, queue)
+    task = asyncio.get_running_loop().create_task(pipeline_fn(*args, **kwargs), context=ctx)
+
+    try:
+        while True:
+            getter = asyncio.ensure_future(queue.get())
+            done, _ = await asyncio.wait({getter, task}, return_when=asyncio.FIRST_COMPLETED)
+            if getter in done:
+                yield getter.result()
+                continue
+
+            getter.cancel()
+            while not queue.empty():
+                yield queue.get_nowait()
+            break
+
+        try:
+            result = task.result()
+        except Exception as e:
+            yield PipelineEvent(type=PIPELINE_FAILED, message=str(e))
+            raise
+        yield PipelineEvent(type=PIPELINE_FINISHED, text=result)
+    finally:
+        # 消費端提前停止 (例如使用者關閉連線) 時取消流水線
+        if not task.done():
+            task.cancel()
+
+
+def format_progress_event(event: PipelineEvent) -> str:
+    """將進度事件轉為顯示給使用者的單行文字"""
+    if event.type == STAGE_STARTED:
+        return f"⏳ {event.stage} 開始執行... {event.message}".rstrip()
+    if event.type == STAGE_FINISHED:
+        return f"✅ {event.stage} 完成 {event.message}".rstrip()
+    if event.type == VALIDATION_ATTEMPT:
+        return f"🔍 {event.stage} 品質檢查 (第 {event.attempt} 次)..."
+    if event.type == VALIDATION_RESULT:
+        return f"🔍 {event.stage} 第 {event.attempt} 次檢查結果：{event.message}"
+    if event.type == PIPELINE_FAILED:
+        return f"❌ 分析流水線失敗：{event.message}"
+    return event.message
+
+
+class PipelineStreamingAgent(BaseAgent):
+    """
+    直接執行分析流水線並串流回報進度的 Agent
+
+    - 進度事件以 partial event 送出 (adk web 即時顯示，不寫入 session)
+    - 通過驗證的章節 (SECTION_READY) 以完整 event 立即送出，不必等待全部階段完成
+    """
+
+    pipeline: Callable[..., AsyncGenerator[PipelineEvent, None]]
+    """async generator：pipeline(user_request) -> PipelineEvent"""
+
+    def _make_event(self, ctx: InvocationContext, text: str, partial: bool) -> Event:
+        return Event(
+            invocation_id=ctx.invocation_id,
+            author=self.name,
+            branch=ctx.branch,
+            partial=partial,
+            content=types.Content(role="model", parts=[types.Part(text=text)]),
+        )
+
+    async def _run_async_impl(self, ctx: InvocationContext) -> AsyncGenerator[Event, None]:
+        user_request = ""
+        if ctx.user_content and ctx.user_content.parts:
+            user_request = "".join(p.text or "" for p in ctx.user_content.parts)
+
+        async for event in self.pipeline(user_request):
+            if event.type == SECTION_READY:
+                yield self._make_event(ctx, event.text or "", partial=False)
+            elif event.type == PIPELINE_FINISHED:
+                continue  # 各章節已逐一送出
+            else:
+                yield self._make_event(ctx, format_progress_event(event), partial=event.type != PIPELINE_FAILED)
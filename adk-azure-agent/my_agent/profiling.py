@@ -0,0 +1,261 @@
+"""
+按需 Profiling - 包住流水線各階段、_validate_and_rewrite 的每次嘗試與 MCP 工具呼叫
+
+預設關閉 (profile_section 只回傳共用的空 context manager，沒有額外成本)，透過環境變數開啟：
+    AGENT_PROFILE=cprofile        # cprofile | sample
+    AGENT_PROFILE_TICKER=2330.TW  # 只 profile 這個 ticker (正式環境針對單一慢 ticker)
+    AGENT_PROFILE_DIR=...         # 預設 my_agent/.adk/profiles
+    AGENT_PROFILE_INTERVAL_MS=5   # sample 模式的取樣間隔
+
+cprofile：最外層的區段開始 cProfile，結束時寫出 .prof (pstats) 與 .txt (依 cumulative 排序的前 40 名)
+sample：背景執行緒定期擷取 Event Loop 執行緒的 stack，寫出 .folded (可用 speedscope / flamegraph.pl 開啟)，
+        每個 stack 前綴為當時執行中 Task 所在的區段標籤 (例如 "Part A;Part A validate#2;...")
+區段鏈以 ContextVar 保存，同一執行緒上平行的 asyncio Task 不會互相混用標籤；
+cProfile 以執行緒為單位，平行 Task 的第二個 root 區段只記錄區段耗時。
+兩種模式都會寫出 .sections.json，記錄各巢狀區段的實際耗時。
+
+Usage:
+    with profile_section("Stage 1", ticker=ticker):
+        await _run_stage_1(...)
+"""
+import os
+import sys
+import json
+import time
+import pstats
+import asyncio
+import cProfile
+import threading
+import weakref
+import contextvars
+from collections import Counter
+from datetime import datetime
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+
+
+PROFILE_MODES = ("cprofile", "sample")
+
+
+class _NullSection:
+    """關閉時使用的空區段"""
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+
+_NULL_SECTION = _NullSection()
+
+
+# 目前 Task / 執行緒所在的區段鏈 (由外而內)；以 ContextVar 保存，同一執行緒上平行的 asyncio Task 各自獨立
+_section_stack: contextvars.ContextVar[Tuple["_ProfileSection", ...]] = contextvars.ContextVar(
+    "agent_profile_sections", default=()
+)
+# 被取樣執行緒目前執行中的區段 (sampler 執行緒無法讀取其他執行緒的 ContextVar，改由區段進出時登記)
+_task_sections: "weakref.WeakKeyDictionary[asyncio.Task, _ProfileSection]" = weakref.WeakKeyDictionary()
+_thread_sections: Dict[int, "_ProfileSection"] = {}
+
+
+def _running_task() -> Optional[asyncio.Task]:
+    try:
+        return asyncio.current_task()
+    except RuntimeError:
+        return None
+
+
+class _StackSampler:
+    """以背景執行緒取樣指定執行緒的 Python stack (只計入屬於 root 區段的樣本)"""
+
+    def __init__(self, target_thread_id: int, interval: float, root: "_ProfileSection",
+                 loop: Optional[asyncio.AbstractEventLoop]):
+        self.target_thread_id = target_thread_id
+        self.interval = interval
+        self.root = root
+        self.loop = loop
+        self.samples: Counter = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name="agent-profile-sampler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _active_section(self) -> Optional["_ProfileSection"]:
+        task = asyncio.current_task(self.loop) if self.loop is not None else None
+        if task is not None:
+            section = _task_sections.get(task)
+            if section is None and hasattr(task, "get_context"):
+                # 區段內建立、自己沒有區段的子 Task (例如 gather) 沿用建立時繼承的區段鏈
+                stack = task.get_context().get(_section_stack, ())
+                section = stack[-1] if stack else None
+            return section
+        return _thread_sections.get(self.target_thread_id)
+
+    def _run(self):
+        while not self._stop.wait(self.interval):
+            frame = sys._current_frames().get(self.target_thread_id)
+            section = self._active_section()
+            if frame is None or section is None or section.root is not self.root:
+                continue  # 執行緒正在跑其他 Task 的程式碼
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            self.samples[";".join(section.labels + stack[::-1])] += 1
+
+
+class _ProfileSection:
+    """一個被 profile 的區段；所在 Task 中最外層的區段 (root) 負責啟動與寫出 profiler"""
+
+    def __init__(self, profiler: "AgentProfiler", label: str, ticker: Optional[str]):
+        self.profiler = profiler
+        self.label = label
+        self.ticker = ticker
+
+    def _activate(self, section: Optional["_ProfileSection"]):
+        task = _running_task()
+        if task is not None:
+            if section is None:
+                _task_sections.pop(task, None)
+            else:
+                _task_sections[task] = section
+        elif section is None:
+            _thread_sections.pop(threading.get_ident(), None)
+        else:
+            _thread_sections[threading.get_ident()] = section
+
+    def __enter__(self):
+        parents = _section_stack.get()
+        self.parent = parents[-1] if parents else None
+        self.root = parents[0] if parents else self
+        self.labels = [s.label for s in parents] + [self.label]
+        self.path = ";".join(self.labels)
+        if self.parent is None:
+            self.sections: List[Dict] = []
+            self.finished = False
+            self.started = time.perf_counter()
+            self.backend = self.profiler._start_backend(self)
+        self._token = _section_stack.set(parents + (self,))
+        self._activate(self)
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        try:
+            _section_stack.reset(self._token)
+        except ValueError:
+            # 在不同的 Context 結束 (例如 async generator 被其他 Task 關閉)
+            _section_stack.set(_section_stack.get()[:-1])
+        self._activate(self.parent)
+
+        root = self.root
+        if root.finished:
+            return False  # root 區段已先結束並寫出
+        root.sections.append({
+            "section": self.path,
+            "offset_ms": round((self.start - root.started) * 1000, 1),
+            "duration_ms": round((time.perf_counter() - self.start) * 1000, 1),
+            "error": exc_type.__name__ if exc_type else None,
+        })
+        if root is self:
+            self.finished = True
+            self.profiler._finish(self, self.backend, self.sections)
+        return False
+
+
+class AgentProfiler:
+    """依環境變數決定是否 profile，並將結果寫入 profile 目錄"""
+
+    def __init__(self, mode: str = None, profile_dir: str = None, ticker: str = None, interval_ms: float = 5.0):
+        if profile_dir is None:
+            profile_dir = Path(__file__).parent / ".adk" / "profiles"
+
+        self.mode = mode if mode in PROFILE_MODES else None
+        self.enabled = self.mode is not None
+        self.profile_dir = Path(profile_dir)
+        self.ticker = ticker.upper() if ticker else None
+        self.interval = interval_ms / 1000
+
+        if self.enabled:
+            self.profile_dir.mkdir(parents=True, exist_ok=True)
+            target = f", ticker={self.ticker}" if self.ticker else ""
+            print(f"✓ Profiling enabled ({self.mode}{target}): {self.profile_dir}/")
+
+    def section(self, label: str, ticker: str = None):
+        if not self.enabled:
+            return _NULL_SECTION
+        if self.ticker and (not ticker or ticker.upper() != self.ticker):
+            return _NULL_SECTION
+        return _ProfileSection(self, label, ticker)
+
+    def _start_backend(self, root: _ProfileSection):
+        if self.mode == "sample":
+            try:
+                loop = asyncio.get_running_loop()
+            except RuntimeError:
+                loop = None
+            sampler = _StackSampler(threading.get_ident(), self.interval, root, loop)
+            sampler.start()
+            return sampler
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # 同一執行緒已有其他 profiler (例如外部的 cProfile，或平行 Task 的 root 區段)，只記錄區段耗時
+            return None
+        return profile
+
+    def _finish(self, section: _ProfileSection, backend, sections: List[Dict]):
+        stamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        name = "".join(c if c.isalnum() or c in ".-_" else "_" for c in f"{section.ticker or 'unknown'}_{section.label}")
+        prefix = self.profile_dir / f"{stamp}_{name}"
+        try:
+            if isinstance(backend, cProfile.Profile):
+                backend.disable()
+                backend.dump_stats(f"{prefix}.prof")
+                with open(f"{prefix}.txt", "w", encoding="utf-8") as f:
+                    pstats.Stats(backend, stream=f).sort_stats("cumulative").print_stats(40)
+            elif isinstance(backend, _StackSampler):
+                backend.stop()
+                with open(f"{prefix}.folded", "w", encoding="utf-8") as f:
+                    for stack, count in backend.samples.most_common():
+                        f.write(f"{stack} {count}\n")
+            with open(f"{prefix}.sections.json", "w", encoding="utf-8") as f:
+                json.dump({"label": section.label, "ticker": section.ticker, "mode": self.mode,
+                           "sections": sections}, f, ensure_ascii=False, indent=2)
+            print(f"🔬 Profile written: {prefix}.*")
+        except Exception as e:
+            print(f"⚠️ Failed to write profile {prefix}: {e}")
+
+
+# 全域 profiler 實例
+_agent_profiler = None
+
+
+def get_profiler() -> AgentProfiler:
+    """取得全域 Profiler (依環境變數設定)"""
+    global _agent_profiler
+    if _agent_profiler is None:
+        _agent_profiler = AgentProfiler(
+            mode=(os.getenv("AGENT_PROFILE") or "").lower() or None,
+            profile_dir=os.getenv("AGENT_PROFILE_DIR") or None,
+            ticker=os.getenv("AGENT_PROFILE_TICKER") or None,
+            interval_ms=float(os.getenv("AGENT_PROFILE_INTERVAL_MS", "5")),
+        )
+    return _agent_profiler
+
+
+def profile_section(label: str, ticker: str = None):
+    """
+    Profile 一個區段 (可巢狀；所在 Task 中最外層的區段會啟動 profiler)
+
+    設定 AGENT_PROFILE_TICKER 時，ticker 不符 (或未知) 的區段不 profile。
+    """
+    return get_profiler().section(label, ticker)
@@ -0,0 +1,274 @@
+"""
+跨行程共用快取 - 以 SQLite (WAL) 實作，同一台主機上的多個 Worker / adk web 行程共用
+
+- TTL：每筆資料有到期時間，過期視為未命中
+- 容量上限：超過 max_bytes / max_entries 時依最近使用時間 (LRU) 淘汰
+- 原子發布：寫入為單一交易的 INSERT OR REPLACE，讀取端只會看到完整的舊值或新值
+- Single-flight：get_or_compute_async 以 locks 表協調，熱門 ticker 同一時間只有一個行程實際抓取
+
+預設關閉，透過環境變數開啟：
+    SHARED_CACHE=1
+    SHARED_CACHE_PATH=...        # 預設 my_agent/.adk/shared_cache.db
+    SHARED_CACHE_MAX_MB=256
+    SHARED_CACHE_MAX_ENTRIES=20000
+"""
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import threading
+from pathlib import Path
+from typing import Any, Awaitable, Callable, Dict
+
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    created_at REAL NOT NULL,
+    expires_at REAL,
+    last_access REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS idx_entries_access ON entries(last_access);
+CREATE TABLE IF NOT EXISTS locks (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+"""
+
+_MISSING = object()
+
+
+class SharedCache:
+    """跨行程的 Key-Value 快取 (值需可序列化為 JSON)"""
+
+    def __init__(
+        self,
+        db_path: str = None,
+        enabled: bool = True,
+        max_bytes: int = 256 * 1024 * 1024,
+        max_entries: int = 20000,
+    ):
+        if db_path is None:
+            db_path = Path(__file__).parent / ".adk" / "shared_cache.db"
+
+        self.db_path = Path(db_path)
+        self.enabled = enabled
+        self.max_bytes = max_bytes
+        self.max_entries = max_entries
+        self.owner = f"{os.getpid()}-{uuid.uuid4().hex[:6]}"
+
+        self.hits = 0
+        self.misses = 0
+        self.writes = 0
+        self.evictions = 0
+
+        self._local = threading.local()
+        if self.enabled:
+            self.db_path.parent.mkdir(parents=True, exist_ok=True)
+            self._conn().executescript(SCHEMA)
+            print(f"✓ Shared cache enabled: {self.db_path}")
+
+    def _conn(self) -> sqlite3.Connection:
+        """每個執行緒 / 行程各自的連線 (sqlite3 連線不可跨執行緒或 fork 共用)"""
+        conn = getattr(self._local, "conn", None)
+        if conn is None or getattr(self._local, "pid", None) != os.getpid():
+            conn = sqlite3.connect(str(self.db_path), timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode = WAL")
+            conn.execute("PRAGMA synchronous = NORMAL")
+            conn.execute("PRAGMA busy_timeout = 30000")
+            self._local.conn = conn
+            self._local.pid = os.getpid()
+        return conn
+
+    # ------------------------------------------------------------------
+    # 讀寫
+    # ------------------------------------------------------------------
+    def get(self, namespace: str, key: str, default: Any = None) -> Any:
+        """讀取快取，未命中或已過期回傳 default"""
+        if not self.enabled:
+            return default
+
+        now = time.time()
+        try:
+            conn = self._conn()
+            row = conn.execute(
+                "SELECT value, expires_at FROM entries WHERE namespace = ? AND key = ?", (namespace, key)
+            ).fetchone()
+            if row is None or (row[1] is not None and row[1] < now):
+                self.misses += 1
+                return default
+            conn.execute(
+                "UPDATE entries SET last_access = ? WHERE namespace = ? AND key = ?", (now, namespace, key)
+            )
+            self.hits += 1
+            return json.loads(row[0])
+        except Exception as e:
+            print(f"⚠️ Shared cache read failed ({namespace}): {e}")
+            self.misses += 1
+            return default
+
+    def set(self, namespace: str, key: str, value: Any, ttl_seconds: float = None):
+        """原子寫入 (同一交易內取代舊值並視需要淘汰)"""
+        if not self.enabled:
+            return
+        try:
+            payload = json.dumps(value, ensure_ascii=False)
+        except (TypeError, ValueError):
+            return  # 無法序列化的值不快取
+
+        now = time.time()
+        expires_at = now + ttl_seconds if ttl_seconds else None
+        try:
+            conn = self._conn()
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                conn.execute(
+                    "INSERT OR REPLACE INTO entries (namespace, key, value, size, created_at, expires_at, last_access) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?)",
+                    (namespace, key, payload, len(payload.encode("utf-8")), now, expires_at, now),
+                )
+                self._evict(conn, now)
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            self.writes += 1
+        except Exception as e:
+            print(f"⚠️ Shared cache write failed ({namespace}): {e}")
+
+    def _evict(self, conn: sqlite3.Connection, now: float):
+        """刪除過期項目，再依 LRU 淘汰超過筆數或容量上限的項目"""
+        self.evictions += conn.execute(
+            "DELETE FROM entries WHERE expires_at IS NOT NULL AND expires_at < ?", (now,)
+        ).rowcount
+
+        count, total = conn.execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+        if count <= self.max_entries and total <= self.max_bytes:
+            return
+
+        for namespace, key, size in conn.execute(
+            "SELECT namespace, key, size FROM entries ORDER BY last_access"
+        ).fetchall():
+            if count <= self.max_entries and total <= self.max_bytes:
+                break
+            conn.execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+            count -= 1
+            total -= size
+            self.evictions += 1
+
+    def delete(self, namespace: str, key: str):
+        if self.enabled:
+            self._conn().execute("DELETE FROM entries WHERE namespace = ? AND key = ?", (namespace, key))
+
+    def clear(self, namespace: str = None):
+        if not self.enabled:
+            return
+        if namespace:
+            self._conn().execute("DELETE FROM entries WHERE namespace = ?", (namespace,))
+        else:
+            self._conn().execute("DELETE FROM entries")
+
+    # ------------------------------------------------------------------
+    # Single-flight
+    # ------------------------------------------------------------------
+    def _try_lock(self, namespace: str, key: str, lock_seconds: float) -> bool:
+        now = time.time()
+        conn = self._conn()
+        conn.execute("DELETE FROM locks WHERE namespace = ? AND key = ? AND expires_at < ?", (namespace, key, now))
+        cursor = conn.execute(
+            "INSERT OR IGNORE INTO locks (namespace, key, owner, expires_at) VALUES (?, ?, ?, ?)",
+            (namespace, key, self.owner, now + lock_seconds),
+        )
+        return cursor.rowcount == 1
+
+    def _unlock(self, namespace: str, key: str):
+        self._conn().execute(
+            "DELETE FROM locks WHERE namespace = ? AND key = ? AND owner = ?", (namespace, key, self.owner)
+        )
+
+    async def get_or_compute_async(
+        self,
+        namespace: str,
+        key: str,
+        compute: Callable[[], Awaitable[Any]],
+        ttl_seconds: float = None,
+        should_cache: Callable[[Any], bool] = None,
+        lock_seconds: float = 60.0,
+        poll_interval: float = 0.2,
+    ) -> Any:
+        """
+        讀取快取，未命中時計算並發布
+
+        其他行程正在計算同一個 key 時，等待其發布結果 (最多 lock_seconds) 而不重複計算。
+        SQLite 讀寫 (含 busy_timeout 等待) 皆在 worker thread 執行，不阻塞 Event Loop。
+        """
+        if not self.enabled:
+            return await compute()
+
+        value = await asyncio.to_thread(self.get, namespace, key, _MISSING)
+        if value is not _MISSING:
+            return value
+
+        deadline = time.time() + lock_seconds
+        while not await asyncio.to_thread(self._try_lock, namespace, key, lock_seconds):
+            if time.time() > deadline:
+                return await compute()  # 持有者可能已當掉，自行計算
+            await asyncio.sleep(poll_interval)
+            value = await asyncio.to_thread(self.get, namespace, key, _MISSING)
+            if value is not _MISSING:
+                return value
+
+        try:
+            value = await compute()
+            if should_cache is None or should_cache(value):
+                await asyncio.to_thread(self.set, namespace, key, value, ttl_seconds)
+            return value
+        finally:
+            await asyncio.to_thread(self._unlock, namespace, key)
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        result = {
+            "enabled": self.enabled,
+            "hits": self.hits,
+            "misses": self.misses,
+            "writes": self.writes,
+            "evictions": self.evictions,
+            "hit_ratio": round(self.hits / lookups, 3) if lookups else 0.0,
+        }
+        if self.enabled:
+            count, total = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(size), 0) FROM entries").fetchone()
+            result.update({"entries": count, "bytes": total})
+        return result
+
+
+# 全域 cache 實例
+_shared_cache = None
+
+
+def get_shared_cache() -> SharedCache:
+    """取得全域共用快取 (依環境變數設定)"""
+    global _shared_cache
+    if _shared_cache is None:
+        _shared_cache = SharedCache(
+            db_path=os.getenv("SHARED_CACHE_PATH") or None,
+            enabled=os.getenv("SHARED_CACHE", "") not in ("", "0", "false"),
+            max_bytes=int(float(os.getenv("SHARED_CACHE_MAX_MB", "256")) * 1024 * 1024),
+            max_entries=int(os.getenv("SHARED_CACHE_MAX_ENTRIES", "20000")),
+        )
+    return _shared_cache
+
+
+def set_shared_cache(cache: SharedCache):
+    """替換全域快取 (測試時可指向暫存檔)"""
+    global _shared_cache
+    _shared_cache = cache
@@ -0,0 +1,121 @@
+"""
+MCP 工具直接呼叫 - 不經過 LLM，直接以 Python 呼叫指定的 MCP 工具並回傳解析後的結果
+
+適用於只需要原始資料的階段 (例如 Stage 0.5 的財報新聞搜尋)，
+省下一次完整的模型呼叫與工具 Schema 的 Prompt Token。
+
+Usage:
+    from .tool_invoker import invoke_mcp_tool
+    results = await invoke_mcp_tool("web_search", {"query": "台積電 財報"}, ticker="2330.TW")
+
+呼叫會經過 patch_mcp_tool 包裝後的 McpTool.run_async，因此與 Agent 發出的呼叫一樣寫入 mcp_logs/。
+"""
+import asyncio
+import weakref
+from typing import Any, Dict, List, Optional
+
+from .mcp_log_reader import parse_mcp_content
+
+
+class McpToolNotFound(LookupError):
+    """找不到指定名稱的 MCP 工具 (Server 未載入或名稱錯誤)"""
+
+
+class McpToolCallError(RuntimeError):
+    """MCP Server 回傳 isError"""
+
+
+class McpToolRegistry:
+    """共用的 McpToolset 註冊表，依工具名稱解析出 McpTool"""
+
+    def __init__(self):
+        self.toolsets: List[Any] = []
+        self._tools: Optional[Dict[str, Any]] = None
+        # 每個 Event Loop 各自的鎖 (asyncio.run / 多個 Worker 行程會以新的 loop 重用同一個 registry)
+        self._locks: "weakref.WeakKeyDictionary[asyncio.AbstractEventLoop, asyncio.Lock]" = weakref.WeakKeyDictionary()
+
+    def _lock(self) -> asyncio.Lock:
+        loop = asyncio.get_running_loop()
+        lock = self._locks.get(loop)
+        if lock is None:
+            lock = self._locks[loop] = asyncio.Lock()
+        return lock
+
+    def register_toolsets(self, toolsets: List[Any]):
+        """註冊 McpToolset (agent.py 載入 mcp_config.json 後呼叫)"""
+        for toolset in toolsets:
+            if toolset not in self.toolsets:
+                self.toolsets.append(toolset)
+        self._tools = None
+
+    async def _load_tools(self) -> Dict[str, Any]:
+        async with self._lock():
+            if self._tools is not None:
+                return self._tools
+
+            if not self.toolsets:
+                # 尚未註冊時載入 agent.py (其 import 時會註冊 mcp_toolsets)
+                from . import agent  # noqa: F401
+
+            tools = {}
+            for toolset in self.toolsets:
+                try:
+                    for tool in await toolset.get_tools():
+                        tools[tool.name] = tool
+                        # 同時允許以 MCP Server 原始名稱 (無 prefix) 呼叫，先註冊者優先
+                        raw_name = getattr(getattr(tool, "_mcp_tool", None), "name", None)
+                        if raw_name:
+                            tools.setdefault(raw_name, tool)
+                except Exception as e:
+                    print(f"⚠️ Failed to list tools from MCP toolset: {e}")
+
+            self._tools = tools
+            return tools
+
+    async def get_tool(self, name: str):
+        tools = await self._load_tools()
+        if name not in tools:
+            raise McpToolNotFound(f"MCP tool not found: {name} (available: {', '.join(sorted(tools)) or 'none'})")
+        return tools[name]
+
+    async def list_tool_names(self) -> List[str]:
+        return sorted(await self._load_tools())
+
+
+# 全域 registry 實例
+_tool_registry = None
+
+
+def get_tool_registry() -> McpToolRegistry:
+    """取得全域 MCP 工具註冊表"""
+    global _tool_registry
+    if _tool_registry is None:
+        _tool_registry = McpToolRegistry()
+    return _tool_registry
+
+
+async def invoke_mcp_tool(name: str, args: Dict[str, Any] = None, ticker: str = None, raw: bool = False) -> Any:
+    """
+    直接呼叫 MCP 工具
+
+    Args:
+        name: 工具名稱，可為帶 prefix 的名稱 (web_search) 或 Server 原始名稱 (search)
+        args: 工具參數
+        ticker: 寫入 mcp_logs 時使用的 ticker (會在送出前由 logging patch 移除)
+        raw: True 時回傳未解析的原始回覆
+
+    Returns:
+        解析後的結果 (JSON 內容轉為 dict / list，否則為文字)
+    """
+    tool = await get_tool_registry().get_tool(name)
+
+    call_args = dict(args or {})
+    if ticker:
+        call_args["ticker"] = ticker
+
+    response = await tool.run_async(args=call_args, tool_context=None)
+
+    if isinstance(response, dict) and response.get("isError"):
+        raise McpToolCallError(f"{name} returned error: {parse_mcp_content(response)}")
+
+    return response if raw else parse_mcp_content(response)
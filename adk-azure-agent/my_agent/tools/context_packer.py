@@ -0,0 +1,223 @@
+"""
+Context Packer - 將 extract_data_for_prompt 的展平資料依關鍵訊息需求排序，壓縮成固定 Token 預算內的輸出
+
+- 依 Key Message 模板需要的欄位排序：股價、目標價、券商評等、利潤率、成長率、估值、新聞標題與摘要
+- 捨棄樣板欄位 (地址、電話、網址、縮圖、時區等) 與重複內容 (相同文字只保留排名最高的欄位)
+- 輸出為依來源工具分組的 `key: value` 行，而非 indent=2 的 JSON + 完整 source_map
+- 超出預算的欄位可用 cursor 分頁取得 (extract_more_data_tool)
+- 網頁抓取結果不放原文，只放入 BM25 檢索出的相關段落 (page_passages)
+
+Token 預算由環境變數 EXTRACT_DATA_TOKEN_BUDGET 設定 (預設 2500，0 表示不限制)。
+"""
+import os
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+from ..llm_scheduler import estimate_tokens
+
+DEFAULT_TOKEN_BUDGET = 2500
+
+# 單一字串值的最大長度 (新聞摘要、公司簡介等長文截斷)
+MAX_VALUE_CHARS = 400
+
+# (欄位名稱 pattern, 分數)：依序比對葉節點欄位名稱 (不分大小寫)，第一個符合的為準
+FIELD_PRIORITIES: List[Tuple[str, int]] = [
+    (r"^(currentprice|regularmarketprice|previousclose|regularmarketpreviousclose)$", 100),
+    (r"^target(median|mean|high|low)price$", 95),
+    (r"^(recommendationmean|recommendationkey|numberofanalystopinions|averageanalystrating)$", 90),
+    (r"^upside|upside_potential|upside_percent", 90),
+    (r"^(symbol|longname|shortname|industry|sector)$", 85),
+    (r"margins?$", 80),
+    (r"growth", 80),
+    (r"^(totalrevenue|netincometocommon|ebitda|freecashflow|operatingcashflow|grossprofits|totalcash|totaldebt)$", 75),
+    (r"^(trailingpe|forwardpe|pegratio|pricetobook|pricetosalestrailing12months|marketcap|enterprisevalue)$", 70),
+    (r"^(trailingeps|forwardeps|returnonequity|returnonassets|debttoequity|currentratio)$", 70),
+    (r"^(beta|dividendyield|dividendrate|payoutratio)$", 65),
+    (r"^(fiftytwoweekhigh|fiftytwoweeklow|fiftytwoweekchange|52weekchange|fiftydayaverage|twohundreddayaverage)$", 60),
+    (r"^(title|headline)$", 60),
+    (r"^(summary|description|snippet)$", 50),
+    (r"^(pubdate|displaytime|providerpublishtime|published|date)$", 35),
+    (r"^(publisher|provider|source|sources|displayname)$", 30),
+    (r"raw_text$", 25),
+    (r"^longbusinesssummary$", 20),
+]
+
+# 對撰寫關鍵訊息沒有幫助的欄位
+BOILERPLATE_FIELDS = re.compile(
+    r"^(address\d?|city|state|zip|country|phone|fax|website|irwebsite|url|link|canonicalurl|clickthroughurl|"
+    r"logo_?url|thumbnail|resolutions|width|height|tag|uuid|id|contentid|maxage|timezone|timezoneshortname|"
+    r"exchangetimezonename|exchangetimezoneshortname|gmtoffsetmilliseconds|messageboardid|quotetype|"
+    r"financialcurrency|currency|language|region|market|exchange|fullexchangename|firsttradedateepochutc|"
+    r"firsttradedatemilliseconds|uuid|tradeable|triggerable|cryptotradeable|hasprepostmarketdata|"
+    r"esgpopulated|isearningsdateestimate|sourceinterval|exchangedatadelayedby|pricehint|"
+    r"contenttype|storyline|ispremium|ishosted|bypass|editorspick|finance|providercontenturl|"
+    r"governanceepochdate|compensationasofepochdate|auditrisk|boardrisk|compensationrisk|"
+    r"shareholderrightsrisk|overallrisk|fiscalyearends|exercisedvalue|unexercisedvalue|yearborn|age)$"
+)
+
+# 任何路徑段落符合者整段捨棄 (例如公司高階主管清單)
+BOILERPLATE_PATHS = re.compile(r"(^|\.)(companyofficers|resolutions|thumbnail|finance|storyline)(\.|$)", re.IGNORECASE)
+
+_LOG_STAMP = re.compile(r"_\d{8}_\d{6}\.jsonl$")
+
+
+def get_token_budget() -> int:
+    return int(os.getenv("EXTRACT_DATA_TOKEN_BUDGET", str(DEFAULT_TOKEN_BUDGET)))
+
+
+def _leaf_and_index(key: str) -> Tuple[str, Optional[int]]:
+    """取出展平 key 的葉節點欄位名稱與第一個陣列索引 (例如 news.3.title -> ("title", 3))"""
+    parts = key.split(":")[-1].split(".")
+    index = next((int(p) for p in parts if p.isdigit()), None)
+    leaf = next((p for p in reversed(parts) if not p.isdigit()), parts[-1])
+    return leaf, index
+
+
+def score_field(key: str, value: Any) -> float:
+    """欄位與關鍵訊息的相關度 (0 表示樣板欄位，應捨棄)"""
+    if value is None or value == "" or BOILERPLATE_PATHS.search(key):
+        return 0.0
+    leaf, index = _leaf_and_index(key)
+    normalized = leaf.lower()
+    if BOILERPLATE_FIELDS.match(normalized):
+        return 0.0
+
+    score = 10.0
+    for pattern, weight in FIELD_PRIORITIES:
+        if re.search(pattern, normalized):
+            score = float(weight)
+            break
+    # 陣列中較後面的項目 (較舊的新聞、次要搜尋結果) 分數遞減
+    if index is not None:
+        score *= 1 / (1 + 0.15 * index)
+    # 長文字佔用大量 Token，分數略降
+    if isinstance(value, str) and len(value) > MAX_VALUE_CHARS:
+        score *= 0.8
+    return score
+
+
+def _source_tool(source: Optional[str]) -> str:
+    """由 source_map 的 "檔名:欄位" 取出工具名稱 (去除時間戳記)"""
+    if not source:
+        return "other"
+    file_name = source.split(":", 1)[0]
+    if file_name.startswith("mcp_"):
+        return "other"
+    return _LOG_STAMP.sub("", file_name) or "other"
+
+
+def _format_value(value: Any) -> str:
+    if isinstance(value, float):
+        return f"{value:.6g}"
+    text = str(value).replace("\n", " ").strip()
+    if len(text) > MAX_VALUE_CHARS:
+        text = text[:MAX_VALUE_CHARS] + "…"
+    return text
+
+
+def rank_fields(data: Dict[str, Any], keyword: str = None) -> List[Dict[str, Any]]:
+    """
+    依相關度排序欄位，捨棄樣板欄位與重複數值
+
+    Returns:
+        [{"key", "value", "tool", "score"}, ...] (分數由高到低；同分依 key 排序，確保分頁穩定)
+    """
+    source_map = data.get("source_map", {})
+    keyword = keyword.lower() if keyword else None
+    candidates = []
+    for key, value in data.get("extracted_data", {}).items():
+        if keyword and keyword not in key.lower():
+            continue
+        score = score_field(key, value)
+        if score <= 0:
+            continue
+        # raw_text 的 key 本身就是 "檔名:raw_text"，source_map 缺漏時仍可判斷來源工具
+        tool = _source_tool(source_map.get(str(value)) or (key if key.endswith(":raw_text") else None))
+        # 網頁原文 (含導覽列、廣告) 不直接放入，改由 passages 提供相關段落
+        if "fetch" in tool.lower():
+            continue
+        candidates.append({"key": key, "value": value, "score": score, "tool": tool})
+    candidates.sort(key=lambda f: (-f["score"], f["key"]))
+
+    ranked, seen_values = [], set()
+    for field in candidates:
+        # 文字 (新聞標題、摘要) 在不同來源重複出現時只保留一次；數值只有同名欄位才視為重複，
+        # 避免 currentPrice 與 previousClose 剛好相同時被誤刪
+        value = field["value"]
+        if isinstance(value, str):
+            fingerprint = _format_value(value)
+        else:
+            fingerprint = (_leaf_and_index(field["key"])[0], _format_value(value))
+        if fingerprint in seen_values:
+            continue
+        seen_values.add(fingerprint)
+        ranked.append(field)
+    return ranked
+
+
+def pack_extracted_data(data: Dict[str, Any], token_budget: int = None, cursor: int = 0,
+                        keyword: str = None, passages: List[Dict[str, Any]] = None) -> str:
+    """
+    將排序後的欄位由 cursor 開始放入 token_budget，依來源工具分組輸出
+
+    Args:
+        data: extract_data_for_prompt 的回傳值
+        token_budget: Token 上限 (None 使用環境變數設定，0 表示不限制)
+        cursor: 從第幾個排序後的欄位開始 (分頁用)
+        keyword: 只包含 key 含有此字串的欄位
+        passages: 網頁相關段落 ({"url", "text"})，在欄位之前放入預算 (佔預算的 1/3 為上限)
+    """
+    if token_budget is None:
+        token_budget = get_token_budget()
+    ticker = data.get("ticker", "")
+    ranked = rank_fields(data, keyword)
+    total = len(ranked)
+    cursor = max(cursor, 0)
+
+    passage_lines, used = [], 0
+    for passage in passages or []:
+        text = passage["text"].replace("\n", " ")
+        line = f"- {text}" + (f" ({passage['url']})" if passage.get("url") else "")
+        cost = estimate_tokens(line)
+        if token_budget and used + cost > token_budget / 3:
+            break
+        passage_lines.append(line)
+        used += cost
+
+    selected = []
+    for field in ranked[cursor:]:
+        line = f"{field['key']}: {_format_value(field['value'])}"
+        cost = estimate_tokens(line)
+        if token_budget and selected and used + cost > token_budget:
+            break
+        selected.append((field, line))
+        used += cost
+    next_cursor = cursor + len(selected)
+
+    groups: Dict[str, List[str]] = {}
+    for field, line in selected:
+        groups.setdefault(field["tool"], []).append(line)
+
+    if passage_lines:
+        groups["網頁相關段落"] = passage_lines
+
+    filter_note = f"，篩選: {keyword}" if keyword else ""
+    if not selected and not passage_lines:
+        return f"# {ticker} 提取數據 (共 {total} 個欄位{filter_note})\n(沒有更多欄位)"
+    lines = [f"# {ticker} 提取數據 (欄位 {cursor + 1}-{next_cursor} / {total}，約 {used} tokens{filter_note})"]
+    dedupe = data.get("dedupe")
+    if cursor == 0 and dedupe and dedupe.get("tokens_saved"):
+        lines.append(f"(新聞 / 搜尋結果去重：{dedupe['items_in']} → {dedupe['items_out']} 則，節省約 {dedupe['tokens_saved']} tokens；"
+                     "sources 欄位列出同一報導的所有來源)")
+    for tool, tool_lines in groups.items():
+        lines.append(f"\n[{tool}]")
+        lines.extend(tool_lines)
+
+    if next_cursor < total:
+        lines.append(
+            f"\n還有 {total - next_cursor} 個欄位未顯示 (相關度較低)。"
+            f"需要時呼叫 extract_more_data_tool(ticker=\"{ticker}\", cursor={next_cursor}"
+            + (f", keyword=\"{keyword}\"" if keyword else "") + ") 取得下一頁，"
+            "或以 keyword 指定欄位名稱 (例如 keyword=\"margin\")。"
+        )
+    return "\n".join(lines)
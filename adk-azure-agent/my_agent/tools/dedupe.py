@@ -0,0 +1,298 @@
+"""
+新聞 / 搜尋結果去重 - 合併 yf_get_ticker_news 與 web_search 中重複的同一篇報導
+
+- 網址正規化：去除 utm_* / fbclid 等追蹤參數、www. / m. 前綴、/amp 結尾與 fragment，排序其餘參數
+- MinHash (64 組雜湊，英文 3-gram + 中文 bigram)：標題 + 內文的估計 Jaccard 相似度 >= NEAR_DUPLICATE_SIMILARITY
+  視為同一篇 (轉載版本常改標題後綴或標點)；以 16 段 x 4 列的 LSH 分桶找候選，不需兩兩比較
+- 重複項目合併成一筆 (保留內文最長者)，sources 列出所有來源，並統計節省的 Token 數
+
+限制：只比對文字相似度，不同語言的翻譯版本只有在網址相同時才會合併。
+"""
+import json
+import re
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, urlencode, urlsplit, urlunsplit
+
+from ..llm_scheduler import estimate_tokens
+from ..metrics import get_metrics
+from .page_passages import tokenize
+
+# DedupeReport 記住已累計過的 key 數量上限 (超過時淘汰最舊的)
+MAX_COUNTED_KEYS = 4096
+
+# 估計 Jaccard 相似度達此門檻視為同一篇報導
+NEAR_DUPLICATE_SIMILARITY = 0.6
+
+# 文字太短時 MinHash 不穩定，只比對網址與完全相同的標題
+MIN_SHINGLES = 8
+
+_NUM_PERM = 64
+_BANDS = 16
+_ROWS = _NUM_PERM // _BANDS
+_MERSENNE_PRIME = (1 << 61) - 1
+# 固定的雜湊參數 (a * h + b) mod p，確保不同行程 / 重啟後結果一致
+_PERMUTATIONS = [
+    (int.from_bytes(hashlib.blake2b(f"a{i}".encode(), digest_size=8).digest(), "big") % (_MERSENNE_PRIME - 1) + 1,
+     int.from_bytes(hashlib.blake2b(f"b{i}".encode(), digest_size=8).digest(), "big") % _MERSENNE_PRIME)
+    for i in range(_NUM_PERM)
+]
+
+_TRACKING_PARAMS = re.compile(
+    r"^(utm_\w+|fbclid|gclid|dclid|msclkid|mc_cid|mc_eid|guccounter|guce_referrer\w*|ncid|yptr|ref|ref_src|"
+    r"src|cmpid|sr_share|soc_src|soc_trk|taid|smid|ocid|tsrc|.*_source|.*_medium|.*_campaign)$",
+    re.IGNORECASE,
+)
+
+_LIST_KEYS = ("results", "news", "items", "articles", "data")
+_TITLE_KEYS = ("title", "headline", "name")
+_BODY_KEYS = ("summary", "description", "snippet", "body", "text", "content")
+_URL_KEYS = ("url", "link", "canonicalUrl", "clickThroughUrl", "href")
+_SOURCE_KEYS = ("publisher", "provider", "source", "displayName", "siteName")
+
+
+def canonicalize_url(url: str) -> str:
+    """正規化網址，讓同一篇文章帶不同追蹤參數時得到相同結果"""
+    if not url or not isinstance(url, str):
+        return ""
+    try:
+        parts = urlsplit(url.strip())
+    except ValueError:
+        return url.strip().lower()
+    host = (parts.hostname or "").lower()
+    for prefix in ("www.", "m.", "amp.", "mobile."):
+        if host.startswith(prefix):
+            host = host[len(prefix):]
+    path = re.sub(r"/(amp|amp\.html)$", "", parts.path or "").rstrip("/")
+    query = urlencode(sorted((k, v) for k, v in parse_qsl(parts.query, keep_blank_values=False)
+                             if not _TRACKING_PARAMS.match(k)))
+    return urlunsplit(("https", host, path, query, ""))
+
+
+def shingles(text: str) -> set:
+    """英文以連續 3 個單字為一個特徵，中文 bigram 直接作為特徵"""
+    tokens = tokenize(text)
+    words = [t for t in tokens if t.isascii()]
+    features = {" ".join(words[i:i + 3]) for i in range(max(len(words) - 2, 1))} if words else set()
+    features.update(t for t in tokens if not t.isascii())
+    return features
+
+
+def minhash(features: set) -> Tuple[int, ...]:
+    """64 組雜湊的 MinHash 簽章 (兩個簽章相同位置相等的比例即為 Jaccard 相似度的估計)"""
+    hashes = [int.from_bytes(hashlib.blake2b(f.encode("utf-8"), digest_size=8).digest(), "big") for f in features]
+    return tuple(min((a * h + b) % _MERSENNE_PRIME for h in hashes) for a, b in _PERMUTATIONS)
+
+
+def _similarity(sig_a: Tuple[int, ...], sig_b: Tuple[int, ...]) -> float:
+    return sum(1 for x, y in zip(sig_a, sig_b) if x == y) / _NUM_PERM
+
+
+def _first_string(item: Dict[str, Any], keys: Tuple[str, ...], nested_keys: Tuple[str, ...] = ()) -> Optional[str]:
+    """
+    在 item 中找第一個字串值
+
+    nested_keys：key 對應的值為物件時 (例如 Yahoo 新聞的 canonicalUrl / provider)，改取其中這些欄位；
+    仍找不到時往下一層 (例如 Yahoo 新聞的 content) 搜尋。
+    """
+    for key in keys:
+        value = item.get(key)
+        if isinstance(value, str) and value.strip():
+            return value.strip()
+        if isinstance(value, dict) and nested_keys:
+            nested = _first_string(value, nested_keys)
+            if nested:
+                return nested
+    for value in item.values():
+        if isinstance(value, dict):
+            nested = _first_string(value, keys, nested_keys)
+            if nested:
+                return nested
+    return None
+
+
+def item_fields(item: Dict[str, Any]) -> Dict[str, str]:
+    """取出新聞 / 搜尋結果的標題、內文、網址與來源"""
+    return {
+        "title": _first_string(item, _TITLE_KEYS) or "",
+        "body": _first_string(item, _BODY_KEYS) or "",
+        "url": _first_string(item, _URL_KEYS, ("url", "href")) or "",
+        "source": _first_string(item, _SOURCE_KEYS, ("displayName", "name")) or "",
+    }
+
+
+def find_item_list(content: Any) -> Optional[List[Dict[str, Any]]]:
+    """判斷工具回覆是否為新聞 / 搜尋結果清單 (list of dict，且多數項目有標題)"""
+    if isinstance(content, dict):
+        for key in _LIST_KEYS:
+            if isinstance(content.get(key), list):
+                return find_item_list(content[key])
+        return None
+    if not isinstance(content, list) or not content or not all(isinstance(i, dict) for i in content):
+        return None
+    with_title = sum(1 for item in content if item_fields(item)["title"])
+    return content if with_title >= len(content) / 2 else None
+
+
+def replace_item_list(content: Any, items: List[Dict[str, Any]], replacement: Any) -> Any:
+    """
+    將 content 中的新聞清單換成 replacement (回傳複本，保留其他欄位，例如 yf_search 的 quotes)
+
+    content 本身就是清單時直接回傳 replacement。
+    """
+    if not isinstance(content, dict):
+        return replacement
+    replaced = dict(content)
+    for key in _LIST_KEYS:
+        if replaced.get(key) is items:
+            replaced[key] = replacement
+            break
+    return replaced
+
+
+class _Cluster:
+    def __init__(self, index: int, fields: Dict[str, str], origin: str, signature: Optional[Tuple[int, ...]]):
+        self.items = [(index, fields, origin)]
+        self.signature = signature
+
+    @property
+    def representative(self) -> Tuple[int, Dict[str, str], str]:
+        # 保留內文最長的版本 (通常是原始報導而非摘要轉載)
+        return max(self.items, key=lambda entry: len(entry[1]["body"]))
+
+
+def dedupe_items(items: List[Tuple[str, Dict[str, Any]]]) -> Tuple[List[Dict[str, Any]], Dict[str, Any]]:
+    """
+    合併近似重複的新聞 / 搜尋結果
+
+    Args:
+        items: [(來源標記 (例如 log 檔名或工具名稱), item), ...] (依原始順序)
+
+    Returns:
+        (去重後的 items，每筆重複的加上 sources 欄位,
+         統計 {"items_in", "items_out", "tokens_before", "tokens_after", "tokens_saved", "tokens_sources", "origins"})
+        tokens_saved 不含 sources 欄位，其額外成本為 tokens_sources；origins 為每筆去重後 item 所採用版本的來源標記
+    """
+    clusters: List[_Cluster] = []
+    by_url: Dict[str, _Cluster] = {}
+    by_title: Dict[str, _Cluster] = {}
+    buckets: Dict[Tuple[int, Tuple[int, ...]], List[_Cluster]] = {}
+
+    for index, (origin, item) in enumerate(items):
+        fields = item_fields(item)
+        url = canonicalize_url(fields["url"])
+        title_key = " ".join(tokenize(fields["title"]))
+        features = shingles(f"{fields['title']}\n{fields['body']}")
+        signature = minhash(features) if len(features) >= MIN_SHINGLES else None
+        bands = [(band, signature[band * _ROWS:(band + 1) * _ROWS]) for band in range(_BANDS)] if signature else []
+
+        match = by_url.get(url) if url else None
+        if match is None and title_key:
+            match = by_title.get(title_key)
+        if match is None and signature:
+            best = 0.0
+            for key in bands:
+                for candidate in buckets.get(key, []):
+                    similarity = _similarity(candidate.signature, signature)
+                    if similarity >= NEAR_DUPLICATE_SIMILARITY and similarity > best:
+                        match, best = candidate, similarity
+
+        if match is None:
+            match = _Cluster(index, fields, origin, signature)
+            clusters.append(match)
+            for key in bands:
+                buckets.setdefault(key, []).append(match)
+        else:
+            match.items.append((index, fields, origin))
+        if url:
+            by_url.setdefault(url, match)
+        if title_key:
+            by_title.setdefault(title_key, match)
+
+    unique, origins = [], []
+    for cluster in clusters:
+        index, _, origin = cluster.representative
+        unique.append(dict(items[index][1]))
+        origins.append(origin)
+
+    # 節省量以加上 sources 之前的內容計算；sources 的額外成本另外統計
+    tokens_before = estimate_tokens(json.dumps([item for _, item in items], ensure_ascii=False))
+    tokens_after = estimate_tokens(json.dumps(unique, ensure_ascii=False))
+
+    for cluster, merged in zip(clusters, unique):
+        if len(cluster.items) > 1:
+            sources = []
+            for _, fields, origin in cluster.items:
+                label = fields["source"] or urlsplit(fields["url"]).hostname or origin
+                entry = f"{label} ({fields['url']})" if fields["url"] else label
+                if entry not in sources:
+                    sources.append(entry)
+            merged["sources"] = "; ".join(sources)
+
+    stats = {
+        "items_in": len(items),
+        "items_out": len(unique),
+        "tokens_before": tokens_before,
+        "tokens_after": tokens_after,
+        "tokens_saved": max(tokens_before - tokens_after, 0),
+        "tokens_sources": estimate_tokens(json.dumps(unique, ensure_ascii=False)) - tokens_after,
+        "origins": origins,
+    }
+    return unique, stats
+
+
+class DedupeReport:
+    """每個 ticker 最近一次去重的統計 (extract_data_tool 顯示、metrics 累計)"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._latest: Dict[str, Dict[str, Any]] = {}
+        self._counted: "OrderedDict[tuple, None]" = OrderedDict()
+        self._tokens_saved = get_metrics().counter(
+            "dedupe_tokens_saved", "Estimated prompt tokens removed by news/search de-duplication", ["stage"])
+
+    def record(self, ticker: str, stats: Dict[str, Any], stage: str = "extract", key: str = None):
+        """
+        更新最近一次的統計；同一個 key (例如報告的 run_id) 的節省量只累計與輸出一次
+
+        同一份報告會多次提取數據 (extract_data_tool、分頁、驗證重試)，不應重複計入 metrics。
+        """
+        with self._lock:
+            self._latest[ticker] = dict(stats, stage=stage)
+            if key is not None:
+                counted_key = (key, ticker, stage)
+                if counted_key in self._counted:
+                    return
+                self._counted[counted_key] = None
+                while len(self._counted) > MAX_COUNTED_KEYS:
+                    self._counted.popitem(last=False)
+        if stats["tokens_saved"]:
+            self._tokens_saved.inc(stats["tokens_saved"], stage=stage)
+            print(f"🧹 Dedupe {ticker}: {stats['items_in']} → {stats['items_out']} items, "
+                  f"saved ~{stats['tokens_saved']:,} tokens")
+
+    def latest(self, ticker: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            return self._latest.get(ticker)
+
+
+# 全域去重統計
+_dedupe_report = None
+
+
+def get_dedupe_report() -> DedupeReport:
+    global _dedupe_report
+    if _dedupe_report is None:
+        _dedupe_report = DedupeReport()
+    return _dedupe_report
+
+
+def dedupe_tool_content(tool_name: str, content: Any) -> Any:
+    """get_mcp_log 用：單一工具回覆中的新聞 / 搜尋結果清單去重"""
+    items = find_item_list(content)
+    if not items or len(items) < 2:
+        return content
+    unique, _ = dedupe_items([(tool_name, item) for item in items])
+    return replace_item_list(content, items, unique)
@@ -0,0 +1,387 @@
+"""
+網頁段落檢索 - 對 url_fetch 抓回的網頁做本地後處理
+
+1. 主文擷取：去除 script / style / nav / footer 等區塊，並以連結密度與樣板字詞過濾導覽列、廣告、訂閱提示
+   (HTML 與 fetch-webpage 回傳的 Markdown / 純文字都適用)
+2. 切段：依段落累積到約 PASSAGE_CHARS 字元，過長的段落依句子切開
+3. 每個 ticker 一個 BM25 索引 (英文單字 + 中文字元 bigram)，只回傳與查詢最相關的前 k 段
+
+索引保存在記憶體，只有新增或變動的 url_fetch log 檔會重新解析。
+
+Usage:
+    search_fetched_pages("2330.TW", "revenue guidance 營收 財測", top_k=5)
+"""
+import os
+import re
+import json
+import math
+import threading
+from collections import Counter
+from functools import lru_cache
+from html.parser import HTMLParser
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+from .. import mcp_log_reader
+from ..mcp_log_reader import parse_mcp_content
+
+# 每段的目標長度 (字元)
+PASSAGE_CHARS = int(os.getenv("PAGE_PASSAGE_CHARS", "800"))
+
+# 判斷為網頁抓取工具的名稱關鍵字
+FETCH_TOOL_KEYWORDS = ("fetch",)
+
+# 預設查詢：關鍵訊息模板需要的主題 (extract_data_tool 附帶段落時使用)
+KEY_MESSAGE_QUERY = (
+    "revenue earnings growth margin guidance outlook target price analyst rating upgrade downgrade risk "
+    "營收 獲利 成長 毛利率 財測 展望 目標價 評等 風險"
+)
+
+_SKIP_TAGS = {"script", "style", "noscript", "nav", "header", "footer", "aside", "form", "iframe", "svg",
+              "button", "select", "template", "menu"}
+_BLOCK_TAGS = {"p", "div", "li", "h1", "h2", "h3", "h4", "h5", "h6", "article", "section", "main", "td",
+               "th", "blockquote", "pre", "br", "tr", "dd", "dt", "figcaption"}
+
+_BOILERPLATE_LINE = re.compile(
+    r"(cookie|subscribe|sign in|sign up|log in|newsletter|advertisement|all rights reserved|privacy policy|"
+    r"terms of (use|service)|share this|follow us|related articles|read more|skip to|accept all|"
+    r"訂閱|登入|註冊|廣告|版權所有|隱私權|服務條款|分享|追蹤我們|相關新聞|延伸閱讀|看更多)",
+    re.IGNORECASE,
+)
+_MARKDOWN_LINK = re.compile(r"!?\[([^\]]*)\]\([^)]*\)")
+_SENTENCE_END = re.compile(r"(?<=[。！？.!?])\s+|(?<=[。！？])")
+
+_STOPWORDS = frozenset(
+    "a an and are as at be by for from has have in is it its of on or that the this to was were will with "
+    "which who what when where how than then there their they them also but not into over after before".split()
+)
+
+
+# ============================================================================
+# 主文擷取
+# ============================================================================
+
+class _MainTextParser(HTMLParser):
+    """收集 HTML 的區塊文字，並記錄每個區塊中連結文字的比例"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.blocks: List[Tuple[str, int]] = []  # (文字, 連結文字長度)
+        self._skip_depth = 0
+        self._link_depth = 0
+        self._text: List[str] = []
+        self._link_chars = 0
+
+    def _flush(self):
+        text = " ".join("".join(self._text).split())
+        if text:
+            self.blocks.append((text, self._link_chars))
+        self._text, self._link_chars = [], 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip_depth += 1
+        elif tag == "a":
+            self._link_depth += 1
+        elif tag in _BLOCK_TAGS and not self._skip_depth:
+            self._flush()
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self._skip_depth = max(self._skip_depth - 1, 0)
+        elif tag == "a":
+            self._link_depth = max(self._link_depth - 1, 0)
+        elif tag in _BLOCK_TAGS and not self._skip_depth:
+            self._flush()
+
+    def handle_data(self, data):
+        if self._skip_depth:
+            return
+        self._text.append(data)
+        if self._link_depth:
+            self._link_chars += len(data.strip())
+
+    def close(self):
+        super().close()
+        self._flush()
+
+
+def _is_boilerplate(text: str, link_chars: int = 0) -> bool:
+    length = len(text)
+    if length == 0:
+        return True
+    # 連結文字佔多數的區塊為導覽列 / 推薦連結
+    if link_chars / length > 0.5:
+        return True
+    # 短句且含樣板字詞 (訂閱、登入、版權宣告等)
+    if length < 200 and _BOILERPLATE_LINE.search(text):
+        return True
+    # 以 | 或 · 分隔的選單列
+    if length < 300 and len(re.findall(r"\s[|·•]\s", text)) >= 3:
+        return True
+    return False
+
+
+def _blocks_from_text(text: str) -> List[Tuple[str, int]]:
+    """Markdown / 純文字：以空行或換行分段，連結文字計入連結比例"""
+    blocks = []
+    for paragraph in re.split(r"\n\s*\n", text):
+        lines = []
+        link_chars = 0
+        for line in paragraph.splitlines():
+            line = line.strip().lstrip("#>*-+ ").strip()
+            if not line:
+                continue
+            link_chars += sum(len(m.group(1)) for m in _MARKDOWN_LINK.finditer(line))
+            lines.append(_MARKDOWN_LINK.sub(r"\1", line))
+        if lines:
+            blocks.append((" ".join(lines), link_chars))
+    return blocks
+
+
+@lru_cache(maxsize=256)
+def extract_main_text(raw: str) -> str:
+    """擷取網頁主文 (HTML 或 Markdown / 純文字)，段落之間以空行分隔"""
+    if not raw:
+        return ""
+    if re.search(r"<(html|body|div|p|article)\b", raw[:5000], re.IGNORECASE):
+        parser = _MainTextParser()
+        try:
+            parser.feed(raw)
+            parser.close()
+            blocks = parser.blocks
+        except Exception:
+            blocks = _blocks_from_text(re.sub(r"<[^>]+>", " ", raw))
+    else:
+        blocks = _blocks_from_text(raw)
+
+    kept, seen = [], set()
+    for text, link_chars in blocks:
+        if _is_boilerplate(text, link_chars):
+            continue
+        # 過短的孤立片段 (按鈕、標籤) 略過，但保留像標題的短句
+        if len(text) < 25 and not re.search(r"[一-鿿]{6,}|\w+\s+\w+\s+\w+", text):
+            continue
+        if text in seen:
+            continue
+        seen.add(text)
+        kept.append(text)
+    return "\n\n".join(kept)
+
+
+def chunk_passages(text: str, max_chars: int = None) -> List[str]:
+    """依段落累積成約 max_chars 字元的段落，過長的段落依句子切開"""
+    max_chars = max_chars or PASSAGE_CHARS
+    pieces = []
+    for paragraph in text.split("\n\n"):
+        if len(paragraph) <= max_chars:
+            pieces.append(paragraph)
+            continue
+        sentence_buffer = ""
+        for sentence in (s.strip() for s in _SENTENCE_END.split(paragraph)):
+            if not sentence:
+                continue
+            if sentence_buffer and len(sentence_buffer) + len(sentence) > max_chars:
+                pieces.append(sentence_buffer)
+                sentence_buffer = ""
+            sentence_buffer = f"{sentence_buffer} {sentence}" if sentence_buffer else sentence
+        if sentence_buffer:
+            pieces.append(sentence_buffer)
+
+    passages, buffer = [], ""
+    for piece in pieces:
+        if buffer and len(buffer) + len(piece) > max_chars:
+            passages.append(buffer)
+            buffer = ""
+        buffer = f"{buffer}\n{piece}" if buffer else piece
+    if buffer:
+        passages.append(buffer)
+    # 單句仍超過上限時硬切
+    return [p[i:i + max_chars * 2] for p in passages for i in range(0, len(p), max_chars * 2)]
+
+
+def tokenize(text: str) -> List[str]:
+    """英文小寫單字 (去除停用詞) + 中文字元 bigram"""
+    text = text.lower()
+    tokens = [w for w in re.findall(r"[a-z0-9][a-z0-9.%$-]*[a-z0-9%]|[a-z0-9]", text) if w not in _STOPWORDS]
+    for run in re.findall(r"[一-鿿]+", text):
+        if len(run) == 1:
+            tokens.append(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+# ============================================================================
+# BM25 索引
+# ============================================================================
+
+class PassageIndex:
+    """單一 ticker 的 BM25 段落索引"""
+
+    def __init__(self, passages: List[Dict[str, Any]], k1: float = 1.5, b: float = 0.75):
+        self.passages = passages
+        self.k1 = k1
+        self.b = b
+        self.doc_freq: Counter = Counter()
+        for passage in passages:
+            self.doc_freq.update(passage["tf"].keys())
+        self.avg_len = sum(p["length"] for p in passages) / len(passages) if passages else 0.0
+
+    def search(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        terms = set(tokenize(query))
+        n = len(self.passages)
+        if not terms or not n:
+            return []
+        scored = []
+        for passage in self.passages:
+            tf, length = passage["tf"], passage["length"]
+            score = 0.0
+            for term in terms:
+                freq = tf.get(term)
+                if not freq:
+                    continue
+                df = self.doc_freq[term]
+                idf = math.log(1 + (n - df + 0.5) / (df + 0.5))
+                score += idf * freq * (self.k1 + 1) / (freq + self.k1 * (1 - self.b + self.b * length / (self.avg_len or 1)))
+            if score > 0:
+                scored.append((score, passage))
+        scored.sort(key=lambda item: -item[0])
+        return [{"score": round(score, 3), "url": p["url"], "text": p["text"]} for score, p in scored[:top_k]]
+
+
+class PassageStore:
+    """每個 ticker 的段落索引；log 檔未變動時重用已解析的段落"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # ticker -> (檔案指紋, PassageIndex, {path: (size, mtime_ns, passages)})
+        self._indexes: Dict[str, tuple] = {}
+
+    def get_index(self, ticker: str) -> PassageIndex:
+        files = []
+        ticker_dir = mcp_log_reader.LOG_DIR / ticker
+        if ticker_dir.exists():
+            for path in ticker_dir.glob("*.jsonl"):
+                if not any(k in path.name.lower() for k in FETCH_TOOL_KEYWORDS):
+                    continue
+                try:
+                    stat = path.stat()
+                except OSError:
+                    continue
+                files.append((path, stat.st_size, stat.st_mtime_ns))
+        files.sort()
+        fingerprint = tuple(files)
+
+        with self._lock:
+            cached = self._indexes.get(ticker)
+        if cached and cached[0] == fingerprint:
+            return cached[1]
+
+        previous = cached[2] if cached else {}
+        parsed, passages, seen = {}, [], set()
+        for path, size, mtime_ns in files:
+            entry = previous.get(path)
+            if entry is None or entry[:2] != (size, mtime_ns):
+                entry = (size, mtime_ns, _passages_from_log(path))
+            parsed[path] = entry
+            for passage in entry[2]:
+                # 同一網頁可能被抓取多次
+                if passage["text"] in seen:
+                    continue
+                seen.add(passage["text"])
+                passages.append(passage)
+
+        index = PassageIndex(passages)
+        with self._lock:
+            self._indexes[ticker] = (fingerprint, index, parsed)
+        return index
+
+    def search(self, ticker: str, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        return self.get_index(ticker).search(query, top_k)
+
+
+def _page_texts(content: Any, url: Optional[str]) -> List[Tuple[Optional[str], str]]:
+    """從 fetch 工具的回覆中找出網頁文字 (字串，或 [{url, content}] 之類的結構)"""
+    if isinstance(content, str):
+        return [(url, content)] if content.strip() else []
+    pages = []
+    if isinstance(content, dict):
+        page_url = content.get("url") or url
+        for value in content.values():
+            if isinstance(value, str) and len(value) > 200:
+                pages.append((page_url, value))
+            elif isinstance(value, (dict, list)):
+                pages.extend(_page_texts(value, page_url))
+    elif isinstance(content, list):
+        for item in content:
+            pages.extend(_page_texts(item, url))
+    return pages
+
+
+def _passages_from_log(path: Path) -> List[Dict[str, Any]]:
+    passages = []
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            for line in f:
+                entry = json.loads(line)
+                if not entry.get("success", True) or not entry.get("response"):
+                    continue
+                args = entry.get("arguments") or {}
+                url = args.get("url") if isinstance(args.get("url"), str) else None
+                for page_url, raw in _page_texts(parse_mcp_content(entry["response"]), url):
+                    for text in chunk_passages(extract_main_text(raw)):
+                        tokens = tokenize(text)
+                        passages.append({"url": page_url, "text": text, "tf": Counter(tokens), "length": len(tokens)})
+    except Exception as e:
+        print(f"⚠️ Error indexing fetched page log {path}: {e}")
+    return passages
+
+
+# 全域段落索引
+_passage_store = None
+
+
+def get_passage_store() -> PassageStore:
+    global _passage_store
+    if _passage_store is None:
+        _passage_store = PassageStore()
+    return _passage_store
+
+
+def clean_fetched_content(tool_name: str, content: Any) -> Any:
+    """get_mcp_log 用：網頁抓取工具的文字回覆只保留主文"""
+    if isinstance(content, str) and any(k in tool_name.lower() for k in FETCH_TOOL_KEYWORDS):
+        return extract_main_text(content)
+    return content
+
+
+def format_passages(passages: List[Dict[str, Any]]) -> str:
+    lines = []
+    for i, passage in enumerate(passages, 1):
+        source = f" ({passage['url']})" if passage.get("url") else ""
+        lines.append(f"[{i}]{source}\n{passage['text']}")
+    return "\n\n".join(lines)
+
+
+def search_fetched_pages(ticker: str, query: str, top_k: int = 5) -> str:
+    """
+    在已用 url_fetch 抓取的網頁中搜尋與查詢最相關的段落 (已去除導覽列、廣告等樣板內容)
+
+    Args:
+        ticker: 股票代碼 (與 url_fetch 呼叫時相同)
+        query: 想找的內容，中英文關鍵字皆可 (例如 "Q3 revenue guidance 營收 財測")
+        top_k: 回傳的段落數
+
+    Returns:
+        依相關度排序的段落 (附來源網址)
+    """
+    try:
+        index = get_passage_store().get_index(ticker)
+        if not index.passages:
+            return f"❌ 找不到 {ticker} 的網頁抓取記錄 (請先呼叫 url_fetch)"
+        passages = index.search(query, max(1, min(top_k, 20)))
+        if not passages:
+            return f"在 {ticker} 的 {len(index.passages)} 個網頁段落中找不到與「{query}」相關的內容"
+        return format_passages(passages)
+    except Exception as e:
+        return f"Error searching fetched pages: {str(e)}"
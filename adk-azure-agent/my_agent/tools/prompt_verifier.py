@@ -1,12 +1,21 @@
 import json
 import re
+import hashlib
 from pathlib import Path
 from datetime import datetime, timedelta
 from typing import Dict, List, Any
 
+from ..shared_cache import get_shared_cache
+from ..metrics import get_metrics
+from ..llm_ledger import get_llm_ledger
+from .dedupe import dedupe_items, find_item_list, replace_item_list, get_dedupe_report
+
 # 定義 Log 目錄位置 (假設在 ../mcp_logs)
 LOG_DIR = Path(__file__).parent.parent / "mcp_logs"
 
+# extract_data_for_prompt 結果在共用快取中的保存時間 (key 已包含 log 檔指紋，log 變動即失效)
+EXTRACT_CACHE_TTL = 3600
+
 def get_recent_logs(ticker: str, minutes: int = 60) -> List[Path]:
     """
     取得最近 X 分鐘內的相關 Log 檔案
@@ -138,6 +147,18 @@ def flatten_json(y: Any, prefix: str = "") -> Dict[str, Any]:
     flatten(y, prefix)
     return out
 
+def _logs_fingerprint(logs: List[Path]) -> str:
+    """以檔名、大小與修改時間代表目前的 log 內容 (log 為附加寫入，任何變動都會改變指紋)"""
+    parts = []
+    for log_file in logs:
+        try:
+            stat = log_file.stat()
+        except OSError:
+            continue
+        parts.append(f"{log_file.parent.name}/{log_file.name}:{stat.st_size}:{stat.st_mtime_ns}")
+    return hashlib.sha256("\n".join(parts).encode("utf-8")).hexdigest()
+
+
 def extract_data_for_prompt(ticker: str) -> Dict[str, Any]:
     """
     從最近的 mcp_logs 提取所有可用數據
@@ -146,10 +167,49 @@ def extract_data_for_prompt(ticker: str) -> Dict[str, Any]:
         "source_map": {str(value): source_key},
         "logs_used": [filenames]
     }
+
+    開啟 SHARED_CACHE 時，相同 log 集合的解析結果會在同一台主機的所有行程間共用。
     """
     logs = get_recent_logs(ticker)
+    fingerprint = _logs_fingerprint(logs)
+
+    shared_cache = get_shared_cache()
+    if not shared_cache.enabled:
+        data = _extract_data_from_logs(ticker, logs)
+    else:
+        cache_key = f"{ticker}:{fingerprint}"
+        data = shared_cache.get("extract_data", cache_key)
+        get_metrics().observe_cache("extract_data", data is not None)
+        if data is None:
+            data = _extract_data_from_logs(ticker, logs)
+            shared_cache.set("extract_data", cache_key, data, ttl_seconds=EXTRACT_CACHE_TTL)
+
+    # 去重統計每份報告 (ledger run) 只累計一次；不在 run 中時每組 log 內容累計一次，與快取命中與否無關
+    if data.get("dedupe"):
+        get_dedupe_report().record(ticker, data["dedupe"], key=get_llm_ledger().current_run_id() or fingerprint)
+    return data
+
+
+def _extract_data_from_logs(ticker: str, logs: List[Path]) -> Dict[str, Any]:
+    """解析 log 檔並展平所有數值 (extract_data_for_prompt 的實際工作)"""
     extracted = {}
     source_map = {} 
+    news_items = []  # 新聞 / 搜尋結果清單，跨 log 去重後再展平
+
+    def add_content(log_file: Path, content_data: Any):
+        flat = flatten_json(content_data)
+        items = find_item_list(content_data)
+        # 新聞清單留待去重後再展平；同一回覆的其他欄位 (例如 yf_search 的 quotes) 照常保留
+        kept = flat if not items else flatten_json(replace_item_list(content_data, items, None))
+        for k, v in flat.items():
+            if isinstance(v, (int, float, str)):
+                if k in kept:
+                    extracted[k] = v
+                # 記錄來源：檔名 + 欄位 (重複的新聞也保留來源，驗證時仍可比對)
+                # 注意：不同檔案可能有相同數值，這裡會覆蓋，但至少有一個來源
+                source_map[str(v)] = f"{log_file.name}:{k}"
+        if items:
+            news_items.extend((log_file.name, item) for item in items)
     
     for log_file in logs:
         try:
@@ -190,27 +250,32 @@ def extract_data_for_prompt(ticker: str) -> Dict[str, Any]:
                             try:
                                 # 嘗試二次解析 JSON string
                                 content_data = json.loads(content_data)
-                                flat = flatten_json(content_data)
-                                for k, v in flat.items():
-                                    if isinstance(v, (int, float, str)):
-                                        extracted[k] = v
-                                        source_map[str(v)] = f"{log_file.name}:{k}"
+                                add_content(log_file, content_data)
                             except:
                                 key = f"{log_file.name}:raw_text"
                                 extracted[key] = content_data
+                                # 純文字頁面也登記來源，context_packer 才能辨識並排除網頁抓取的原文
+                                source_map[content_data] = key
                         else:
-                            flat = flatten_json(content_data)
-                            for k, v in flat.items():
-                                if isinstance(v, (int, float, str)):
-                                    extracted[k] = v
-                                    # 記錄來源：檔名 + 欄位
-                                    # 注意：不同檔案可能有相同數值，這裡會覆蓋，但至少有一個來源
-                                    source_map[str(v)] = f"{log_file.name}:{k}"
+                            add_content(log_file, content_data)
                                     
             
         except Exception as e:
             print(f"Error reading {log_file}: {e}")
 
+    # -------------------------------------------------------------------------
+    # 新聞 / 搜尋結果去重 (同一篇報導的轉載、不同追蹤參數的網址合併成一筆)
+    # -------------------------------------------------------------------------
+    dedupe_stats = None
+    if news_items:
+        unique_items, dedupe_stats = dedupe_items(news_items)
+        origins = dedupe_stats.pop("origins")
+        for i, item in enumerate(unique_items):
+            for k, v in flatten_json(item, prefix=f"news.{i}.").items():
+                if isinstance(v, (int, float, str)):
+                    extracted[k] = v
+                    source_map.setdefault(str(v), f"{origins[i]}:{k}")
+
     # -------------------------------------------------------------------------
     # Cross-Exchange / Suspicious Data Detection
     # -------------------------------------------------------------------------
@@ -233,7 +298,8 @@ def extract_data_for_prompt(ticker: str) -> Dict[str, Any]:
         "extracted_data": extracted,
         "source_map": source_map,
         "logs_used": [p.name for p in logs],
-        "suspicious_alerts": suspicious_alerts
+        "suspicious_alerts": suspicious_alerts,
+        "dedupe": dedupe_stats
     }
 
 def verify_prompt_data(ticker: str, prompt_content: str) -> str:
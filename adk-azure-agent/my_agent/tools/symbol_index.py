@@ -0,0 +1,553 @@
+"""
+Symbol Index - 本地股票代碼 / 公司名稱索引，讓「台積電」、「TSMC」、「Apple」這類查詢不需 yf_search 即可解析
+
+- 每筆資料包含 symbol、完整名稱、簡稱、中文別名與交易所
+- 前綴查詢：正規化後的代碼 / 名稱 / 別名建成 Trie (「appl」→ AAPL、「台積」→ 2330.TW)
+- 模糊查詢：英文字元 3-gram、中文 bigram 的倒排索引，以 Dice 係數評分 (容許「nvida」這類拼字錯誤)
+- 資料來源 (依序合併)：
+  1. symbol_seed.json：常見台股 / 美股與中文別名
+  2. mcp_logs 中 yf_search / yf_get_ticker_info 的回覆 (只有單一結果的 yf_search 查詢字串會記為別名)
+  3. 環境變數 SYMBOL_INDEX_EXTRA 指定的 JSON 檔 (格式同 symbol_seed.json)
+- 建好的索引存於 my_agent/.adk/symbol_index.json，Agent 啟動時於背景載入 (載入完成前查詢視為未命中)；
+  超過 SYMBOL_INDEX_MAX_AGE_HOURS (預設 24) 小時會在背景重建，重建期間繼續使用舊索引
+- symbol_index_before_model：模型呼叫前先找出用戶訊息中提到的公司名稱 (例如「查一下台積電」)，
+  唯一對應時直接把 ticker 附在 System Instruction，省去 lookup_symbol 的工具回合
+
+設定 SYMBOL_INDEX=0 停用 (lookup_symbol 一律指示改用 yf_search)。
+"""
+import os
+import re
+import json
+import time
+import threading
+import unicodedata
+from pathlib import Path
+from typing import Any, Dict, Iterable, List, Optional
+
+from .. import mcp_log_reader
+from ..log_analytics import DirectoryLogSource
+from ..metrics import get_metrics
+
+SEED_PATH = Path(__file__).parent / "symbol_seed.json"
+DEFAULT_INDEX_PATH = Path(__file__).resolve().parent.parent / ".adk" / "symbol_index.json"
+DEFAULT_MAX_AGE_HOURS = 24
+
+# 模糊比對的最低分數 (Dice 係數)，低於此分數不列入候選
+FUZZY_MIN_SCORE = 0.5
+# 模糊比對視為唯一結果的門檻：最高分達此分數，且領先第二名至少 FUZZY_MARGIN
+FUZZY_CONFIDENT_SCORE = 0.6
+FUZZY_MARGIN = 0.15
+# 前綴比對視為唯一結果時，查詢字串至少需涵蓋名稱長度的比例 (避免「ap」直接鎖定 AAPL)
+PREFIX_CONFIDENT_COVERAGE = 0.5
+# 在句子中比對公司名稱時的最短 key 長度 (中文 / 英文)，避免「ai」、「co」之類的短字誤判
+MENTION_MIN_CJK_LENGTH = 2
+MENTION_MIN_LENGTH = 3
+
+# 由 mcp_logs 收錄的工具 (檔名前綴)
+_HARVEST_TOOLS = ("yf_search_", "yf_get_ticker_info_")
+
+# 名稱正規化時去除的公司型態字尾
+_NAME_STOPWORDS = {
+    "inc", "incorporated", "corp", "corporation", "co", "company", "ltd", "limited", "plc", "holding",
+    "holdings", "group", "the", "nv", "sa", "ag", "se", "ky",
+}
+_CJK_SUFFIX = re.compile(r"(股份有限公司|有限公司|控股公司|公司)$")
+_NON_WORD = re.compile(r"[^\w]+")
+
+
+def _has_cjk(text: str) -> bool:
+    return any("㐀" <= ch <= "鿿" or "豈" <= ch <= "﫿" for ch in text)
+
+
+def normalize_symbol(text: str) -> str:
+    return unicodedata.normalize("NFKC", text or "").strip().upper()
+
+
+def normalize_name(text: str) -> str:
+    """全形轉半形、轉小寫、去除標點與公司型態字尾 (Inc. / Corporation / 股份有限公司 ...)"""
+    text = unicodedata.normalize("NFKC", text or "").lower().replace("&", " and ")
+    tokens = [t for t in _NON_WORD.sub(" ", text).split() if t not in _NAME_STOPWORDS]
+    normalized = " ".join(tokens) or " ".join(_NON_WORD.sub(" ", text).split())
+    return _CJK_SUFFIX.sub("", normalized) or normalized
+
+
+def ngrams(key: str) -> set:
+    """中文以 bigram、英文以前後補空白的 3-gram 作為模糊比對特徵"""
+    if _has_cjk(key):
+        compact = key.replace(" ", "")
+        return {compact[i:i + 2] for i in range(len(compact) - 1)} or {compact}
+    padded = f"  {key} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class _TrieNode:
+    __slots__ = ("children", "entries")
+
+    def __init__(self):
+        self.children: Dict[str, "_TrieNode"] = {}
+        self.entries: Dict[int, str] = {}  # entry id -> 完整 key
+
+
+class SymbolIndex:
+    """不可變的查詢結構 (重建時整個替換，查詢不需加鎖)"""
+
+    def __init__(self, entries: List[Dict[str, Any]], built_at: float = None):
+        self.entries = entries
+        self.built_at = built_at or time.time()
+        self._exact: Dict[str, set] = {}
+        self._trie = _TrieNode()
+        self._grams: Dict[str, set] = {}
+        self._gram_counts: Dict[str, int] = {}
+        self._name_keys: set = set()  # 名稱 / 別名 key (句子比對只使用這些，不比對代碼)
+        for entry_id, entry in enumerate(entries):
+            name_keys = self._entry_name_keys(entry)
+            self._name_keys.update(name_keys)
+            for key in self._entry_keys(entry) | name_keys:
+                self._add_key(key, entry_id)
+
+    @staticmethod
+    def _entry_keys(entry: Dict[str, Any]) -> set:
+        symbol = normalize_symbol(entry["symbol"])
+        keys = {symbol.lower(), symbol.split(".")[0].lower()}
+        keys.discard("")
+        return keys
+
+    @staticmethod
+    def _entry_name_keys(entry: Dict[str, Any]) -> set:
+        keys = {normalize_name(text)
+                for text in [entry.get("name"), entry.get("short_name")] + list(entry.get("aliases") or [])
+                if text}
+        keys.discard("")
+        return keys
+
+    def _add_key(self, key: str, entry_id: int):
+        self._exact.setdefault(key, set()).add(entry_id)
+        node = self._trie
+        for ch in key:
+            node = node.children.setdefault(ch, _TrieNode())
+        node.entries[entry_id] = key
+        grams = ngrams(key)
+        self._gram_counts[key] = len(grams)
+        for gram in grams:
+            self._grams.setdefault(gram, set()).add(key)
+
+    def _prefix(self, prefix: str, limit: int) -> Dict[int, str]:
+        """Trie 前綴查詢：回傳 {entry id: 符合的最短 key}"""
+        node = self._trie
+        for ch in prefix:
+            node = node.children.get(ch)
+            if node is None:
+                return {}
+        found: Dict[int, str] = {}
+        stack = [node]
+        while stack and len(found) < limit:
+            current = stack.pop()
+            for entry_id, key in current.entries.items():
+                if entry_id not in found or len(key) < len(found[entry_id]):
+                    found[entry_id] = key
+            stack.extend(current.children.values())
+        return found
+
+    def _fuzzy(self, key: str) -> Dict[str, float]:
+        """n-gram 倒排索引：只計算與查詢有共同特徵的 key 的 Dice 係數"""
+        grams = ngrams(key)
+        overlap: Dict[str, int] = {}
+        for gram in grams:
+            for candidate in self._grams.get(gram, ()):
+                overlap[candidate] = overlap.get(candidate, 0) + 1
+        return {candidate: 2 * shared / (len(grams) + self._gram_counts[candidate])
+                for candidate, shared in overlap.items()}
+
+    def lookup(self, query: str, limit: int = 5) -> List[Dict[str, Any]]:
+        """
+        查詢代碼 / 名稱 / 別名
+
+        Returns:
+            [{"symbol", "name", "short_name", "aliases", "exchange", "score", "match"}, ...] (分數由高到低)
+            match 為 "exact" / "prefix" / "fuzzy"；exact 分數為 1.0
+        """
+        key = normalize_name(query)
+        symbol_key = normalize_symbol(query).lower()
+        if not key and not symbol_key:
+            return []
+        scored: Dict[int, tuple] = {}
+
+        def offer(entry_id: int, score: float, match: str):
+            if entry_id not in scored or score > scored[entry_id][0]:
+                scored[entry_id] = (score, match)
+
+        for exact_key in {key, symbol_key}:
+            for entry_id in self._exact.get(exact_key, ()):
+                offer(entry_id, 1.0, "exact")
+        if key:
+            # 前綴分數 0.6 ~ 0.9，依查詢涵蓋名稱的比例
+            for entry_id, matched in self._prefix(key, limit * 4).items():
+                offer(entry_id, 0.6 + 0.3 * len(key) / len(matched), "prefix")
+            for candidate, score in self._fuzzy(key).items():
+                if score >= FUZZY_MIN_SCORE:
+                    for entry_id in self._exact[candidate]:
+                        offer(entry_id, round(score * 0.9, 4), "fuzzy")
+
+        ranked = sorted(scored.items(), key=lambda item: (-item[1][0], self.entries[item[0]]["symbol"]))
+        return [dict(self.entries[entry_id], score=round(score, 4), match=match)
+                for entry_id, (score, match) in ranked[:limit]]
+
+    def resolve(self, query: str, limit: int = 5) -> Dict[str, Any]:
+        """
+        判斷查詢是否可直接鎖定單一 ticker
+
+        Returns:
+            {"status": "resolved" | "ambiguous" | "miss", "matches": [...]}
+        """
+        matches = self.lookup(query, limit)
+        if not matches:
+            return {"status": "miss", "matches": []}
+        best = matches[0]
+        runner_up = matches[1]["score"] if len(matches) > 1 else 0.0
+        if best["match"] == "exact":
+            confident = runner_up < 1.0
+        elif best["match"] == "prefix":
+            confident = len(matches) == 1 and best["score"] >= 0.6 + 0.3 * PREFIX_CONFIDENT_COVERAGE
+        else:
+            confident = best["score"] / 0.9 >= FUZZY_CONFIDENT_SCORE and best["score"] - runner_up >= FUZZY_MARGIN
+        return {"status": "resolved" if confident else "ambiguous", "matches": matches}
+
+    def find_mentions(self, text: str) -> List[Dict[str, Any]]:
+        """
+        找出句子中提到的公司名稱 / 別名 (例如「查一下台積電」→ 2330.TW、「how is apple doing」→ AAPL)
+
+        從每個位置沿 Trie 向後比對完整的名稱 key；英文 key 需位於單字邊界，重疊時保留較長的比對。
+
+        Returns:
+            與 lookup 相同格式的項目 (match 為 "mention")，依出現順序排列且不重複
+        """
+        normalized = normalize_name(text)
+        spans = []
+        for start in range(len(normalized)):
+            if start and normalized[start - 1].isalnum() and not _has_cjk(normalized[start - 1:start + 1]):
+                continue
+            node = self._trie
+            for end in range(start, len(normalized)):
+                node = node.children.get(normalized[end])
+                if node is None:
+                    break
+                key = normalized[start:end + 1]
+                if not node.entries or key not in self._name_keys:
+                    continue
+                cjk = _has_cjk(key)
+                if len(key) < (MENTION_MIN_CJK_LENGTH if cjk else MENTION_MIN_LENGTH):
+                    continue
+                after = normalized[end + 1:end + 2]
+                if not cjk and after.isalnum() and not _has_cjk(after):
+                    continue
+                spans.append((start, end + 1, sorted(node.entries)))
+
+        kept = []
+        for start, end, entry_ids in sorted(spans, key=lambda s: (s[0] - s[1], s[0])):
+            if all(end <= s or start >= e for s, e, _ in kept):
+                kept.append((start, end, entry_ids))
+
+        mentions: Dict[int, Dict[str, Any]] = {}
+        for _, _, entry_ids in sorted(kept):
+            for entry_id in entry_ids:
+                mentions.setdefault(entry_id, dict(self.entries[entry_id], score=1.0, match="mention"))
+        return list(mentions.values())
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {"built_at": self.built_at, "entries": self.entries}
+
+
+# ============================================================================
+# 建立索引
+# ============================================================================
+
+def _make_entry(symbol: Any, name: Any = None, short_name: Any = None, exchange: Any = None,
+                aliases: Iterable[str] = ()) -> Optional[Dict[str, Any]]:
+    if not isinstance(symbol, str) or not symbol.strip():
+        return None
+    return {
+        "symbol": normalize_symbol(symbol),
+        "name": name if isinstance(name, str) else "",
+        "short_name": short_name if isinstance(short_name, str) else "",
+        "aliases": [a for a in aliases if isinstance(a, str) and a.strip()],
+        "exchange": exchange if isinstance(exchange, str) else "",
+    }
+
+
+def _load_entry_file(path: Path) -> List[Dict[str, Any]]:
+    with open(path, "r", encoding="utf-8") as f:
+        raw = json.load(f)
+    entries = []
+    for item in raw if isinstance(raw, list) else raw.get("entries", []):
+        entry = _make_entry(item.get("symbol"), item.get("name"), item.get("short_name"),
+                            item.get("exchange"), item.get("aliases") or [])
+        if entry:
+            entries.append(entry)
+    return entries
+
+
+def harvest_log_entries(log_dir: Path = None) -> List[Dict[str, Any]]:
+    """由 mcp_logs 中 yf_search / yf_get_ticker_info 的成功回覆收錄代碼與名稱"""
+    source = DirectoryLogSource(log_dir or mcp_log_reader.LOG_DIR)
+    entries = []
+    for shard in source.iter_shards():
+        if not os.path.basename(shard).startswith(_HARVEST_TOOLS):
+            continue
+        for record, _ in source.read_shard(shard):
+            if not record or not record.get("success", True):
+                continue
+            content = mcp_log_reader.parse_mcp_content(record.get("response"))
+            if isinstance(content, dict) and isinstance(content.get("quotes"), list):
+                content = content["quotes"]
+            if isinstance(content, list):
+                query = (record.get("arguments") or {}).get("query")
+                # 只有唯一結果時，查詢字串 (例如「台積電」) 才能確定是該公司的別名
+                aliases = [query] if isinstance(query, str) and len(content) == 1 else []
+                for item in content:
+                    if isinstance(item, dict):
+                        entries.append(_make_entry(
+                            item.get("symbol"), item.get("longname"), item.get("shortname"),
+                            item.get("exchDisp") or item.get("exchange"), aliases))
+            elif isinstance(content, dict):
+                entries.append(_make_entry(
+                    content.get("symbol"), content.get("longName"), content.get("shortName"),
+                    content.get("fullExchangeName") or content.get("exchange")))
+    return [e for e in entries if e]
+
+
+def merge_entries(*sources: Iterable[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """依 symbol 合併：先出現的名稱優先，別名取聯集"""
+    merged: Dict[str, Dict[str, Any]] = {}
+    for entries in sources:
+        for entry in entries:
+            current = merged.setdefault(entry["symbol"], dict(entry, aliases=[]))
+            for field in ("name", "short_name", "exchange"):
+                if not current[field] and entry[field]:
+                    current[field] = entry[field]
+            for alias in entry["aliases"]:
+                if alias not in current["aliases"]:
+                    current["aliases"].append(alias)
+    return sorted(merged.values(), key=lambda e: e["symbol"])
+
+
+def build_symbol_index(log_dir: Path = None, extra_path: str = None) -> SymbolIndex:
+    """合併種子清單、mcp_logs 收錄結果與額外別名檔，建立新索引"""
+    sources = [_load_entry_file(SEED_PATH), harvest_log_entries(log_dir)]
+    extra_path = extra_path or os.getenv("SYMBOL_INDEX_EXTRA")
+    if extra_path:
+        sources.append(_load_entry_file(Path(extra_path)))
+    return SymbolIndex(merge_entries(*sources))
+
+
+def save_symbol_index(index: SymbolIndex, path: Path) -> Path:
+    path = Path(path)
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = path.with_suffix(f".tmp{os.getpid()}")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index.to_dict(), f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+    return path
+
+
+def load_symbol_index(path: Path) -> Optional[SymbolIndex]:
+    try:
+        with open(path, "r", encoding="utf-8") as f:
+            data = json.load(f)
+        return SymbolIndex(data["entries"], data.get("built_at"))
+    except (OSError, ValueError, KeyError) as e:
+        if not isinstance(e, FileNotFoundError):
+            print(f"⚠️ Failed to load symbol index {path}: {e}")
+        return None
+
+
+class SymbolIndexManager:
+    """持有目前的索引，過期時在背景執行緒重建並替換"""
+
+    def __init__(self, path: Path = None, max_age_hours: float = DEFAULT_MAX_AGE_HOURS, enabled: bool = True):
+        self.path = Path(path or DEFAULT_INDEX_PATH)
+        self.max_age_seconds = max_age_hours * 3600
+        self.enabled = enabled
+        self._index: Optional[SymbolIndex] = None
+        self._lock = threading.Lock()
+        self._building = False
+
+    def _is_stale(self, index: SymbolIndex) -> bool:
+        return bool(self.max_age_seconds) and time.time() - index.built_at > self.max_age_seconds
+
+    def rebuild(self) -> SymbolIndex:
+        started = time.perf_counter()
+        index = build_symbol_index()
+        try:
+            save_symbol_index(index, self.path)
+        except OSError as e:
+            print(f"⚠️ Failed to save symbol index {self.path}: {e}")
+        self._index = index
+        print(f"🔤 Symbol index rebuilt: {len(index.entries)} symbols in {time.perf_counter() - started:.2f}s")
+        return index
+
+    def _load_or_rebuild(self):
+        """載入磁碟上的索引；不存在或已過期時重建 (過期的舊索引在重建期間先行使用)"""
+        index = load_symbol_index(self.path)
+        if index is not None:
+            self._index = index
+        if index is None or self._is_stale(index):
+            self.rebuild()
+
+    def _run_in_background(self, target):
+        def run():
+            try:
+                target()
+            except Exception as e:
+                print(f"⚠️ Symbol index rebuild failed: {e}")
+            finally:
+                self._building = False
+
+        with self._lock:
+            if self._building:
+                return
+            self._building = True
+        threading.Thread(target=run, name="symbol-index-rebuild", daemon=True).start()
+
+    def warm_up(self):
+        """在背景執行緒載入 (或建立) 索引，Agent 啟動時呼叫，避免第一次查詢在 Event Loop 上讀檔 / 重建"""
+        if self.enabled and self._index is None:
+            self._run_in_background(self._load_or_rebuild)
+
+    def get(self) -> Optional[SymbolIndex]:
+        """回傳目前的索引；尚未載入完成時啟動背景載入並回傳 None (呼叫端視為未命中)"""
+        index = self._index
+        if index is None:
+            self.warm_up()
+            return None
+        if self._is_stale(index):
+            self._run_in_background(self.rebuild)
+        return index
+
+
+# 全域索引
+_symbol_index_manager = None
+
+
+def get_symbol_index_manager() -> SymbolIndexManager:
+    global _symbol_index_manager
+    if _symbol_index_manager is None:
+        _symbol_index_manager = SymbolIndexManager(
+            path=os.getenv("SYMBOL_INDEX_PATH") or None,
+            max_age_hours=float(os.getenv("SYMBOL_INDEX_MAX_AGE_HOURS", str(DEFAULT_MAX_AGE_HOURS))),
+            enabled=os.getenv("SYMBOL_INDEX", "1") not in ("0", "false"),
+        )
+    return _symbol_index_manager
+
+
+def get_symbol_index() -> Optional[SymbolIndex]:
+    return get_symbol_index_manager().get()
+
+
+# ============================================================================
+# Agent 工具
+# ============================================================================
+
+_USE_YF_SEARCH = """⚠️ 本地代碼索引找不到「{query}」
+
+---
+__AGENT_ACTION__: USE_YF_SEARCH
+---
+
+💡 請改用 yf_search 搜尋..."""
+
+
+def lookup_symbol(query: str) -> str:
+    """
+    在本地代碼索引中查詢公司名稱 / 中文簡稱 / 代碼 (不需網路，應在 yf_search 之前呼叫)
+
+    Args:
+        query: 用戶輸入的公司名稱或代碼 (例如「台積電」、「TSMC」、「Apple」)
+
+    Returns:
+        與 format_search_results 相同格式的訊息：唯一結果含 `__AGENT_ACTION__: USE_TICKER=XXX`，
+        多個候選為清單，找不到時含 `__AGENT_ACTION__: USE_YF_SEARCH`
+    """
+    manager = get_symbol_index_manager()
+    index = manager.get() if manager.enabled else None
+    if index is None:
+        return _USE_YF_SEARCH.format(query=query)
+    result = index.resolve(query)
+    get_metrics().observe_cache("symbol_index", result["status"] == "resolved")
+
+    if result["status"] == "miss":
+        return _USE_YF_SEARCH.format(query=query)
+
+    if result["status"] == "resolved":
+        item = result["matches"][0]
+        name = item["name"] or item["short_name"] or "N/A"
+        return f"""✅ 本地代碼索引找到唯一匹配結果：**{item['symbol']}** - {name} ({item['exchange'] or 'N/A'})
+
+🚀 **自動使用此 ticker 繼續查詢...**
+
+---
+__AGENT_ACTION__: USE_TICKER={item['symbol']}
+---"""
+
+    lines = [f"本地代碼索引找到 **{len(result['matches'])}** 個候選股票，請選擇：\n"]
+    for idx, item in enumerate(result["matches"], 1):
+        lines.append(f"**{idx}. {item['symbol']}**")
+        lines.append(f"   名稱：{item['name'] or item['short_name'] or 'N/A'}")
+        if item["aliases"]:
+            lines.append(f"   別名：{'、'.join(item['aliases'])}")
+        lines.append(f"   交易所：{item['exchange'] or 'N/A'}\n")
+    lines.append("📌 **請回覆編號或直接輸入 ticker 代碼**")
+    lines.append("（若清單中沒有要找的公司，請改用 yf_search 搜尋）")
+    return "\n".join(lines)
+
+
+_PRE_RESOLVED = """[本地代碼索引預先解析] 用戶訊息中的「{mention}」唯一對應：**{symbol}** - {name} ({exchange})
+
+---
+__AGENT_ACTION__: USE_TICKER={symbol}
+---
+
+若用戶要查的正是這家公司，直接從步驟 4 開始，不需呼叫 `lookup_symbol` 或 `yf_search`。"""
+
+
+def _latest_user_text(contents) -> tuple:
+    """回傳 (最後一則用戶訊息文字, 是否為本回合第一次模型呼叫)；略過 ADK 轉換的 "For context:" 訊息"""
+    for i in range(len(contents) - 1, -1, -1):
+        content = contents[i]
+        if content.role != "user":
+            continue
+        parts = content.parts or []
+        text = "".join(p.text or "" for p in parts)
+        if text.strip() and not text.startswith("For context:"):
+            return text, i == len(contents) - 1
+    return "", False
+
+
+def symbol_index_before_model(callback_context, llm_request):
+    """
+    before_model_callback：用戶訊息只提到一家索引中的公司時，把解析結果附在 System Instruction
+
+    每次模型呼叫都附上相同文字 (同一回合的 Prompt 前綴保持一致)；索引尚未載入完成時不做任何事。
+    """
+    manager = get_symbol_index_manager()
+    index = manager.get() if manager.enabled else None
+    if index is None:
+        return None
+
+    text, first_call = _latest_user_text(llm_request.contents or [])
+    if not text:
+        return None
+    mentions = index.find_mentions(text)
+    if first_call:
+        get_metrics().observe_cache("symbol_index", len(mentions) == 1)
+    if len(mentions) != 1:
+        return None
+
+    item = mentions[0]
+    normalized = normalize_name(text)
+    mention = next((alias for alias in [item["name"], item["short_name"]] + item["aliases"]
+                    if alias and normalize_name(alias) in normalized), item["symbol"])
+    llm_request.append_instructions([_PRE_RESOLVED.format(
+        mention=mention, symbol=item["symbol"], name=item["name"] or item["short_name"] or "N/A",
+        exchange=item["exchange"] or "N/A",
+    )])
+    return None
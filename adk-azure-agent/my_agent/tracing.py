@@ -0,0 +1,393 @@
+"""
+Span Tracing - 記錄每個回合中 Agent 轉移、工具呼叫與模型呼叫的階層與耗時
+
+Span 類型：
+- turn：一次使用者輸入 (第一個 Agent 開始到結束)
+- agent：每個 Agent 的執行區間 (transfer 時子 Agent 的 span 位於父 Agent 之下)
+- tool：所有工具呼叫 (MCP 與本地函式工具，含 transfer_to_agent)
+- llm：模型呼叫 (ADK Agent 的 callback 與流水線的直接呼叫)
+
+預設關閉，透過環境變數開啟：
+    AGENT_TRACE=chrome            # chrome | otlp | both
+    AGENT_TRACE_DIR=...           # 預設 my_agent/.adk/traces
+
+chrome：每個回合寫入 {trace_id}.json (Chrome trace-event 格式，可用 chrome://tracing 或 ui.perfetto.dev 開啟)
+otlp：每個回合附加一行到 traces.otlp.jsonl (OpenTelemetry OTLP/JSON，與 OTel Collector file exporter 相同格式)
+"""
+import os
+import json
+import time
+import uuid
+import asyncio
+import threading
+import contextvars
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+
+TRACE_FORMATS = ("chrome", "otlp", "both")
+
+
+@dataclass
+class Span:
+    """一個計時區間"""
+    name: str
+    kind: str
+    trace_id: str
+    span_id: str
+    parent_id: Optional[str]
+    start_ns: int
+    end_ns: Optional[int] = None
+    attributes: Dict[str, Any] = field(default_factory=dict)
+    status: str = "ok"
+    lane: int = 0
+    # activate 時被取代的「目前 span」，結束時還原
+    previous: Optional["Span"] = field(default=None, repr=False)
+    active: bool = False
+
+    @property
+    def duration_ms(self) -> float:
+        return ((self.end_ns or time.time_ns()) - self.start_ns) / 1e6
+
+
+class _Trace:
+    """同一回合 (trace_id) 的所有 span"""
+
+    def __init__(self, trace_id: str):
+        self.trace_id = trace_id
+        self.spans: List[Span] = []
+        self.lanes: Dict[int, int] = {}
+
+    def lane_for_current_task(self) -> int:
+        """以 asyncio Task 區分 Chrome trace 的 tid，讓平行的工具呼叫顯示在不同列"""
+        try:
+            task_key = id(asyncio.current_task())
+        except RuntimeError:
+            task_key = threading.get_ident()
+        return self.lanes.setdefault(task_key, len(self.lanes) + 1)
+
+
+# 目前的 span (工具與子 Agent 的父 span)
+_current_span: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("agent_trace_span", default=None)
+
+
+class Tracer:
+    """建立 span 並在回合結束時匯出"""
+
+    def __init__(self, export_format: str = None, trace_dir: str = None):
+        if trace_dir is None:
+            trace_dir = Path(__file__).parent / ".adk" / "traces"
+
+        self.export_format = export_format if export_format in TRACE_FORMATS else None
+        self.enabled = self.export_format is not None
+        self.trace_dir = Path(trace_dir)
+        self._traces: Dict[str, _Trace] = {}
+        # (invocation_id, agent_name) -> 尚未結束的 llm span
+        self._open_llm: Dict[tuple, Span] = {}
+        self._lock = threading.Lock()
+
+        if self.enabled:
+            self.trace_dir.mkdir(parents=True, exist_ok=True)
+            print(f"✓ Tracing enabled ({self.export_format}): {self.trace_dir}/")
+
+    # ------------------------------------------------------------------
+    # Span 管理
+    # ------------------------------------------------------------------
+    def start_span(self, name: str, kind: str, parent: Span = None, activate: bool = True, **attributes) -> Optional[Span]:
+        """
+        開始一個 span (parent 預設為目前的 span，沒有則開始新的 trace)
+
+        activate=True 時設為目前的 span，之後開始的 span 會成為其子 span。
+        """
+        if not self.enabled:
+            return None
+        parent = parent if parent is not None else _current_span.get()
+        trace_id = parent.trace_id if parent else uuid.uuid4().hex
+        with self._lock:
+            trace = self._traces.setdefault(trace_id, _Trace(trace_id))
+            span = Span(
+                name=name,
+                kind=kind,
+                trace_id=trace_id,
+                span_id=uuid.uuid4().hex[:16],
+                parent_id=parent.span_id if parent else None,
+                start_ns=time.time_ns(),
+                attributes={k: v for k, v in attributes.items() if v is not None},
+                lane=trace.lane_for_current_task(),
+            )
+            trace.spans.append(span)
+        if activate:
+            span.previous, span.active = _current_span.get(), True
+            _current_span.set(span)
+        return span
+
+    def end_span(self, span: Optional[Span], status: str = None, **attributes):
+        """結束 span；若為 trace 的根 span 則匯出整個 trace"""
+        if span is None or span.end_ns is not None:
+            return
+        span.end_ns = time.time_ns()
+        if status:
+            span.status = status
+        span.attributes.update({k: v for k, v in attributes.items() if v is not None})
+
+        if span.active:
+            # 不用 ContextVar.reset：callback 可能在不同的 Context 中結束 span
+            if _current_span.get() is span:
+                _current_span.set(span.previous)
+            span.previous, span.active = None, False
+
+        if span.parent_id is None:
+            self._finish_trace(span.trace_id)
+
+    @contextmanager
+    def span(self, name: str, kind: str = "internal", **attributes):
+        """以 with 區塊包住的 span (關閉時為零成本)"""
+        span = self.start_span(name, kind, **attributes)
+        if span is None:
+            yield None
+            return
+        try:
+            yield span
+        except BaseException as e:
+            self.end_span(span, status="error", error=str(e)[:200])
+            raise
+        else:
+            self.end_span(span)
+
+    def record_span(self, name: str, kind: str, duration_ms: float, status: str = None, **attributes):
+        """記錄一個剛結束的 span (事後才知道耗時的呼叫，例如 LLM Ledger 的記錄)"""
+        if not self.enabled or _current_span.get() is None:
+            return
+        span = self.start_span(name, kind, activate=False, **attributes)
+        span.start_ns = time.time_ns() - int(duration_ms * 1e6)
+        self.end_span(span, status=status)
+
+    def annotate(self, **attributes):
+        """在目前的 span 加上屬性 (例如 MCP 回覆大小)，ticker 同時補到回合 span"""
+        span = _current_span.get()
+        if span is None:
+            return
+        span.attributes.update({k: v for k, v in attributes.items() if v is not None})
+        ticker = attributes.get("ticker")
+        if ticker and ticker != "unknown":
+            root = self._root_span(span.trace_id)
+            if root is not None and "ticker" not in root.attributes:
+                root.attributes["ticker"] = ticker
+
+    def _root_span(self, trace_id: str) -> Optional[Span]:
+        trace = self._traces.get(trace_id)
+        if trace:
+            for span in trace.spans:
+                if span.parent_id is None:
+                    return span
+        return None
+
+    # ------------------------------------------------------------------
+    # 匯出
+    # ------------------------------------------------------------------
+    def _finish_trace(self, trace_id: str):
+        with self._lock:
+            trace = self._traces.pop(trace_id, None)
+            for key in [k for k, s in self._open_llm.items() if s.trace_id == trace_id]:
+                del self._open_llm[key]
+        if trace is None:
+            return
+        now = time.time_ns()
+        for span in trace.spans:
+            span.previous = None
+            if span.end_ns is None:
+                # 例外中斷而未收到結束 callback 的 span
+                span.end_ns = now
+                span.status = "unfinished"
+        try:
+            if self.export_format in ("chrome", "both"):
+                self._export_chrome(trace)
+            if self.export_format in ("otlp", "both"):
+                self._export_otlp(trace)
+        except Exception as e:
+            print(f"⚠️ Failed to export trace {trace_id}: {e}")
+
+    def _export_chrome(self, trace: _Trace) -> Path:
+        pid = os.getpid()
+        events = [
+            {
+                "name": span.name,
+                "cat": span.kind,
+                "ph": "X",
+                "ts": span.start_ns / 1000,
+                "dur": (span.end_ns - span.start_ns) / 1000,
+                "pid": pid,
+                "tid": span.lane,
+                "args": {**_jsonable(span.attributes), "status": span.status, "span_id": span.span_id},
+            }
+            for span in trace.spans
+        ]
+        root = self._root_of(trace)
+        ticker = root.attributes.get("ticker", "unknown") if root else "unknown"
+        path = self.trace_dir / f"{_safe(ticker)}_{trace.trace_id[:12]}.json"
+        path.write_text(
+            json.dumps({"traceEvents": events, "displayTimeUnit": "ms"}, ensure_ascii=False), encoding="utf-8"
+        )
+        print(f"🧵 Trace written: {path} ({len(events)} spans)")
+        return path
+
+    def _export_otlp(self, trace: _Trace) -> Path:
+        spans = []
+        for span in trace.spans:
+            item = {
+                "traceId": span.trace_id,
+                "spanId": span.span_id,
+                "name": span.name,
+                "kind": 1,  # SPAN_KIND_INTERNAL
+                "startTimeUnixNano": str(span.start_ns),
+                "endTimeUnixNano": str(span.end_ns),
+                "attributes": [_otlp_attribute("agent.span_kind", span.kind)]
+                + [_otlp_attribute(k, v) for k, v in _jsonable(span.attributes).items()],
+                "status": {"code": 2 if span.status == "error" else 1},
+            }
+            if span.parent_id:
+                item["parentSpanId"] = span.parent_id
+            spans.append(item)
+
+        payload = {"resourceSpans": [{
+            "resource": {"attributes": [
+                _otlp_attribute("service.name", "adk-azure-agent"),
+                _otlp_attribute("process.pid", os.getpid()),
+            ]},
+            "scopeSpans": [{"scope": {"name": "my_agent.tracing"}, "spans": spans}],
+        }]}
+        path = self.trace_dir / "traces.otlp.jsonl"
+        with open(path, "a", encoding="utf-8") as f:
+            f.write(json.dumps(payload, ensure_ascii=False) + "\n")
+        return path
+
+    @staticmethod
+    def _root_of(trace: _Trace) -> Optional[Span]:
+        return next((s for s in trace.spans if s.parent_id is None), None)
+
+
+def _safe(name: str) -> str:
+    return "".join(c if c.isalnum() or c in ".-_" else "_" for c in str(name))
+
+
+def _jsonable(attributes: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        k: v if isinstance(v, (str, int, float, bool)) else json.dumps(v, ensure_ascii=False, default=str)
+        for k, v in attributes.items()
+    }
+
+
+def _otlp_attribute(key: str, value: Any) -> Dict[str, Any]:
+    if isinstance(value, bool):
+        typed = {"boolValue": value}
+    elif isinstance(value, int):
+        typed = {"intValue": str(value)}
+    elif isinstance(value, float):
+        typed = {"doubleValue": value}
+    else:
+        typed = {"stringValue": str(value)}
+    return {"key": key, "value": typed}
+
+
+# 全域 tracer 實例
+_tracer = None
+
+
+def get_tracer() -> Tracer:
+    """取得全域 Tracer (依環境變數設定)"""
+    global _tracer
+    if _tracer is None:
+        _tracer = Tracer(
+            export_format=(os.getenv("AGENT_TRACE") or "").lower() or None,
+            trace_dir=os.getenv("AGENT_TRACE_DIR") or None,
+        )
+    return _tracer
+
+
+# ============================================================================
+# ADK Agent Callbacks
+# ============================================================================
+
+def trace_before_agent(callback_context):
+    """before_agent_callback：開始 agent span (沒有上層 span 時先開始 turn span)"""
+    tracer = get_tracer()
+    if not tracer.enabled:
+        return None
+    if _current_span.get() is None:
+        tracer.start_span("turn", "turn", invocation_id=callback_context.invocation_id)
+    tracer.start_span(callback_context.agent_name, "agent", invocation_id=callback_context.invocation_id)
+    return None
+
+
+def trace_after_agent(callback_context):
+    """after_agent_callback：結束 agent span；回到 turn span 時一併結束回合並匯出"""
+    tracer = get_tracer()
+    span = _current_span.get()
+    if not tracer.enabled or span is None or span.kind != "agent":
+        return None
+    tracer.end_span(span)
+    parent = _current_span.get()
+    if parent is not None and parent.kind == "turn":
+        tracer.end_span(parent)
+    return None
+
+
+def trace_before_tool(tool, args, tool_context):
+    """before_tool_callback：開始 tool span (MCP 與本地函式工具)"""
+    tracer = get_tracer()
+    if not tracer.enabled:
+        return None
+    attributes = {"tool.call_id": getattr(tool_context, "function_call_id", None)}
+    ticker = args.get("ticker") or args.get("symbol")
+    if isinstance(ticker, str):
+        attributes["ticker"] = ticker
+    if tool.name == "transfer_to_agent":
+        attributes["transfer.target"] = args.get("agent_name")
+    tracer.start_span(tool.name, "tool", **attributes)
+    if "ticker" in attributes:
+        tracer.annotate(ticker=attributes["ticker"])
+    return None
+
+
+def trace_after_tool(tool, args, tool_context, tool_response):
+    """after_tool_callback：結束 tool span"""
+    tracer = get_tracer()
+    span = _current_span.get()
+    if not tracer.enabled or span is None or span.kind != "tool":
+        return None
+    is_error = isinstance(tool_response, dict) and (tool_response.get("isError") or "error" in tool_response)
+    tracer.end_span(span, status="error" if is_error else None)
+    return None
+
+
+def trace_before_model(callback_context, llm_request):
+    """before_model_callback：開始 llm span (不設為目前 span，避免影響平行工具的父子關係)"""
+    tracer = get_tracer()
+    if not tracer.enabled:
+        return None
+    span = tracer.start_span(
+        f"llm {callback_context.agent_name}", "llm", activate=False,
+        model=getattr(llm_request, "model", None), agent=callback_context.agent_name,
+    )
+    if span is not None:
+        tracer._open_llm[(callback_context.invocation_id, callback_context.agent_name)] = span
+    return None
+
+
+def trace_after_model(callback_context, llm_response):
+    """after_model_callback：結束 llm span 並記錄 Token 數"""
+    tracer = get_tracer()
+    if not tracer.enabled or getattr(llm_response, "partial", False):
+        return None
+    span = tracer._open_llm.pop((callback_context.invocation_id, callback_context.agent_name), None)
+    usage = getattr(llm_response, "usage_metadata", None)
+    tracer.end_span(
+        span,
+        status="error" if getattr(llm_response, "error_code", None) else None,
+        prompt_tokens=getattr(usage, "prompt_token_count", None),
+        completion_tokens=getattr(usage, "candidates_token_count", None),
+        cached_tokens=getattr(usage, "cached_content_token_count", None),
+    )
+    return None
@@ -1,7 +1,11 @@
 import json
 import os
+import time
+import asyncio
 import datetime
 import logging
+import textwrap
+from concurrent.futures import ThreadPoolExecutor
 
 from google.adk.agents.llm_agent import Agent
 from google.adk.models.lite_llm import LiteLlm
@@ -14,6 +18,24 @@ from google.genai import types
 
 from .tools.instruction_reader import instruction_reader_tool
 from .tools.yahoo_finance_tool import yahoo_finance_tool
+from .llm_ledger import get_llm_ledger, LlmCallTimer, prompt_prefix_hash, resolve_served_model
+from .llm_response_cache import get_llm_response_cache
+from .model_router import get_model_for_role
+from .tool_invoker import invoke_mcp_tool, McpToolNotFound
+from .llm_scheduler import (
+    get_llm_scheduler, estimate_tokens, is_rate_limit_error,
+    schedule_before_model, schedule_after_model, schedule_on_model_error,
+)
+from .metrics import get_metrics, metrics_before_model, metrics_after_model, metrics_on_model_error
+from .profiling import profile_section
+from .loop_watchdog import attribute_activity
+from .tracing import (
+    trace_before_agent, trace_after_agent, trace_before_tool, trace_after_tool, trace_before_model, trace_after_model,
+)
+from .pipeline_events import (
+    PipelineEvent, PipelineStreamingAgent, emit_progress, stream_progress,
+    STAGE_STARTED, STAGE_FINISHED, VALIDATION_ATTEMPT, VALIDATION_RESULT, SECTION_READY,
+)
 
 # 設定 Logger
 logger = logging.getLogger("stock_agent")
@@ -130,7 +152,7 @@ def reload_agent():
     
     # 重新創建 Agent
     root_agent = Agent(
-        model=LiteLlm(model="azure/gpt-4o"),
+        model=get_model_for_role("orchestrator"),
         name="stock_analyst",
         description="""
         您是一位專業的投資分析師。
@@ -564,7 +586,7 @@ def reload_agent():
     
     # 重新創建 Agent
     root_agent = Agent(
-        model=LiteLlm(model="azure/gpt-4o"),
+        model=get_model_for_role("orchestrator"),
         name="stock_analyst",
         description="""
         您是一位專業的投資分析師。
@@ -595,7 +617,7 @@ def reload_agent():
 # Agent Factory & Pipeline Execution (New Architecture)
 # ============================================================================
 
-from typing import TypedDict, List, Optional
+from typing import TypedDict, List, Optional, AsyncGenerator, Callable
 
 class AnalysisContext(TypedDict):
     """分析上下文：在流水線各階段間傳遞的狀態"""
@@ -649,7 +671,8 @@ def create_stage_agent(
     instruction_files: List[str],
     description_override: str = "",
     tools: List[any] = None,
-    include_base_instructions: bool = True
+    include_base_instructions: bool = True,
+    role: str = "writer"
 ) -> Agent:
     """
     Agent Factory: 創建特定階段專用的輕量級 Agent
@@ -660,6 +683,7 @@ def create_stage_agent(
         description_override: 該 Agent 的專屬角色說明
         tools: 該 Agent 可使用的工具列表
         include_base_instructions: 是否包含 agent_execution.md (預設 True)
+        role: 模型路由角色 (writer / validator / corrector / planner)，對應 model_routing.json
     """
     logger.info("🏭 Creating Agent for " + stage_name + "...")
     
@@ -677,13 +701,20 @@ def create_stage_agent(
                 base_instructions.append(content)
             
     # 2. 階段特定指令
+    # [Prompt Cache] 依解析後的檔名排序並去重，讓共用的指令 (如 01_core_principles)
+    # 在每個 Agent 的 System Prompt 中都位於相同位置，形成可被 Azure OpenAI 快取的共同前綴
+    resolved_paths = []
     for fname in instruction_files:
         if not fname.endswith(".md"): 
             fname += ".md"
             
         # [Fix] 使用動態解析，不再寫死版本號
         fpath = resolve_instruction_file(instruction_dir, fname)
-        
+        if fpath not in resolved_paths:
+            resolved_paths.append(fpath)
+
+    for fpath in sorted(resolved_paths, key=os.path.basename):
+        fname = os.path.basename(fpath)
         if os.path.exists(fpath):
             with open(fpath, "r", encoding="utf-8") as f:
                 content = f.read()
@@ -696,7 +727,7 @@ def create_stage_agent(
     
     # 3. 創建 Agent
     return Agent(
-        model=LiteLlm(model="azure/gpt-4o"),
+        model=get_model_for_role(role),
         name=f"stock_analyst_{stage_name.replace(' ', '_')}",
         description=description_override or "您是專業的股票分析師，請專注於當前的分析階段。",
         tools=tools or [],
@@ -705,13 +736,38 @@ def create_stage_agent(
     )
 
 
-async def _execute_agent_and_get_text(agent: Agent, prompt: str, parent_context=None) -> str:
+@attribute_activity(lambda agent, *args, **kwargs: f"llm {agent.name}")
+async def _execute_agent_and_get_text(
+    agent: Agent,
+    prompt: str,
+    parent_context=None,
+    stage: str = None,
+    attempt: int = 1,
+    stop_when: Optional[Callable[[str], bool]] = None,
+    max_output_tokens: int = 8192
+) -> str:
     """
     Helper function to execute an Agent's logic using its underlying model.
     We bypass `agent.run_async` because it is strictly tied to the framework's Event/Session loop
     and doesn't allow easy injection of new prompts for sub-tasks (Stage 1/2/3).
+
+    每次呼叫都會寫入 LLM Ledger (stage / attempt / tokens / TTFT / duration)，
+    若開啟 LLM_CACHE_MODE，相同輸入會直接使用磁碟快取的回覆。
+
+    Args:
+        stop_when: 串流模式的停止條件，傳入目前累積的文字，回傳 True 時立即中止生成
+                   (例如 QA 判定在開頭出現 PASS 即可結束，不必等待後續說明)
+        max_output_tokens: 輸出 Token 上限
     """
     response_text = ""
+    usage_metadata = None
+    prefix_hash = None
+    cache_key = None
+    stopped_early = False
+    timer = LlmCallTimer()
+    model_name = getattr(agent.model, 'model', "azure/gpt-4o")
+    acquired_tokens = None  # 排程器已扣除的 TPM 估計值，結束時需對帳
+    served_model = None  # 回覆中實際服務的模型 (fallback 接手時與 model_name 不同)
     try:
         # Construct messages manually
         # ADK LiteLlm uses LlmRequest logic
@@ -719,14 +775,16 @@ async def _execute_agent_and_get_text(agent: Agent, prompt: str, parent_context=
         
         contents = []
         
-        # Combine Description (Agent Persona + Date) and Static Instructions
+        # Combine Static Instructions and Description (Agent Persona)
+        # [Prompt Cache] 長且共用的 static_instruction 放最前面，較短的角色說明放後面，
+        # 日期等每次不同的內容只能出現在 user prompt 的結尾，確保前綴在多次呼叫間完全一致
         full_system_prompt = ""
-        if agent.description:
-            full_system_prompt += f"{agent.description}\n\n"
-        
         if agent.static_instruction:
             full_system_prompt += agent.static_instruction
 
+        if agent.description:
+            full_system_prompt += f"\n\n---\n\n{agent.description}" if full_system_prompt else agent.description
+
         if full_system_prompt:
             # logger.info(f"🐛 [DEBUG] System Prompt for {agent.name}:\n{full_system_prompt}\n" + "="*50)
             
@@ -739,6 +797,7 @@ async def _execute_agent_and_get_text(agent: Agent, prompt: str, parent_context=
             except Exception as e:
                 logger.error(f"Failed to write debug file: {e}")
 
+            prefix_hash = prompt_prefix_hash(full_system_prompt)
             contents.append({
                 "role": "system",
                 "parts": [{"text": full_system_prompt}]
@@ -749,6 +808,32 @@ async def _execute_agent_and_get_text(agent: Agent, prompt: str, parent_context=
             "parts": [{"text": prompt}]
         })
         
+        # [LLM Cache] 相同 model + system prompt + user prompt 直接回傳快取結果 (需以 LLM_CACHE_MODE 開啟)
+        response_cache = get_llm_response_cache()
+        cache_key = None
+        if response_cache.enabled:
+            # 提前中止的回覆可能被截斷，需與完整回覆分開存放
+            variant = getattr(stop_when, '__name__', 'stop_when') if stop_when else ""
+            cache_key = response_cache.make_key(model_name, full_system_prompt, prompt, variant=variant)
+            cached_text = response_cache.get(cache_key)
+            get_metrics().observe_cache("llm_response", cached_text is not None)
+            if cached_text is not None:
+                logger.info(f"💾 LLM cache hit for {agent.name} (key: {cache_key[:12]})")
+                get_llm_ledger().record(
+                    agent_name=agent.name, model=model_name, stage=stage, attempt=attempt,
+                    duration_ms=timer.elapsed_ms, prompt_prefix_hash=prefix_hash, cache_hit=True
+                )
+                return cached_text
+
+        # [Scheduler] 依 RPM / TPM 額度排隊 (需以 AZURE_OPENAI_RPM / AZURE_OPENAI_TPM 開啟)
+        scheduler = get_llm_scheduler()
+        estimated_tokens = estimate_tokens(full_system_prompt) + estimate_tokens(prompt) + max_output_tokens
+        wait_ms = await scheduler.acquire(estimated_tokens)
+        acquired_tokens = estimated_tokens
+        if wait_ms > 1000:
+            logger.info(f"⏳ {agent.name} waited {wait_ms / 1000:.1f}s in LLM scheduler queue (depth: {scheduler.queue_depth})")
+        timer = LlmCallTimer()  # 排隊時間不計入 TTFT / duration
+
         logger.info(f"⚡️ Executing {agent.name} via direct model call (Prompt len: {len(prompt)})")
         
         model = agent.model
@@ -760,17 +845,23 @@ async def _execute_agent_and_get_text(agent: Agent, prompt: str, parent_context=
              request = LlmRequest(
                  model=getattr(model, 'model', "azure/gpt-4o"),
                  contents=contents,
-                 config=types.GenerateContentConfig(max_output_tokens=8192)
+                 config=types.GenerateContentConfig(max_output_tokens=max_output_tokens)
              )
              
-             async for response in model.generate_content_async(request):
+             # 有停止條件時改用串流，才能在判定出現的當下中止生成
+             streaming = stop_when is not None
+             response_stream = model.generate_content_async(request, stream=streaming)
+             async for response in response_stream:
                  # response is LlmResponse
                  chunk_text = ""
                  
+                 served_model = getattr(response, 'model_version', None) or served_model
+
                  # Capture Token Usage
                  if hasattr(response, 'usage_metadata') and response.usage_metadata:
                      token_info = response.usage_metadata
-                     logger.info(f"📊 [Token Usage] Agent: {agent.name} | Input: {getattr(token_info, 'prompt_token_count', 'N/A')} | Output: {getattr(token_info, 'candidates_token_count', 'N/A')} | Total: {getattr(token_info, 'total_token_count', 'N/A')}")
+                     usage_metadata = token_info
+                     logger.info(f"📊 [Token Usage] Agent: {agent.name} | Input: {getattr(token_info, 'prompt_token_count', 'N/A')} | Cached: {getattr(token_info, 'cached_content_token_count', None) or 0} | Output: {getattr(token_info, 'candidates_token_count', 'N/A')} | Total: {getattr(token_info, 'total_token_count', 'N/A')}")
                  
                  # Check content/text fields
                  val = None
@@ -801,7 +892,21 @@ async def _execute_agent_and_get_text(agent: Agent, prompt: str, parent_context=
                               chunk_text = parts[0]['text']
 
                  if chunk_text:
-                     response_text += chunk_text
+                     timer.mark_first_token()
+                     if streaming and not getattr(response, 'partial', False):
+                         # 串流結束時的彙整回覆已包含完整文字
+                         response_text = chunk_text
+                     else:
+                         response_text += chunk_text
+
+                 if stop_when is not None and response_text and stop_when(response_text):
+                     stopped_early = True
+                     logger.info(f"⏹️ Early exit for {agent.name} after {len(response_text)} chars")
+                     break
+
+             if stopped_early:
+                 # 關閉串流以取消剩餘的生成
+                 await response_stream.aclose()
 
         # Fallback to completion (if somehow generate_content_async is missing but completion exists)
         elif hasattr(model, 'completion'): 
@@ -818,10 +923,31 @@ async def _execute_agent_and_get_text(agent: Agent, prompt: str, parent_context=
              
     except Exception as e:
         logger.error(f"❌ Error executing agent model: {e}")
+        if is_rate_limit_error(e):
+            get_llm_scheduler().report_rate_limited()
+        record = get_llm_ledger().record(
+            agent_name=agent.name, model=resolve_served_model(model_name, served_model), usage_metadata=usage_metadata,
+            stage=stage, attempt=attempt, ttft_ms=timer.ttft_ms, duration_ms=timer.elapsed_ms,
+            prompt_prefix_hash=prefix_hash, success=False, error=str(e)
+        )
+        if acquired_tokens is not None:
+            # 失敗 / 逾時的呼叫只保留實際回報的用量 (通常為 0)，退回其餘的 TPM 估計值
+            get_llm_scheduler().record_usage(acquired_tokens, record.prompt_tokens + record.completion_tokens)
         import traceback
         traceback.print_exc()
         raise e
-        
+
+    # 提前中止的串流在 usage_metadata 送達前就結束，改以 Prompt 與已產生的文字估計用量
+    estimated_usage = (estimate_tokens(full_system_prompt) + estimate_tokens(prompt), estimate_tokens(response_text))
+    # 成本依實際服務的部署計算 (LiteLLM fallback 接手時不是主要部署)
+    record = get_llm_ledger().record(
+        agent_name=agent.name, model=resolve_served_model(model_name, served_model), usage_metadata=usage_metadata,
+        stage=stage, attempt=attempt, ttft_ms=timer.ttft_ms, duration_ms=timer.elapsed_ms,
+        prompt_prefix_hash=prefix_hash, stopped_early=stopped_early, estimated_usage=estimated_usage
+    )
+    get_llm_scheduler().record_usage(estimated_tokens, record.prompt_tokens + record.completion_tokens)
+    if cache_key:
+        response_cache.put(cache_key, response_text, {"model": model_name, "agent": agent.name, "stage": stage})
     return response_text
 def _validate_stage_0_json(data: dict) -> Tuple[bool, str]:
     """
@@ -863,6 +989,7 @@ def _validate_stage_0_json(data: dict) -> Tuple[bool, str]:
         
     return True, "PASS"
 
+@attribute_activity("Stage 0")
 async def _run_stage_0(user_request: str, tool_context=None) -> AnalysisContext:
     """Stage 0: 分析準備 (Context Gathering)"""
     logger.info("🚀 Starting Stage 0: Context Gathering")
@@ -872,11 +999,12 @@ async def _run_stage_0(user_request: str, tool_context=None) -> AnalysisContext:
     
     agent = create_stage_agent(
         stage_name="stage_0_context",
+        role="planner",
         instruction_files=["00_stage_0_instruction.md", "02_data_source_selection.md", "03_analysis_framework_selector.md"],
         include_base_instructions=False, # ❌ 禁止載入 agent_execution.md，避免污染 Prompt
-        description_override=f"""
+        description_override="""
         您是分析流程的指揮官 (Stage 0)。
-        **當前系統日期**：{datetime.datetime.now().strftime('%Y-%m-%d')} (以此為基準設定所有日期)
+        **當前系統日期**：請以用戶訊息最後附上的「當前系統日期」為基準設定所有日期。
         
         任務：
         1. 解析用戶需求。
@@ -911,11 +1039,15 @@ async def _run_stage_0(user_request: str, tool_context=None) -> AnalysisContext:
     
     MAX_RETRIES = 3
     last_error = ""
-    current_prompt = user_request
+    # [Prompt Cache] 日期屬於每次不同的內容，附加在 user prompt 最後
+    runtime_context = f"\n\n**當前系統日期**：{datetime.datetime.now().strftime('%Y-%m-%d')} (以此為基準設定所有日期)"
+    current_prompt = user_request + runtime_context
 
     for i in range(MAX_RETRIES):
         logger.info(f"🤖 Stage 0 Agent Executing (Attempt {i+1}/{MAX_RETRIES})...")
-        response_text = await _execute_agent_and_get_text(agent, current_prompt, parent_context=tool_context)
+        response_text = await _execute_agent_and_get_text(
+            agent, current_prompt, parent_context=tool_context, stage="stage_0", attempt=i + 1
+        )
         
         try:
             # JSON 解析
@@ -961,10 +1093,69 @@ async def _run_stage_0(user_request: str, tool_context=None) -> AnalysisContext:
             last_error = str(e)
         
     # Retry with feedback
-    current_prompt = f"{user_request}\n\n⚠️ 上一次輸出有誤，請修正:\n{last_error}\n\n請務必輸出合法的 JSON，並符合所有格式要求。"
+    current_prompt = f"{user_request}\n\n⚠️ 上一次輸出有誤，請修正:\n{last_error}\n\n請務必輸出合法的 JSON，並符合所有格式要求。{runtime_context}"
     
     raise ValueError(f"Stage 0 failed after {MAX_RETRIES} attempts. Last error: {last_error}")
 
+def _parse_validation_verdict(text: str) -> Optional[str]:
+    """取出 QA 回覆開頭的判定 (PASS / FAIL)，尚未出現或無法判斷時回傳 None"""
+    head = text.strip().lstrip("*#`\"'「 ").upper()
+    if head.startswith("PASS"):
+        return "PASS"
+    if head.startswith("FAIL"):
+        return "FAIL"
+    return None
+
+
+def _stop_on_pass(text: str) -> bool:
+    """開頭為 PASS 即可停止；FAIL 需要完整原因供 Corrector 修正"""
+    return _parse_validation_verdict(text) == "PASS"
+
+
+def _stop_on_verdict(text: str) -> bool:
+    """最後一次驗證後不再修正，只需要判定本身"""
+    return _parse_validation_verdict(text) is not None
+
+
+_VALIDATION_PROMPT = textwrap.dedent("""\
+    請針對以下內容執行 `{criteria_file}` 中的檢查項目，並判斷是否符合規範。
+    如果完全符合，請只回答 "PASS"。
+    如果有任何不符合之處，請回答 "FAIL: [失敗原因]"，並列出具體修改建議。
+
+    [Content Start]
+    {current_content}
+    [Content End]
+
+    **當前系統日期**：{today}
+    (請務必檢查報告中的日期是否為今日或合理的近期日期)
+    """)
+
+_REWRITE_PROMPT = textwrap.dedent("""\
+    請根據 QA 檢查員指出的問題，**修正並重寫** 完整的內容。
+    請直接輸出修正後的完整 Markdown，不要解釋。
+
+    原內容如下：
+    {current_content}
+
+    QA 檢查員指出以下問題：
+    {validation_result}
+    """)
+
+
+def _build_validation_prompt(criteria_file: str, current_content: str) -> str:
+    """驗證 Prompt：固定的判定規則在前，待檢查內容其次，每天不同的日期放在最後"""
+    return _VALIDATION_PROMPT.format(
+        criteria_file=criteria_file,
+        current_content=current_content,
+        today=datetime.datetime.now().strftime('%Y-%m-%d'),
+    )
+
+
+def _build_rewrite_prompt(current_content: str, validation_result: str) -> str:
+    return _REWRITE_PROMPT.format(current_content=current_content, validation_result=validation_result)
+
+
+@attribute_activity(lambda stage_name, *args, **kwargs: f"{stage_name} validate")
 async def _validate_and_rewrite(stage_name: str, content: str, criteria_file: str, tool_context=None) -> Tuple[bool, str]:
     """
     通用驗證邏輯 (Self-Correction Loop)
@@ -979,65 +1170,63 @@ async def _validate_and_rewrite(stage_name: str, content: str, criteria_file: st
     
     for i in range(max_retries + 1):
         logger.info(f"🔍 Validating {stage_name} (Attempt {i+1})...")
+        emit_progress(VALIDATION_ATTEMPT, stage=stage_name, attempt=i + 1)
+
+        with profile_section(f"{stage_name} validate#{i + 1}", ticker=get_llm_ledger().current_ticker()):
+            # 創建一個專門的 Quality Assurance Agent
+            validator = create_stage_agent(
+                stage_name=f"{stage_name}_validator",
+                role="validator",
+                instruction_files=["07_quality_checklist_v3_4_0.md", "01_core_principles.md"],
+                include_base_instructions=False,
+                description_override="你是嚴格的品質檢查員 (QA)。你的任務是根據檢查清單審查內容，並給出通過(PASS)或失敗(FAIL)的判定。"
+            )
         
-        # 創建一個專門的 Quality Assurance Agent
-        validator = create_stage_agent(
-            stage_name=f"{stage_name}_validator",
-            instruction_files=["07_quality_checklist_v3_4_0.md", "01_core_principles.md"],
-            include_base_instructions=False,
-            description_override="你是嚴格的品質檢查員 (QA)。你的任務是根據檢查清單審查內容，並給出通過(PASS)或失敗(FAIL)的判定。"
-        )
-        
-        # 構建驗證 Prompt
-        validation_prompt = f"""
-        請針對以下內容執行 `{criteria_file}` 中的檢查項目：
-
-        **當前系統日期**：{datetime.datetime.now().strftime('%Y-%m-%d')}
-        (請務必檢查報告中的日期是否為今日或合理的近期日期)
-        
-        {current_content}
-        
-        請判斷是否符合規範。
-        如果完全符合，請只回答 "PASS"。
-        如果有任何不符合之處，請回答 "FAIL: [失敗原因]"，並列出具體修改建議。
-        """
-        
-        
+            # 構建驗證 Prompt
+            # [Prompt Cache] 固定的判定規則在前，待檢查內容其次，日期等每次不同的內容放在最後
+            validation_prompt = _build_validation_prompt(criteria_file, current_content)
         
+            # 調用 QA Agent
+            # [Early Exit] 串流讀取判定：PASS 立即結束；FAIL 的原因長度以 max_output_tokens 限制
+            validation_result = await _execute_agent_and_get_text(
+                validator, validation_prompt, parent_context=tool_context,
+                stage=f"{stage_name}_validator", attempt=i + 1,
+                stop_when=_stop_on_verdict if i == max_retries else _stop_on_pass,
+                max_output_tokens=1024
+            )
         
-        # 調用 QA Agent
-        validation_result = await _execute_agent_and_get_text(validator, validation_prompt, parent_context=tool_context)
+            verdict = _parse_validation_verdict(validation_result)
+            if verdict is None:
+                # 判定未出現在開頭時退回舊的寬鬆判斷
+                verdict = "PASS" if "PASS" in validation_result and "FAIL" not in validation_result else "FAIL"
         
-        if "PASS" in validation_result:
-            logger.info(f"✅ {stage_name} Passed Validation.")
-            return True, current_content
-        else:
-            logger.warning(f"❌ {stage_name} Validation Failed: {validation_result}")
-            if i < max_retries:
-                logger.info(f"🔄 Attempting Self-Correction for {stage_name}...")
+            if verdict == "PASS":
+                logger.info(f"✅ {stage_name} Passed Validation.")
+                emit_progress(VALIDATION_RESULT, stage=stage_name, attempt=i + 1, message="PASS")
+                return True, current_content
+            else:
+                logger.warning(f"❌ {stage_name} Validation Failed: {validation_result}")
+                emit_progress(VALIDATION_RESULT, stage=stage_name, attempt=i + 1, message="FAIL，進行修正")
+                if i < max_retries:
+                    logger.info(f"🔄 Attempting Self-Correction for {stage_name}...")
                 
-                # 創建修正者 Agent (Corrector)
-                corrector = create_stage_agent(
-                   stage_name=f"{stage_name}_corrector",
-                   instruction_files=[criteria_file, "01_core_principles.md"], # 讓他讀這個規則來改
-                   include_base_instructions=False,
-                   description_override="您是內容修訂員。請根據 QA 檢查員的並改進內容。",
-                   tools=[yahoo_finance_tool] # 修正時可能需要補查資料
-                )
-
-                rewrite_prompt = f"""
-                原內容如下：
-                {current_content}
-
-                QA 檢查員指出以下問題：
-                {validation_result}
+                    # 創建修正者 Agent (Corrector)
+                    corrector = create_stage_agent(
+                       stage_name=f"{stage_name}_corrector",
+                       role="corrector",
+                       instruction_files=[criteria_file, "01_core_principles.md"], # 讓他讀這個規則來改
+                       include_base_instructions=False,
+                       description_override="您是內容修訂員。請根據 QA 檢查員的並改進內容。",
+                       tools=[yahoo_finance_tool] # 修正時可能需要補查資料
+                    )
 
-                請根據以上問題，**修正並重寫** 完整的內容。
-                請直接輸出修正後的完整 Markdown，不要解釋。
-                """
+                    rewrite_prompt = _build_rewrite_prompt(current_content, validation_result)
                 
-                # 更新 current_content
-                current_content = await _execute_agent_and_get_text(corrector, rewrite_prompt, parent_context=tool_context)
+                    # 更新 current_content
+                    current_content = await _execute_agent_and_get_text(
+                        corrector, rewrite_prompt, parent_context=tool_context,
+                        stage=f"{stage_name}_corrector", attempt=i + 1
+                    )
                 
     # Loop exhausted
     logger.warning(f"⚠️ {stage_name} failed validation after {max_retries} attempts.")
@@ -1047,6 +1236,118 @@ async def _validate_and_rewrite(stage_name: str, content: str, criteria_file: st
 # Stage 0.5: Mandatory Data Collection (Tool Usage Enforcement)
 # ============================================================================
 
+# Stage 0.5 以固定大小的 Thread Pool 執行 yfinance 等同步阻塞呼叫，避免卡住 Event Loop
+_DATA_COLLECTION_EXECUTOR = ThreadPoolExecutor(
+    max_workers=int(os.getenv("STAGE_0_5_MAX_WORKERS", "4")),
+    thread_name_prefix="stage_0_5"
+)
+# 各資料源的逾時 (秒)
+STAGE_0_5_TIMEOUTS = {
+    "yahoo_profile": float(os.getenv("STAGE_0_5_PROFILE_TIMEOUT", "30")),
+    "financial_statements": float(os.getenv("STAGE_0_5_STATEMENTS_TIMEOUT", "30")),
+    "yahoo_news": float(os.getenv("STAGE_0_5_NEWS_TIMEOUT", "20")),
+    "web_search": float(os.getenv("STAGE_0_5_SEARCH_TIMEOUT", "60")),
+}
+
+
+async def _run_blocking(func, *args):
+    """將同步阻塞呼叫丟到 Stage 0.5 專用的 Thread Pool"""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_DATA_COLLECTION_EXECUTOR, func, *args)
+
+
+async def _collect_source(name: str, coro) -> dict:
+    """執行單一資料源並記錄狀態、耗時 (每個來源有獨立的逾時)"""
+    start = time.perf_counter()
+    result, status, error = None, "SUCCESS", None
+    try:
+        result = await asyncio.wait_for(coro, timeout=STAGE_0_5_TIMEOUTS.get(name, 30))
+    except asyncio.TimeoutError:
+        status, error = "TIMEOUT", f"timed out after {STAGE_0_5_TIMEOUTS.get(name, 30)}s"
+    except Exception as e:
+        status, error = "FAILED", str(e)
+    return {
+        "name": name,
+        "result": result,
+        "status": status,
+        "error": error,
+        "duration_ms": (time.perf_counter() - start) * 1000
+    }
+
+
+def _fetch_stock_profile(ticker: str):
+    """(阻塞) 取得 Yahoo 基本資料；匯入失敗時由 _collect_source 記為 FAILED，流程照常繼續"""
+    from stock.tools.yahoo_finance_tool import get_stock_info
+    return get_stock_info(ticker)
+
+
+def _fetch_financial_statements(ticker: str) -> dict:
+    """(阻塞) 以 yfinance 取得最近 4 季損益表"""
+    import yfinance as yf
+    stmt = yf.Ticker(ticker).quarterly_income_stmt
+    if stmt is None or stmt.empty:
+        return {}
+    recent = stmt.iloc[:, :4]
+    return {
+        str(col.date()) if hasattr(col, 'date') else str(col): {
+            str(k): (None if v != v else float(v)) for k, v in recent[col].items()  # v != v 過濾 NaN
+        }
+        for col in recent.columns
+    }
+
+
+def _fetch_news_headlines(ticker: str, limit: int = 10) -> list:
+    """(阻塞) 以 yfinance 取得最新新聞標題"""
+    import yfinance as yf
+    headlines = []
+    for item in (yf.Ticker(ticker).news or [])[:limit]:
+        content = item.get('content', item)
+        headlines.append({
+            'title': content.get('title'),
+            'publisher': (content.get('provider') or {}).get('displayName') or content.get('publisher'),
+            'published': content.get('pubDate') or content.get('providerPublishTime'),
+        })
+    return headlines
+
+
+# 放入寫作 Prompt 的損益表科目 (yfinance quarterly_income_stmt 的列名)
+_PROMPT_STATEMENT_ROWS = ("Total Revenue", "Gross Profit", "Operating Income", "Net Income", "Diluted EPS")
+
+
+def _format_statements_for_prompt(statements: dict) -> str:
+    """將最近 4 季損益表整理成 Prompt 用的條列 (只保留主要科目)"""
+    if not statements:
+        return "N/A"
+    lines = []
+    for period, rows in statements.items():
+        values = [f"{name}={rows[name]:,.2f}" for name in _PROMPT_STATEMENT_ROWS if rows.get(name) is not None]
+        if values:
+            lines.append(f"    - {period}：{', '.join(values)}")
+    return ("\n" + "\n".join(lines)) if lines else "N/A"
+
+
+def _format_headlines_for_prompt(headlines: list, limit: int = 5) -> str:
+    """將新聞標題整理成 Prompt 用的條列"""
+    lines = [
+        f"    - {item['title']} ({item.get('publisher') or 'N/A'}, {item.get('published') or 'N/A'})"
+        for item in (headlines or [])[:limit] if item.get('title')
+    ]
+    return ("\n" + "\n".join(lines)) if lines else "N/A"
+
+
+async def _search_financial_news(search_query: str, ticker: str = None) -> Optional[str]:
+    """直接呼叫 web_search MCP 工具查詢財報新聞 (不經過 LLM)；工具未載入時回傳 None"""
+    try:
+        results = await invoke_mcp_tool("web_search", {"query": search_query}, ticker=ticker)
+    except McpToolNotFound as e:
+        logger.warning(f"⚠️ {e}")
+        return None
+    if isinstance(results, str):
+        return results
+    return json.dumps(results, ensure_ascii=False, indent=2)
+
+
+@attribute_activity("Stage 0.5")
 async def _run_stage_0_5_data_collection(context: AnalysisContext, tool_context=None) -> dict:
     """
     Stage 0.5: 強制前置數據收集
@@ -1054,24 +1355,23 @@ async def _run_stage_0_5_data_collection(context: AnalysisContext, tool_context=
     根據 Stage 0 的 TOC 規劃，預先收集所有必要的真實數據，
     確保後續寫作階段不會產生幻覺 (Hallucination)。
     
+    Yahoo 基本資料、財務報表、新聞與網路搜尋以 asyncio.gather 同時執行，
+    阻塞的函式庫呼叫交給 Thread Pool，每個來源有獨立逾時。
     所有工具呼叫會記錄到檔案中供驗證，不輸出至 console。
     """
-    import os
-    from datetime import datetime
-    
     # 建立 Log 目錄
     log_dir = os.path.join(os.path.dirname(__file__), ".adk", "data_collection_logs")
     os.makedirs(log_dir, exist_ok=True)
     
     # 建立本次執行的 Log 檔案
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+    timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
     log_file = os.path.join(log_dir, f"data_collection_{context['ticker']}_{timestamp}.log")
     
     def log_tool_call(tool_name: str, source_url: str, raw_data: str, status: str = "SUCCESS"):
         """記錄工具呼叫詳情到檔案"""
         with open(log_file, "a", encoding="utf-8") as f:
             f.write(f"\n{'='*80}\n")
-            f.write(f"[{datetime.now().isoformat()}] Tool Call: {tool_name}\n")
+            f.write(f"[{datetime.datetime.now().isoformat()}] Tool Call: {tool_name}\n")
             f.write(f"Status: {status}\n")
             f.write(f"Source: {source_url}\n")
             f.write(f"Raw Data:\n{raw_data}\n")
@@ -1080,10 +1380,11 @@ async def _run_stage_0_5_data_collection(context: AnalysisContext, tool_context=
     
     ticker = context['ticker']
     toc = context.get('table_of_contents', '')
+    ticker_formatted = f"{ticker}.TW" if not ticker.endswith('.TW') else ticker
+    yahoo_url = f"https://finance.yahoo.com/quote/{ticker_formatted}"
     
     # 記錄查詢時間
-    from datetime import datetime
-    fetch_timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    fetch_timestamp = datetime.datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     
     data_bundle = {
         'log_file': log_file,  # 供後續驗證使用
@@ -1096,43 +1397,81 @@ async def _run_stage_0_5_data_collection(context: AnalysisContext, tool_context=
         'data_sources': []  # 記錄所有資料來源
     }
     
-    # 1. 必定呼叫：基礎股價數據 (Yahoo Finance)
-    try:
-        from stock.tools.yahoo_finance_tool import get_stock_info
-        ticker_formatted = f"{ticker}.TW" if not ticker.endswith('.TW') else ticker
-        
-        raw_response = get_stock_info(ticker_formatted)
+    # ------------------------------------------------------------------
+    # 1. Fan-out：所有資料源同時執行
+    # ------------------------------------------------------------------
+    sources = {
+        "yahoo_profile": _run_blocking(_fetch_stock_profile, ticker_formatted),
+        "financial_statements": _run_blocking(_fetch_financial_statements, ticker_formatted),
+        "yahoo_news": _run_blocking(_fetch_news_headlines, ticker_formatted),
+    }
+    
+    # 條件呼叫：最新財報新聞與券商報告
+    need_search = '估值' in toc or '目標價' in toc or '財務' in toc
+    search_query = f"{context.get('company_name', ticker)} 財報 2025 Q4"
+    if need_search:
+        logger.info(f"📊 Searching for financial news and analyst reports: {search_query}")
+        sources["web_search"] = _search_financial_news(search_query, ticker=ticker_formatted)
+    
+    stage_start = time.perf_counter()
+    results = await asyncio.gather(*[_collect_source(name, coro) for name, coro in sources.items()])
+    collected = {r["name"]: r for r in results}
+    
+    # 記錄關鍵路徑 (最慢的來源決定 Stage 0.5 的總耗時)
+    timings = ", ".join(
+        f"{r['name']}={r['duration_ms'] / 1000:.2f}s ({r['status']})"
+        for r in sorted(results, key=lambda r: -r["duration_ms"])
+    )
+    critical = max(results, key=lambda r: r["duration_ms"])
+    logger.info(
+        f"🧭 Stage 0.5 fan-out finished in {time.perf_counter() - stage_start:.2f}s | "
+        f"critical path: {critical['name']} | {timings}"
+    )
+    
+    # ------------------------------------------------------------------
+    # 2. 基礎股價數據 (Yahoo Finance)
+    # ------------------------------------------------------------------
+    profile = collected["yahoo_profile"]
+    if profile["status"] != "SUCCESS":
         log_tool_call(
-            tool_name="get_stock_info (Yahoo Finance)",
-            source_url=f"https://finance.yahoo.com/quote/{ticker_formatted}",
-            raw_data=raw_response[:2000]  # 限制長度
+            tool_name="get_stock_info",
+            source_url="N/A",
+            raw_data=f"ERROR: {profile['error']}",
+            status="FAILED"
         )
-        
-        # 解析 JSON
-        import json
-        stock_data = json.loads(raw_response) if isinstance(raw_response, str) else raw_response
-        
-        if 'info' in stock_data:
-            info = stock_data['info']
-            
-            # ⚠️ 關鍵驗證：檢查公司名稱是否匹配
-            actual_company_name = info.get('longName', 'Unknown')
-            expected_company_name = context.get('company_name', '')
+    else:
+        try:
+            raw_response = profile["result"]
+            log_tool_call(
+                tool_name="get_stock_info (Yahoo Finance)",
+                source_url=yahoo_url,
+                raw_data=str(raw_response)[:2000]  # 限制長度
+            )
             
-            # 簡單的模糊匹配（檢查是否有共同關鍵字）
-            name_match = False
-            if expected_company_name:
-                # 移除常見後綴進行比對
-                expected_keywords = expected_company_name.replace('股份有限公司', '').replace('有限公司', '').strip()
-                if expected_keywords in actual_company_name or actual_company_name in expected_company_name:
-                    name_match = True
+            # 解析 JSON
+            stock_data = json.loads(raw_response) if isinstance(raw_response, str) else raw_response
             
-            # 記錄驗證結果
-            verification_status = "✅ PASS" if name_match else "❌ FAIL"
-            log_tool_call(
-                tool_name="verify_ticker",
-                source_url=f"https://finance.yahoo.com/quote/{ticker_formatted}",
-                raw_data=f"""
+            if 'info' in stock_data:
+                info = stock_data['info']
+                
+                # ⚠️ 關鍵驗證：檢查公司名稱是否匹配
+                actual_company_name = info.get('longName', 'Unknown')
+                expected_company_name = context.get('company_name', '')
+                
+                # 簡單的模糊匹配（檢查是否有共同關鍵字）
+                name_match = False
+                if expected_company_name:
+                    # 移除常見後綴進行比對
+                    expected_keywords = expected_company_name.replace('股份有限公司', '').replace('有限公司', '').strip()
+                    if expected_keywords in actual_company_name or actual_company_name in expected_company_name:
+                        name_match = True
+                
+                # 記錄驗證結果
+                verification_status = "✅ PASS" if name_match else "❌ FAIL"
+                log_tool_call(
+                    tool_name="verify_ticker",
+                    source_url=yahoo_url,
+                    raw_data=f"""
 Ticker 驗證結果: {verification_status}
 
 預期公司名稱: {expected_company_name}
@@ -1140,116 +1479,114 @@ Ticker 驗證結果: {verification_status}
 Ticker: {ticker_formatted}
 
 {f"⚠️ 警告：公司名稱不匹配！請確認 Ticker 是否正確。" if not name_match else "✓ 驗證通過"}
-                """.strip(),
-                status="PASS" if name_match else "WARNING"
-            )
-            
-            if not name_match:
-                logger.warning(f"⚠️ Ticker 驗證警告：預期 '{expected_company_name}'，實際為 '{actual_company_name}'")
-                data_bundle['ticker_verification'] = f"WARNING: Name mismatch"
-            else:
-                data_bundle['ticker_verification'] = "PASS"
-            
-            # 繼續提取數據
-            data_bundle['current_price'] = info.get('currentPrice', 'N/A')
-            data_bundle['pe_ratio'] = info.get('trailingPE', 'N/A')
-            data_bundle['market_cap'] = info.get('marketCap', 'N/A')
-            
-            # 擴充：提取更多財務數據
-            data_bundle['revenue'] = info.get('totalRevenue', 'N/A')
-            data_bundle['gross_margin'] = info.get('grossMargins', 'N/A')
-            data_bundle['ebitda'] = info.get('ebitda', 'N/A')
-            data_bundle['operating_cash_flow'] = info.get('operatingCashflow', 'N/A')
-            data_bundle['revenue_growth'] = info.get('revenueGrowth', 'N/A')
-            data_bundle['debt_to_equity'] = info.get('debtToEquity', 'N/A')
-            
-            # 記錄完整可用欄位（供驗證）
-            available_keys = list(info.keys())
-            log_tool_call(
-                tool_name="get_stock_info (Available Fields)",
-                source_url=f"https://finance.yahoo.com/quote/{ticker_formatted}",
-                raw_data=f"Available data fields: {', '.join(available_keys[:50])}"  # 前50個欄位
-            )
-            
-            data_bundle['financials'] = stock_data.get('financials', {})
-            
-            # 記錄資料來源
-            data_bundle['data_sources'].append({
-                'name': 'Yahoo Finance',
-                'url': f'https://finance.yahoo.com/quote/{ticker_formatted}',
-                'data_types': ['股價', '市盈率', '市值', '財務數據'],
-                'fetch_time': fetch_timestamp
-            })
-        
-    except Exception as e:
-        log_tool_call(
-            tool_name="get_stock_info",
-            source_url="N/A",
-            raw_data=f"ERROR: {str(e)}",
-            status="FAILED"
-        )
-    
-    # 2. 條件呼叫：最新財報新聞與券商報告
-    if '估值' in toc or '目標價' in toc or '財務' in toc:
-        logger.info("📊 Searching for financial news and analyst reports...")
-        
-        company_name = context.get('company_name', ticker)
-        
-        # 2.1 搜尋最新財報新聞
-        try:
-            search_query = f"{company_name} 財報 2025 Q4"
-            logger.info(f"🔍 Searching: {search_query}")
-            
-            # 載入 MCP 搜尋工具
-            mcp_tools = load_mcp_tools()
-            
-            if mcp_tools:
-                # 建立專用搜尋 Agent
-                search_agent = create_stage_agent(
-                    stage_name="stage_0_5_search",  # 修正：不能有小數點
-                    instruction_files=[],
-                    include_base_instructions=False,
-                    description_override="你是搜尋助手，負責查詢財經新聞。",
-                    tools=mcp_tools
+                    """.strip(),
+                    status="PASS" if name_match else "WARNING"
                 )
                 
-                # 執行搜尋
-                search_prompt = f"請搜尋：{search_query}"
-                search_results = await _execute_agent_and_get_text(search_agent, search_prompt)
+                if not name_match:
+                    logger.warning(f"⚠️ Ticker 驗證警告：預期 '{expected_company_name}'，實際為 '{actual_company_name}'")
+                    data_bundle['ticker_verification'] = f"WARNING: Name mismatch"
+                else:
+                    data_bundle['ticker_verification'] = "PASS"
                 
-                log_tool_call(
-                    tool_name="search_web (Financial News)",
-                    source_url=f"Query: {search_query}",
-                    raw_data=f"Search Results: {search_results[:1000]}",
-                    status="SUCCESS"
-                )
+                # 繼續提取數據
+                data_bundle['current_price'] = info.get('currentPrice', 'N/A')
+                data_bundle['pe_ratio'] = info.get('trailingPE', 'N/A')
+                data_bundle['market_cap'] = info.get('marketCap', 'N/A')
                 
-                data_bundle['financial_news'] = search_results
-            else:
-                data_bundle['financial_news'] = 'N/A (MCP tools not loaded)'
+                # 擴充：提取更多財務數據
+                data_bundle['revenue'] = info.get('totalRevenue', 'N/A')
+                data_bundle['gross_margin'] = info.get('grossMargins', 'N/A')
+                data_bundle['ebitda'] = info.get('ebitda', 'N/A')
+                data_bundle['operating_cash_flow'] = info.get('operatingCashflow', 'N/A')
+                data_bundle['revenue_growth'] = info.get('revenueGrowth', 'N/A')
+                data_bundle['debt_to_equity'] = info.get('debtToEquity', 'N/A')
+                
+                # 記錄完整可用欄位（供驗證）
+                available_keys = list(info.keys())
                 log_tool_call(
-                    tool_name="search_web",
-                    source_url="N/A",
-                    raw_data="MCP tools not available",
-                    status="SKIPPED"
+                    tool_name="get_stock_info (Available Fields)",
+                    source_url=yahoo_url,
+                    raw_data=f"Available data fields: {', '.join(available_keys[:50])}"  # 前50個欄位
                 )
                 
+                data_bundle['financials'] = stock_data.get('financials', {})
+                
+                # 記錄資料來源
+                data_bundle['data_sources'].append({
+                    'name': 'Yahoo Finance',
+                    'url': yahoo_url,
+                    'data_types': ['股價', '市盈率', '市值', '財務數據'],
+                    'fetch_time': fetch_timestamp
+                })
+            
         except Exception as e:
-            logger.warning(f"⚠️ Search failed: {e}")
             log_tool_call(
-                tool_name="search_web",
+                tool_name="get_stock_info",
                 source_url="N/A",
                 raw_data=f"ERROR: {str(e)}",
                 status="FAILED"
             )
+    
+    # ------------------------------------------------------------------
+    # 3. 財務報表與新聞 (Yahoo Finance)
+    # ------------------------------------------------------------------
+    statements = collected["financial_statements"]
+    data_bundle['financial_statements'] = statements["result"] or {}
+    log_tool_call(
+        tool_name="quarterly_income_stmt (Yahoo Finance)",
+        source_url=f"{yahoo_url}/financials",
+        raw_data=json.dumps(statements["result"], ensure_ascii=False)[:2000] if statements["result"] else f"ERROR: {statements['error']}",
+        status=statements["status"]
+    )
+    
+    news = collected["yahoo_news"]
+    data_bundle['news_headlines'] = news["result"] or []
+    log_tool_call(
+        tool_name="news (Yahoo Finance)",
+        source_url=f"{yahoo_url}/news",
+        raw_data=json.dumps(news["result"], ensure_ascii=False)[:2000] if news["result"] else f"ERROR: {news['error']}",
+        status=news["status"]
+    )
+    
+    # ------------------------------------------------------------------
+    # 4. 網路搜尋 (條件呼叫)
+    # ------------------------------------------------------------------
+    if need_search:
+        search = collected["web_search"]
+        if search["status"] == "SUCCESS" and search["result"] is not None:
+            log_tool_call(
+                tool_name="search_web (Financial News)",
+                source_url=f"Query: {search_query}",
+                raw_data=f"Search Results: {search['result'][:1000]}",
+                status="SUCCESS"
+            )
+            data_bundle['financial_news'] = search["result"]
+        elif search["status"] == "SUCCESS":
+            data_bundle['financial_news'] = 'N/A (MCP tools not loaded)'
+            log_tool_call(
+                tool_name="search_web",
+                source_url="N/A",
+                raw_data="MCP tools not available",
+                status="SKIPPED"
+            )
+        else:
+            logger.warning(f"⚠️ Search failed: {search['error']}")
+            log_tool_call(
+                tool_name="search_web",
+                source_url="N/A",
+                raw_data=f"ERROR: {search['error']}",
+                status=search["status"]
+            )
             data_bundle['financial_news'] = 'N/A'
         
-        # 2.2 搜尋券商目標價
+        # 搜尋券商目標價
         data_bundle['analyst_reports'] = "N/A (查無公開券商預測數據)"
     
     logger.info(f"✅ Stage 0.5 Complete. Collected: Price={data_bundle['current_price']}, P/E={data_bundle['pe_ratio']}, Revenue={data_bundle.get('revenue', 'N/A')}")
     return data_bundle
 
+@attribute_activity("Stage 1")
 async def _run_stage_1(context: AnalysisContext, tool_context=None) -> str:
     """Stage 1: 深度分析 (Part A)"""
     logger.info("🚀 Starting Stage 1: Part A Generation")
@@ -1286,6 +1623,9 @@ async def _run_stage_1(context: AnalysisContext, tool_context=None) -> str:
     - 營運現金流 (Operating Cash Flow)：{context.get('real_data', {}).get('operating_cash_flow', 'N/A')}
     - 營收增長率 (Revenue Growth)：{context.get('real_data', {}).get('revenue_growth', 'N/A')}
     - 負債權益比 (Debt-to-Equity)：{context.get('real_data', {}).get('debt_to_equity', 'N/A')}
+    - 近 4 季損益表：{_format_statements_for_prompt(context.get('real_data', {}).get('financial_statements'))}
+    
+    **近期新聞 (Yahoo Finance)**：{_format_headlines_for_prompt(context.get('real_data', {}).get('news_headlines'))}
     
     **分析師數據**：
     - 券商預測：{context.get('real_data', {}).get('analyst_reports', 'N/A (查無數據)')}
@@ -1341,7 +1681,7 @@ async def _run_stage_1(context: AnalysisContext, tool_context=None) -> str:
     
     
     logger.info("🤖 Stage 1 Agent Executing...")
-    part_a_content = await _execute_agent_and_get_text(agent, prompt, parent_context=tool_context)
+    part_a_content = await _execute_agent_and_get_text(agent, prompt, parent_context=tool_context, stage="stage_1")
     
     # 執行品質驗證
     is_valid, validated_content = await _validate_and_rewrite("Part A", part_a_content, "07_quality_checklist_v3_4_0.md", tool_context=tool_context)
@@ -1370,6 +1710,7 @@ async def _run_stage_1(context: AnalysisContext, tool_context=None) -> str:
     
     return validated_content + data_source_footer
 
+@attribute_activity("Stage 2")
 async def _run_stage_2(context: AnalysisContext, part_a_content: str, tool_context=None) -> str:
     """Stage 2: 摘要與表格 (Part B)"""
     logger.info("🚀 Starting Stage 2: Part B Generation")
@@ -1407,7 +1748,7 @@ async def _run_stage_2(context: AnalysisContext, part_a_content: str, tool_conte
     
     
     logger.info("🤖 Stage 2 Agent Executing...")
-    part_b_content = await _execute_agent_and_get_text(agent, prompt, parent_context=tool_context)
+    part_b_content = await _execute_agent_and_get_text(agent, prompt, parent_context=tool_context, stage="stage_2")
     
     # 執行品質驗證
     is_valid, validated_content = await _validate_and_rewrite("Part B", part_b_content, "07_quality_checklist_v3_4_0.md", tool_context=tool_context)
@@ -1421,6 +1762,7 @@ async def _run_stage_2(context: AnalysisContext, part_a_content: str, tool_conte
 
 
     
+@attribute_activity("Stage 3")
 async def _run_stage_3(context: AnalysisContext, tool_context=None) -> str:
     """Stage 3: 附錄與組裝 (Appendix)"""
     logger.info("🚀 Starting Stage 3: Appendix Generation")
@@ -1450,7 +1792,7 @@ async def _run_stage_3(context: AnalysisContext, tool_context=None) -> str:
     
     
     logger.info("🤖 Stage 3 Agent Executing...")
-    appendix_content = await _execute_agent_and_get_text(agent, prompt, parent_context=tool_context)
+    appendix_content = await _execute_agent_and_get_text(agent, prompt, parent_context=tool_context, stage="stage_3")
     
     # 執行品質驗證
     is_valid, validated_content = await _validate_and_rewrite("Appendix", appendix_content, "07_quality_checklist_v3_4_0.md", tool_context=tool_context)
@@ -1462,10 +1804,79 @@ async def _run_stage_3(context: AnalysisContext, tool_context=None) -> str:
         
     return validated_content
 
+def _export_llm_ledger(run_id: str) -> None:
+    """將本次流水線的 LLM 呼叫記錄匯出為 JSONL 與匯總表 (Markdown)"""
+    ledger = get_llm_ledger()
+    records = ledger.filter(run_id=run_id)
+    if not records:
+        return
+
+    ticker = records[-1].ticker
+    log_dir = os.path.join(os.path.dirname(__file__), ".adk", "llm_ledger")
+    try:
+        jsonl_path = ledger.export_jsonl(os.path.join(log_dir, f"llm_calls_{ticker}_{run_id}.jsonl"), run_id=run_id)
+
+        summary = "\n\n".join([
+            f"# LLM Usage Summary ({ticker}, run {run_id})",
+            "## By Stage",
+            ledger.format_summary_table(group_by="stage", run_id=run_id),
+            f"## By Ticker (runs of {ticker} retained in this process)",
+            ledger.format_summary_table(group_by="run_id", ticker=ticker),
+        ])
+        summary_path = os.path.join(log_dir, f"llm_summary_{ticker}_{run_id}.md")
+        with open(summary_path, "w", encoding="utf-8") as f:
+            f.write(summary + "\n")
+
+        logger.info(f"📊 LLM Usage Summary (run {run_id}):\n{ledger.format_summary_table(group_by='stage', run_id=run_id)}")
+        logger.info(f"📝 LLM ledger exported to: {jsonl_path}")
+        if get_llm_response_cache().enabled:
+            logger.info(f"💾 LLM cache stats: {get_llm_response_cache().stats()}")
+        if get_llm_scheduler().enabled:
+            logger.info(f"⏳ LLM scheduler stats: {get_llm_scheduler().stats()}")
+    except Exception as e:
+        logger.error(f"⚠️ Failed to export LLM ledger: {e}")
+
+
 async def run_analysis_pipeline(user_request: str, tool_context=None):
     """
     執行完整分析流水線
     """
+    with get_llm_ledger().run() as run_id:
+        try:
+            return await _run_analysis_pipeline_stages(user_request, tool_context=tool_context)
+        finally:
+            _export_llm_ledger(run_id)
+
+
+def _clean_report_text(text: str) -> str:
+    """
+    [Clean Text Policy] 強制移除所有 Markdown Code Block 標記 (```)
+    先移除語言標記，再移除 backticks，避免留下 stray text
+    """
+    return text.replace("```markdown", "").replace("```json", "").replace("```", "").strip()
+
+
+def _report_header_sections(context: AnalysisContext) -> List[str]:
+    """報告開頭：標題 + 報告資訊，以及目錄"""
+    title = context.get('report_title', f"# {context.get('company_name', 'Unknown')} 分析報告")
+    toc = context.get('table_of_contents', "")
+    header = f"""{title}
+
+報告日期: {context.get('report_date')}
+分析期間: {context.get('analysis_start_date')} - {context.get('analysis_end_date')}
+資料來源: {context.get('data_source')}"""
+    return [header, toc]
+
+
+def _emit_section(stage: str, section: str) -> str:
+    """清理章節內容並立即送出 (串流模式下使用者可先看到已完成的章節)"""
+    section = _clean_report_text(section)
+    emit_progress(SECTION_READY, stage=stage, text=section)
+    return section
+
+
+async def _run_analysis_pipeline_stages(user_request: str, tool_context=None) -> str:
+    """依序執行 Stage 0 ~ 3 並組裝最終報告"""
     logger.info("🔥 Initializing Analysis Pipeline...")
 
     # 清空 debug log
@@ -1475,79 +1886,67 @@ async def run_analysis_pipeline(user_request: str, tool_context=None):
     except:
         pass
     
+    sections = []
     
     # Stage 0
-    context = await _run_stage_0(user_request, tool_context=tool_context)
+    emit_progress(STAGE_STARTED, stage="Stage 0", message="解析需求與規劃報告架構")
+    with profile_section("Stage 0"):
+        context = await _run_stage_0(user_request, tool_context=tool_context)
+    get_llm_ledger().set_ticker(context['ticker'])
     logger.info(f"✅ Stage 0 Complete. Context: {context}")
+    emit_progress(STAGE_FINISHED, stage="Stage 0", message=f"{context['company_name']} ({context['ticker']})")
+    sections.extend(_emit_section("Stage 0", s) for s in _report_header_sections(context))
     
     # Stage 0.5: Mandatory Data Collection
-    real_data = await _run_stage_0_5_data_collection(context, tool_context=tool_context)
+    emit_progress(STAGE_STARTED, stage="Stage 0.5", message="收集真實數據")
+    with profile_section("Stage 0.5", ticker=context['ticker']):
+        real_data = await _run_stage_0_5_data_collection(context, tool_context=tool_context)
     context['real_data'] = real_data
     logger.info(f"✅ Stage 0.5 Complete. Data Log: {real_data.get('log_file')}")
+    emit_progress(STAGE_FINISHED, stage="Stage 0.5")
     
     # [TEST MODE] Skipping Stages 2-3 for Part A Verification
     logger.info("🚧 [TEST MODE] Skipping Stage 2, 3. Using placeholders.")
     
     # Stage 1 (Part A)
-    context['part_a_content'] = await _run_stage_1(context, tool_context=tool_context)
+    emit_progress(STAGE_STARTED, stage="Part A", message="撰寫深度分析報告")
+    with profile_section("Part A", ticker=context['ticker']):
+        context['part_a_content'] = await _run_stage_1(context, tool_context=tool_context)
     # context['part_a_content'] = "### (Part A Skipped for Testing)"
     logger.info("✅ Stage 1 (Part A) Complete.")
+    emit_progress(STAGE_FINISHED, stage="Part A")
+    sections.append(_emit_section("Part A", f"## Part A: 深度分析報告\n\n{context['part_a_content']}"))
     
     # Stage 2 (Part B)
     # context['part_b_content'] = await _run_stage_2(context, context['part_a_content'], tool_context=tool_context)
     context['part_b_content'] = "### (Part B Skipped for Testing)"
     logger.info("✅ Stage 2 (Part B) Skipped.")
+    sections.append(_emit_section("Part B", f"## Part B: 重點摘要表格\n\n{context['part_b_content']}"))
     
     # Stage 3 (Appendix)
     # context['appendix_content'] = await _run_stage_3(context, tool_context=tool_context)
     context['appendix_content'] = "### (Appendix Skipped for Testing)"
     logger.info("✅ Stage 3 (Appendix) Skipped.")
+    sections.append(_emit_section("Appendix", f"## 附錄 (Appendix)\n\n{context['appendix_content']}"))
     
     # Final Assembly
-    logger.info("📦 Assembling Final Report...")
-    
     # 構建包含標題、目錄、各部分內容的完整報告
-    title = context.get('report_title', f"# {context.get('company_name', 'Unknown')} 分析報告")
-    toc = context.get('table_of_contents', "")
-
-    final_report = f"""
-{title}
-
-報告日期: {context.get('report_date')}
-分析期間: {context.get('analysis_start_date')} - {context.get('analysis_end_date')}
-資料來源: {context.get('data_source')}
-
----
-
-{toc}
-
----
-
-## Part A: 深度分析報告
-
-{context['part_a_content']}
-
----
-
-## Part B: 重點摘要表格
-
-{context['part_b_content']}
-
----
-
-## 附錄 (Appendix)
-
-{context['appendix_content']}
-    """
+    logger.info("📦 Assembling Final Report...")
+    final_report = "\n\n---\n\n".join(sections)
     
     logger.info("🎉 Analysis Pipeline Completed Successfully!")
     
-    # [Clean Text Policy] 強制移除所有 Markdown Code Block 標記 (```)
-    # 先移除語言標記，再移除 backticks，避免留下 stray text
-    final_report = final_report.replace("```markdown", "").replace("```json", "").replace("```", "").strip()
-    
     return final_report
 
+
+async def run_analysis_pipeline_stream(user_request: str, tool_context=None) -> AsyncGenerator[PipelineEvent, None]:
+    """
+    串流版本的分析流水線：逐一產出進度事件 (階段開始/結束、驗證次數、已完成章節)，
+    最後一個事件 (PIPELINE_FINISHED) 的 text 為完整報告。
+    """
+    async for event in stream_progress(run_analysis_pipeline, user_request, tool_context=tool_context):
+        yield event
+
 # 將 Pipeline 包裝為工具
 pipeline_tool = FunctionTool(run_analysis_pipeline)
 
@@ -1559,11 +1958,18 @@ pipeline_tool = FunctionTool(run_analysis_pipeline)
 # 並透過 System Prompt 強制它使用這個工具
 
 root_agent = Agent(
-    model=LiteLlm(model="azure/gpt-4o"),
+    model=get_model_for_role("orchestrator"),
     name="stock_analyst",
     description="Stock Analyst Agent",
     # 只提供 Pipeline 工具，強迫 Agent 進入我們的 Python 邏輯
     tools=[pipeline_tool], 
+    before_model_callback=[schedule_before_model, metrics_before_model, trace_before_model],
+    after_model_callback=[schedule_after_model, metrics_after_model, trace_after_model],
+    on_model_error_callback=[schedule_on_model_error, metrics_on_model_error],
+    before_agent_callback=trace_before_agent,
+    after_agent_callback=trace_after_agent,
+    before_tool_callback=trace_before_tool,
+    after_tool_callback=trace_after_tool,
     static_instruction="""
     您是股票分析報告生成器的入口。
     
@@ -1582,6 +1988,17 @@ root_agent = Agent(
     include_contents='none'
 )
 
+# 串流模式：直接執行流水線並將進度與已完成章節即時送到 adk web
+# (FunctionTool 只能在全部完成後一次回傳，長時間執行時使用者看不到任何進度)
+pipeline_stream_agent = PipelineStreamingAgent(
+    name="stock_analyst_stream",
+    description="Stock Analyst Agent (Streaming Pipeline)",
+    pipeline=run_analysis_pipeline_stream,
+)
+
+if os.getenv("PIPELINE_STREAMING", "").lower() in ("1", "true", "yes"):
+    root_agent = pipeline_stream_agent
+
 
 
 # ============================================================================
@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+多行程 Worker Pool - 從本地 SQLite 工作佇列取出 ticker 並產生報告
+
+單一行程受限於一個 Event Loop 與模組層級的共用狀態 (MCP logger、最近 ticker)，
+Worker Pool 啟動多個獨立行程，每個行程擁有自己的 MCP Server 與 Agent 實例。
+共用同一個佇列檔 (--db) 即可跨主機擴充 (網路檔案系統請加 --no-wal)。
+
+使用方式：
+    python worker_pool.py enqueue watchlist.txt
+    python worker_pool.py work --workers 4 --concurrency 2 --output-dir batch_output
+    python worker_pool.py status
+    python worker_pool.py requeue-dead
+"""
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+from pathlib import Path
+
+from dotenv import load_dotenv
+
+load_dotenv(Path(__file__).parent / "my_agent" / ".env")
+
+from my_agent.job_queue import JobQueue
+from my_agent.llm_scheduler import priority_scope
+
+DEFAULT_DB = Path(__file__).parent / "my_agent" / ".adk" / "job_queue.db"
+
+
+# ============================================================================
+# Worker 行程
+# ============================================================================
+
+async def _run_job(queue: JobQueue, job, worker_id: str, agent, args) -> None:
+    """執行一筆工作，期間定期 heartbeat；租約被收回時中止 (佇列操作在 worker thread 執行，不阻塞 Event Loop)"""
+    from my_agent.headless import run_agent_query
+
+    ticker = job.payload["ticker"]
+    query = job.payload.get("query") or args.query_template.format(ticker=ticker)
+
+    task = asyncio.create_task(_with_batch_priority(run_agent_query(agent, query, ticker=ticker, user_id=worker_id)))
+    lease_lost = False
+    start = time.perf_counter()
+    try:
+        while True:
+            done, _ = await asyncio.wait({task}, timeout=args.lease_seconds / 3)
+            if done:
+                break
+            if time.perf_counter() - start > args.timeout:
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                break
+            if not await asyncio.to_thread(queue.heartbeat, job.id, worker_id, args.lease_seconds):
+                lease_lost = True
+                task.cancel()
+                await asyncio.gather(task, return_exceptions=True)
+                break
+
+        if lease_lost:
+            print(f"⚠️ [{worker_id}] Lease lost for job {job.id} ({ticker}), abandoning")
+            return
+
+        result = task.result() if not task.cancelled() else None
+        if result is None:
+            raise TimeoutError(f"timed out after {args.timeout}s")
+        if not result.text.strip():
+            raise RuntimeError("Agent returned empty response")
+
+        output = None
+        if args.output_dir:
+            output = Path(args.output_dir) / f"{ticker}.md"
+            output.write_text(result.text, encoding="utf-8")
+        await asyncio.to_thread(queue.complete, job.id, worker_id, result={
+            "latency_ms": round(result.duration_ms, 1),
+            "session_id": result.session_id,
+            "run_id": result.run_id,
+            "output": str(output) if output else None,
+        })
+        print(f"✅ [{worker_id}] {ticker} done in {result.duration_ms / 1000:.1f}s (job {job.id}, attempt {job.attempts})")
+
+    except Exception as e:
+        try:
+            status = await asyncio.to_thread(queue.fail, job.id, worker_id, str(e))
+        except Exception as fail_error:
+            # 無法記錄失敗時工作維持租約狀態，租約過期後由其他 Worker 重新取得
+            print(f"❌ [{worker_id}] Failed to record failure for job {job.id} ({ticker}): {fail_error}")
+            status = "lease pending expiry"
+        print(f"❌ [{worker_id}] {ticker} failed (job {job.id}, attempt {job.attempts}) -> {status}: {e}")
+
+
+async def _with_batch_priority(coro):
+    with priority_scope("batch"):
+        return await coro
+
+
+async def _worker_loop(worker_id: str, args) -> None:
+    from my_agent.headless import load_agent
+
+    queue = JobQueue(args.db, wal=not args.no_wal, retry_backoff=args.retry_backoff)
+    agent = load_agent(args.agent)  # 每個行程各自建立 Agent 與 MCP Server 連線
+    semaphore = asyncio.Semaphore(args.concurrency)
+    running = set()
+    stopping = asyncio.Event()
+
+    loop = asyncio.get_running_loop()
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        try:
+            loop.add_signal_handler(sig, stopping.set)
+        except NotImplementedError:
+            pass
+
+    print(f"🚀 [{worker_id}] Worker started (pid={os.getpid()}, concurrency={args.concurrency})")
+    while not stopping.is_set():
+        await semaphore.acquire()
+        try:
+            job = await asyncio.to_thread(queue.lease, worker_id, lease_seconds=args.lease_seconds)
+        except Exception as e:
+            print(f"⚠️ [{worker_id}] Lease failed: {e}")
+            job = None
+        if job is None:
+            semaphore.release()
+            if args.drain and not running and not await asyncio.to_thread(queue.has_unfinished):
+                break
+            try:
+                await asyncio.wait_for(stopping.wait(), timeout=args.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            continue
+
+        task = asyncio.create_task(_run_job(queue, job, worker_id, agent, args))
+        running.add(task)
+        task.add_done_callback(lambda t: (running.discard(t), semaphore.release()))
+
+    # 停止取新工作，等待執行中的工作結束 (未完成者租約過期後會由其他 Worker 接手)
+    if running:
+        print(f"⏳ [{worker_id}] Waiting for {len(running)} running job(s)...")
+        await asyncio.gather(*running, return_exceptions=True)
+    queue.close()
+    print(f"👋 [{worker_id}] Worker stopped")
+
+
+def _worker_process(index: int, args) -> None:
+    worker_id = f"{socket.gethostname()}-{os.getpid()}-{index}"
+    if args.output_dir:
+        Path(args.output_dir).mkdir(parents=True, exist_ok=True)
+    asyncio.run(_worker_loop(worker_id, args))
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+def cmd_enqueue(args):
+    queue = JobQueue(args.db, wal=not args.no_wal)
+    added = skipped = 0
+    for line in Path(args.tickers).read_text(encoding="utf-8").splitlines():
+        ticker = line.split("#", 1)[0].strip()
+        if not ticker:
+            continue
+        job_id = queue.enqueue(
+            {"ticker": ticker}, priority=args.priority, max_attempts=args.max_attempts, dedupe_key=ticker
+        )
+        if job_id is None:
+            skipped += 1
+        else:
+            added += 1
+    print(f"📥 Enqueued {added} job(s), skipped {skipped} already queued")
+    print(json.dumps(queue.stats(), ensure_ascii=False))
+
+
+def cmd_work(args):
+    # spawn：每個 Worker 從乾淨的直譯器開始，不繼承父行程的 MCP 連線與 SQLite 連線
+    ctx = multiprocessing.get_context("spawn")
+    processes = [ctx.Process(target=_worker_process, args=(i, args)) for i in range(args.workers)]
+    for p in processes:
+        p.start()
+    try:
+        for p in processes:
+            p.join()
+    except KeyboardInterrupt:
+        for p in processes:
+            p.terminate()
+        for p in processes:
+            p.join()
+    print(json.dumps(JobQueue(args.db, wal=not args.no_wal).stats(), ensure_ascii=False))
+
+
+def cmd_status(args):
+    queue = JobQueue(args.db, wal=not args.no_wal)
+    print(json.dumps(queue.stats(), ensure_ascii=False))
+    for job in queue.dead_letters(limit=args.limit):
+        print(f"  ☠️ job {job.id} {job.payload.get('ticker')} (attempts {job.attempts}): {job.last_error}")
+
+
+def cmd_requeue_dead(args):
+    queue = JobQueue(args.db, wal=not args.no_wal)
+    requeued, skipped = queue.requeue_dead(args.ids or None)
+    print(f"🔁 Requeued {requeued} dead job(s)"
+          + (f", skipped {skipped} already queued under the same dedupe key" if skipped else ""))
+
+
+def main():
+    parser = argparse.ArgumentParser(description="多行程報告產生 Worker Pool")
+    parser.add_argument("--db", default=str(DEFAULT_DB), help="佇列 SQLite 檔路徑")
+    parser.add_argument("--no-wal", action="store_true", help="不使用 WAL (網路檔案系統)")
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p = sub.add_parser("enqueue", help="將 ticker 清單加入佇列")
+    p.add_argument("tickers", help="ticker 清單檔 (每行一個)")
+    p.add_argument("--priority", type=int, default=0, help="優先順序 (數字小者優先)")
+    p.add_argument("--max-attempts", type=int, default=3, help="最多嘗試次數，超過移入 dead-letter")
+    p.set_defaults(func=cmd_enqueue)
+
+    p = sub.add_parser("work", help="啟動 Worker 行程")
+    p.add_argument("--workers", type=int, default=os.cpu_count() or 2, help="Worker 行程數")
+    p.add_argument("--concurrency", type=int, default=2, help="每個 Worker 同時執行的工作數")
+    p.add_argument("--agent", default="my_agent.agent:root_agent", help="Agent 位置 (module:attr)")
+    p.add_argument("--query-template", default="請分析 {ticker}", help="送給 Agent 的輸入樣板")
+    p.add_argument("--lease-seconds", type=float, default=300.0, help="租約長度 (每 1/3 租約 heartbeat 一次)")
+    p.add_argument("--timeout", type=float, default=1800.0, help="單一工作逾時 (秒)")
+    p.add_argument("--retry-backoff", type=float, default=30.0, help="重試間隔基數 (秒，指數成長)")
+    p.add_argument("--poll-interval", type=float, default=5.0, help="佇列為空時的輪詢間隔 (秒)")
+    p.add_argument("--drain", action="store_true", help="佇列清空後自動結束")
+    p.add_argument("--output-dir", default="batch_output", help="報告輸出目錄")
+    p.set_defaults(func=cmd_work)
+
+    p = sub.add_parser("status", help="顯示佇列狀態與 dead-letter")
+    p.add_argument("--limit", type=int, default=20)
+    p.set_defaults(func=cmd_status)
+
+    p = sub.add_parser("requeue-dead", help="重新排入 dead-letter")
+    p.add_argument("ids", nargs="*", type=int, help="工作 id (預設全部)")
+    p.set_defaults(func=cmd_requeue_dead)
+
+    args = parser.parse_args()
+    args.func(args)
+    sys.exit(0)
+
+
+if __name__ == "__main__":
+    main()